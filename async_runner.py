@@ -0,0 +1,153 @@
+import asyncio
+import concurrent.futures
+import logging
+import os
+import threading
+
+import aiohttp
+
+logger = logging.getLogger(__name__)
+
+CANCEL_GRACE = 10  # seconds to wait for a timed-out coroutine to stop
+
+
+class _Call:
+    """Whether a coroutine submitted by `run` has started, and when it has stopped.
+
+    A call abandoned before it started never starts, so nothing it was given
+    is touched after `run` returns.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._started = False
+        self._abandoned = False
+        self.stopped = threading.Event()
+
+    def start(self):
+        with self._lock:
+            self._started = not self._abandoned
+            return self._started
+
+    def abandon(self):
+        """Stop the call from starting; return True if it already has."""
+        with self._lock:
+            self._abandoned = True
+            return self._started
+
+
+class AsyncLoopRunner:
+    """Long-lived asyncio event loop on a dedicated daemon thread.
+
+    Sync code (Flask handlers, work queue jobs) submits coroutines and gets
+    back a `concurrent.futures.Future`, so there is no per-call
+    `asyncio.run`. At most `max_concurrency` coroutines run at once and the
+    rest wait their turn. A shared aiohttp session lives on the loop so
+    connections are reused between calls.
+    """
+
+    def __init__(self, name, max_concurrency=4):
+        self.name = name
+        self._max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._semaphore = None
+        self._session = None
+        self._pid = None
+        self._stats = {'submitted': 0, 'queued': 0, 'in_flight': 0, 'completed': 0, 'failed': 0, 'timeouts': 0}
+
+    def submit(self, coro_fn, *args):
+        """Schedule `coro_fn(*args)` on the loop and return a concurrent Future."""
+        return self._submit(_Call(), coro_fn, *args)
+
+    def _submit(self, call, coro_fn, *args):
+        loop = self._ensure_started()
+        with self._lock:
+            self._stats['submitted'] += 1
+            self._stats['queued'] += 1
+        return asyncio.run_coroutine_threadsafe(self._limited(call, coro_fn, *args), loop)
+
+    def run(self, coro_fn, *args, timeout=None):
+        """Run `coro_fn(*args)` on the loop and wait up to `timeout` seconds for it.
+
+        On timeout the coroutine is cancelled, and this only raises once it
+        has stopped, so the caller may close whatever it passed in (such as
+        an open audio file).
+        """
+        call = _Call()
+        future = self._submit(call, coro_fn, *args)
+        try:
+            return future.result(timeout=timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            if call.abandon() and not call.stopped.wait(CANCEL_GRACE):
+                logger.error("%s did not stop within %d s of being cancelled",
+                             getattr(coro_fn, '__name__', coro_fn), CANCEL_GRACE)
+            with self._lock:
+                self._stats['timeouts'] += 1
+            raise TimeoutError(f"{getattr(coro_fn, '__name__', coro_fn)} did not finish within {timeout}s")
+
+    async def http_session(self):
+        """Shared aiohttp session; call only from coroutines running on this loop."""
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._max_concurrency * 2, keepalive_timeout=60)
+            )
+        return self._session
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['max_concurrency'] = self._max_concurrency
+        return stats
+
+    async def _limited(self, call, coro_fn, *args):
+        started = False
+        try:
+            if not call.start():
+                raise asyncio.CancelledError()  # Abandoned by `run` before it got here
+            async with self._semaphore:
+                with self._lock:
+                    self._stats['queued'] -= 1
+                    self._stats['in_flight'] += 1
+                started = True
+                result = await coro_fn(*args)
+        except BaseException:
+            with self._lock:
+                if started:
+                    self._stats['in_flight'] -= 1
+                else:
+                    self._stats['queued'] -= 1
+                self._stats['failed'] += 1
+            raise
+        finally:
+            call.stopped.set()
+        with self._lock:
+            self._stats['in_flight'] -= 1
+            self._stats['completed'] += 1
+        return result
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return self._loop
+        with self._lock:
+            if self._pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._semaphore = None
+                self._session = None
+                ready = threading.Event()
+                self._thread = threading.Thread(
+                    target=self._run_loop, args=(self._loop, ready), name=f"{self.name}-loop", daemon=True
+                )
+                self._thread.start()
+                ready.wait()
+                self._pid = os.getpid()
+                logger.info("Started event loop %s (max %d concurrent)", self.name, self._max_concurrency)
+            return self._loop
+
+    def _run_loop(self, loop, ready):
+        asyncio.set_event_loop(loop)
+        self._semaphore = asyncio.Semaphore(self._max_concurrency)
+        loop.call_soon(ready.set)
+        loop.run_forever()
@@ -0,0 +1,103 @@
+import argparse
+import logging
+
+from mood_analysis import analyze_mood_from_text
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ANALYSIS_FIELDS = [
+    'mood_score', 'primary_emotion', 'secondary_emotions', 'key_topics',
+    'energy_level', 'action_items', 'follow_up_needed'
+]  # Mood Tracker columns D-J
+DEFAULT_ROWS_PER_WRITE = 10000
+
+
+def write_analysis_ranges(service, spreadsheet_id, data):
+    """Write several ranges in a single values().batchUpdate request."""
+    service.spreadsheets().values().batchUpdate(
+        spreadsheetId=spreadsheet_id,
+        body={'valueInputOption': 'RAW', 'data': data}
+    ).execute()
+    logger.info(f"Wrote {sum(len(item['values']) for item in data)} row(s) in {len(data)} range(s)")
+
+
+def backfill_mood_analysis(rows_per_write=DEFAULT_ROWS_PER_WRITE, dry_run=False, wa_id=None):
+    """Re-score every Mood Tracker transcript and rewrite the analysis columns (D-J).
+
+    Works on the Mood Tracker of the registered user `wa_id`, or of the
+    RECIPIENT_PHONE_NUMBER user if not given.
+
+    Reads the sheet in one request, analyzes every transcript with
+    analyze_mood_from_text, and writes back only the changed rows, grouped into
+    contiguous ranges with at most `rows_per_write` rows per batchUpdate
+    request. Returns the number of rows whose analysis changed.
+    """
+    # Imported here so --help works without credentials
+    from webhook_handler import USERS, default_user, get_google_sheets_service, sheet_range
+
+    user = USERS.get(wa_id) if wa_id else default_user()
+    if user is None:
+        raise ValueError(f"No registered user {wa_id or '(RECIPIENT_PHONE_NUMBER)'}")
+
+    service = get_google_sheets_service()
+    values = service.spreadsheets().values().get(
+        spreadsheetId=user.spreadsheet_id,
+        range=sheet_range(user.mood_sheet, 'A2:J')
+    ).execute().get('values', [])
+
+    # Sheet rows omit trailing empty cells
+    rows = [row + [''] * (10 - len(row)) for row in values]
+    scored = [(number, row) for number, row in enumerate(rows, start=2) if row[2]]
+    analyses = [analyze_mood_from_text(row[2]) for _, row in scored]
+    logger.info(f"Analyzed {len(scored)} transcripts from {user.mood_sheet}")
+
+    changed = []
+    for (number, row), analysis in zip(scored, analyses):
+        new_values = [analysis[field] for field in ANALYSIS_FIELDS]
+        # Cells come back as strings
+        if [str(value) for value in new_values] != row[3:10]:
+            changed.append((number, new_values))
+
+    logger.info(f"{len(changed)} row(s) need new analysis")
+    if dry_run or not changed:
+        return len(changed)
+
+    # Contiguous runs of changed rows become one range each, split so no
+    # range is longer than rows_per_write
+    ranges = []
+    for number, new_values in changed:
+        start, run = ranges[-1] if ranges else (None, None)
+        if run is not None and start + len(run) == number and len(run) < rows_per_write:
+            run.append(new_values)
+        else:
+            ranges.append((number, [new_values]))
+
+    # Pack the ranges into as few batchUpdate requests as the row limit allows
+    batch, batch_rows = [], 0
+    for start, run in ranges:
+        if batch and batch_rows + len(run) > rows_per_write:
+            write_analysis_ranges(service, user.spreadsheet_id, batch)
+            batch, batch_rows = [], 0
+        batch.append({
+            'range': sheet_range(user.mood_sheet, f"D{start}:J{start + len(run) - 1}"),
+            'values': run
+        })
+        batch_rows += len(run)
+    if batch:
+        write_analysis_ranges(service, user.spreadsheet_id, batch)
+
+    return len(changed)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=backfill_mood_analysis.__doc__.splitlines()[0])
+    parser.add_argument('--rows-per-write', type=int, default=DEFAULT_ROWS_PER_WRITE,
+                        help="maximum rows per Sheets batchUpdate request")
+    parser.add_argument('--dry-run', action='store_true', help="only report how many rows would change")
+    parser.add_argument('--wa-id', help="WhatsApp ID of the user to backfill (default: RECIPIENT_PHONE_NUMBER)")
+    args = parser.parse_args()
+
+    changed = backfill_mood_analysis(rows_per_write=args.rows_per_write, dry_run=args.dry_run, wa_id=args.wa_id)
+    logger.info(f"{'Would update' if args.dry_run else 'Updated'} {changed} row(s)")
@@ -0,0 +1,111 @@
+"""Evening status requests: one message at a time vs. one batch per user.
+
+USERS users each get TASKS interactive messages through one OutboundQueue
+talking to a local fake Graph server with a fixed delay. FANOUT threads play
+the scheduler's fan-out workers. Each user's messages are sent either one
+after another with OutboundQueue.send (how send_status_request worked
+before), or together with OutboundQueue.send_batch. Both keep each user's
+messages in order, so one user's messages are never in flight at the same
+time. What cuts the total time is more recipients in flight at once, which
+the last run shows with 3x the outbound workers on a pool sized to match.
+Prints total time, per-user latency and whether every user received their
+messages in order. Run from the repo root:
+
+    python benchmarks/bench_batch_send.py [users] [fanout_threads] [outbound_workers] [server_delay_ms]
+"""
+import json
+import logging
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_client import GraphClient  # noqa: E402
+from outbound_queue import OutboundQueue  # noqa: E402
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+FANOUT = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+WORKERS = int(sys.argv[3]) if len(sys.argv) > 3 else 8
+SERVER_DELAY = (float(sys.argv[4]) if len(sys.argv) > 4 else 30) / 1000
+TASKS = 3
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    received = {}  # recipient -> task headers in arrival order
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(SERVER_DELAY)
+        with FakeGraphHandler.lock:
+            FakeGraphHandler.received.setdefault(payload['to'], []).append(payload['interactive']['header']['text'])
+        body = json.dumps({'messages': [{'id': 'wamid.fake'}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def status_payloads(user):
+    return [
+        {'messaging_product': 'whatsapp', 'to': user, 'type': 'interactive',
+         'interactive': {'type': 'button', 'header': {'type': 'text', 'text': f"Task {i}"},
+                         'body': {'text': f"How's it going with task {i}?"}, 'action': {'buttons': []}}}
+        for i in range(1, TASKS + 1)
+    ]
+
+
+def run(label, outbound, send_user):
+    FakeGraphHandler.received = {}
+    latencies = []
+
+    def one_user(i):
+        start = time.perf_counter()
+        results = send_user(outbound, status_payloads(f"1555{i:07d}"))
+        latencies.append(time.perf_counter() - start)
+        return all(result.ok for result in results)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=FANOUT) as pool:
+        sent = sum(pool.map(one_user, range(USERS)))
+    elapsed = time.perf_counter() - start
+
+    in_order = sum(1 for headers in FakeGraphHandler.received.values()
+                   if headers == [f"Task {i}" for i in range(1, TASKS + 1)])
+    latencies.sort()
+    print(f"{label:>14}: {elapsed:6.2f} s  users ok {sent}/{USERS}  in order {in_order}/{USERS}  "
+          f"per-user p50 {statistics.median(latencies) * 1000:6.0f} ms  "
+          f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:6.0f} ms")
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v17.0"
+    client = GraphClient('bench-token', '1234567890', base_url=base_url, pool_size=WORKERS)
+
+    print(f"{USERS} users x {TASKS} messages, {FANOUT} fan-out threads, {WORKERS} outbound workers, "
+          f"server {SERVER_DELAY * 1000:.0f} ms")
+    run('one at a time', OutboundQueue(client, name='sequential', workers=WORKERS, rate=10000),
+        lambda outbound, payloads: [outbound.send(payload) for payload in payloads])
+    run('batched', OutboundQueue(client, name='batched', workers=WORKERS, rate=10000),
+        lambda outbound, payloads: outbound.send_batch(payloads))
+    wide_client = GraphClient('bench-token', '1234567890', base_url=base_url, pool_size=WORKERS * 3)
+    run(f"batched x{WORKERS * 3}", OutboundQueue(wide_client, name='wide', workers=WORKERS * 3, rate=10000),
+        lambda outbound, payloads: outbound.send_batch(payloads))
+
+
+if __name__ == '__main__':
+    main()
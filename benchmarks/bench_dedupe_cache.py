@@ -0,0 +1,90 @@
+"""Microbenchmark for the incoming message-ID dedupe cache.
+
+Fills a TTLDedupeCache to 1k, 100k and 1M live IDs and measures the cost of
+`seen()` for new IDs (with expired entries being purged from the head) and for
+repeated IDs, plus memory per entry. The previous dict scan is timed at 1k
+only, since each call walked every entry. Run from the repo root:
+
+    python benchmarks/bench_dedupe_cache.py
+"""
+import os
+import sys
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ttl_cache import TTLDedupeCache  # noqa: E402
+
+SIZES = [1000, 100000, 1000000]
+OPERATIONS = 200000
+TTL = 300
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def legacy_is_duplicate(cache, message_id, now):
+    """The previous is_duplicate_message, minus the 100-entry size cap."""
+    for mid, timestamp in list(cache.items()):
+        if now - timestamp > TTL:
+            cache.pop(mid)
+    if message_id in cache:
+        return True
+    cache[message_id] = now
+    return False
+
+
+def bench_size(size):
+    clock = FakeClock()
+    tracemalloc.start()
+    cache = TTLDedupeCache(ttl=TTL, max_size=size)
+    # Spread the fill over the TTL so that new IDs keep expiring old ones
+    step = TTL / size
+    for i in range(size):
+        clock.now = i * step
+        cache.seen(f"wamid.{i}")
+    memory, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for i in range(size, size + OPERATIONS):
+        clock.now = i * step
+        cache.seen(f"wamid.{i}")
+    new_ns = (time.perf_counter() - start) / OPERATIONS * 1e9
+
+    start = time.perf_counter()
+    for i in range(OPERATIONS):
+        cache.seen(f"wamid.{size + OPERATIONS - 1 - (i % 1000)}")
+    hit_ns = (time.perf_counter() - start) / OPERATIONS * 1e9
+
+    return new_ns, hit_ns, memory / size, len(cache)
+
+
+def bench_legacy(size, operations=2000):
+    cache = OrderedDict()
+    step = TTL / size
+    for i in range(size):
+        cache[f"wamid.{i}"] = i * step
+    start = time.perf_counter()
+    for i in range(size, size + operations):
+        legacy_is_duplicate(cache, f"wamid.{i}", i * step)
+    return (time.perf_counter() - start) / operations * 1e9
+
+
+def main():
+    print(f"{'live IDs':>9} {'new ns/op':>10} {'repeat ns/op':>13} {'bytes/entry':>12} {'final size':>11}")
+    for size in SIZES:
+        new_ns, hit_ns, per_entry, final_size = bench_size(size)
+        print(f"{size:>9} {new_ns:>10.0f} {hit_ns:>13.0f} {per_entry:>12.0f} {final_size:>11}")
+    print(f"\nprevious full-scan implementation at 1000 live IDs: {bench_legacy(1000):.0f} ns/op")
+
+
+if __name__ == '__main__':
+    main()
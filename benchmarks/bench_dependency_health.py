@@ -0,0 +1,119 @@
+"""Callers during a Graph API outage, with and without a circuit breaker.
+
+A local fake Graph server stalls for STALL_MS and then answers 503 for the
+first OUTAGE seconds, and answers 200 at once after that. CALLERS threads
+each send one message through an OutboundQueue, spread over the outage,
+and wait up to WAIT seconds for it like send_message does. With the
+breaker, a caller does not wait at all while the breaker is open (the
+message stays queued), and queue workers hold their messages instead of
+hammering the server. Prints caller wait times, requests the server saw
+during the outage and how many messages were delivered in the end. Run
+from the repo root:
+
+    python benchmarks/bench_dependency_health.py [callers] [outage_seconds] [stall_ms]
+"""
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dependency_health import Dependency  # noqa: E402
+from graph_client import GraphClient  # noqa: E402
+from outbound_queue import OutboundQueue  # noqa: E402
+
+CALLERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+OUTAGE = float(sys.argv[2]) if len(sys.argv) > 2 else 5
+STALL = (float(sys.argv[3]) if len(sys.argv) > 3 else 500) / 1000
+WAIT = 10  # seconds a caller waits for delivery, like OUTBOUND_SEND_TIMEOUT
+WORKERS = 8
+
+
+class OutageGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    down_until = 0.0
+    counts = {}
+
+    @classmethod
+    def reset(cls):
+        cls.down_until = time.monotonic() + OUTAGE
+        cls.counts = {'outage_requests': 0, 'delivered': 0}
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        cls = OutageGraphHandler
+        if time.monotonic() < cls.down_until:
+            with cls.lock:
+                cls.counts['outage_requests'] += 1
+            time.sleep(STALL)
+            return self._reply(503, {'error': {'message': 'Service unavailable', 'code': 2}})
+        with cls.lock:
+            cls.counts['delivered'] += 1
+        self._reply(200, {'messages': [{'id': 'wamid.fake'}]})
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(label, base_url, dependency):
+    client = GraphClient('bench-token', '1234567890', base_url=base_url, pool_size=WORKERS, dependency=dependency)
+    outbound = OutboundQueue(client, name=label, workers=WORKERS, max_size=CALLERS * 2, rate=1000,
+                             base_delay=0.2, max_delay=1)
+    OutageGraphHandler.reset()
+    waits = []
+
+    def caller(i):
+        time.sleep(i * OUTAGE / CALLERS)  # Arrivals spread over the outage
+        payload = {'messaging_product': 'whatsapp', 'to': f"1555{i:07d}", 'type': 'text', 'text': {'body': 'hi'}}
+        timeout = WAIT if dependency is None or dependency.available() else 0
+        start = time.perf_counter()
+        outbound.send(payload, timeout=timeout)
+        waits.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as pool:
+        list(pool.map(caller, range(CALLERS)))
+    outage_requests = OutageGraphHandler.counts['outage_requests']
+    # Let held and retried messages drain once the server is back
+    deadline = time.monotonic() + OUTAGE + WAIT
+    while outbound.stats()['depth'] and time.monotonic() < deadline:
+        time.sleep(0.1)
+    time.sleep(1)
+
+    waits.sort()
+    stats = outbound.stats()
+    print(f"{label:>16}: caller wait p50 {waits[len(waits) // 2]:5.2f} s  max {waits[-1]:5.2f} s  "
+          f"requests during outage {outage_requests:>4}  delivered {OutageGraphHandler.counts['delivered']:>4}/{CALLERS}  "
+          f"failed {stats['failed']:>4}  held {stats['held']}")
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), OutageGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}/v17.0"
+
+    print(f"{CALLERS} callers over a {OUTAGE:g} s outage, server stalls {STALL * 1000:.0f} ms then 503s, "
+          f"{WORKERS} workers, callers wait up to {WAIT} s")
+    run('no breaker', base_url, None)
+    run('circuit breaker', base_url,
+        Dependency('graph', timeout=STALL / 2, failure_threshold=5, reset_timeout=1,
+                   failed_result=lambda response: response.status_code >= 500))
+
+
+if __name__ == '__main__':
+    main()
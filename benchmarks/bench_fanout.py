@@ -0,0 +1,74 @@
+"""Timezone-bucketed fan-out of a scheduled message to many users.
+
+Spreads USERS fake users over a handful of timezones and, for each
+timezone, moves a fake clock to just after 08:00 local time on a Monday and
+runs the scheduler. The send function only sleeps for a simulated Graph API
+round trip. Prints each bucket's completion time and send rate, as recorded
+in the run ledger, against a messages-per-second budget, with and without
+the job's rate limit. Run from the repo root:
+
+    python benchmarks/bench_fanout.py [users] [workers] [send_ms] [budget_per_second]
+"""
+import os
+import sys
+import tempfile
+import time
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scheduler import FanOutJob, RunLedger, Scheduler  # noqa: E402
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+WORKERS = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+SEND_LATENCY = (float(sys.argv[3]) if len(sys.argv) > 3 else 100) / 1000
+BUDGET = float(sys.argv[4]) if len(sys.argv) > 4 else 80  # Cloud API default throughput
+
+TIMEZONES = ['America/Los_Angeles', 'America/New_York', 'Africa/Lagos', 'Europe/Moscow',
+             'Asia/Kolkata', 'Asia/Tokyo', 'Australia/Sydney']
+User = namedtuple('User', 'wa_id timezone')
+
+
+def send(user):
+    time.sleep(SEND_LATENCY)
+    return True
+
+
+def run(users, rate):
+    ledger = RunLedger(os.path.join(tempfile.mkdtemp(), 'scheduler.db'))
+    now = [None]
+    scheduler = Scheduler(ledger, clock=lambda: now[0]).add_fanout(
+        FanOutJob('morning_checkin', send, lambda: users, '08:00', range(5), workers=WORKERS, rate=rate)
+    )
+
+    print(f"{len(users)} users in {len(TIMEZONES)} timezones, {WORKERS} workers, "
+          f"{SEND_LATENCY * 1000:.0f} ms/send, rate limit {rate or 'none'}, budget {BUDGET:.0f} msg/s")
+    start = time.perf_counter()
+    for tz in TIMEZONES:
+        local = datetime(2024, 6, 3, 8, 0, 5, tzinfo=ZoneInfo(tz))  # A Monday
+        now[0] = local.astimezone(timezone.utc)
+        ran = scheduler.run_pending()
+        assert [name for name, _, _ in ran] == [f"morning_checkin:{tz}"], ran
+        # Nothing is due again later in the same window
+        now[0] += timedelta(minutes=30)
+        assert not scheduler.run_pending()
+    elapsed = time.perf_counter() - start
+
+    for run in sorted(ledger.recent(len(TIMEZONES)), key=lambda run: run['job']):
+        detail = run['detail']
+        rate = detail['sent'] / detail['seconds']
+        print(f"{run['job']:>36}: {detail['users']:>6} users  {detail['seconds']:7.2f} s  "
+              f"{rate:6.1f} msg/s{'  OVER BUDGET' if rate > BUDGET else ''}")
+    print(f"{'total':>36}: {len(users):>6} users  {elapsed:7.2f} s")
+
+
+def main():
+    users = [User(f"1555{i:07d}", TIMEZONES[i % len(TIMEZONES)]) for i in range(USERS)]
+    run(users, None)
+    run(users, BUDGET)
+
+
+if __name__ == '__main__':
+    main()
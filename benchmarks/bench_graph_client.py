@@ -0,0 +1,126 @@
+"""Per-message latency of WhatsApp sends against a local fake Graph server.
+
+Compares the previous one-shot `requests.post` per message with the pooled
+keep-alive session used by send_message. The fake server adds a fixed
+server-side delay so only connection handling differs. With --tls the server
+uses a throwaway self-signed certificate (needs the openssl CLI), which is
+closer to the real cost of a fresh connection to graph.facebook.com. Run from
+the repo root:
+
+    python benchmarks/bench_graph_client.py [--tls] [messages] [server_delay_ms]
+"""
+import json
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USE_TLS = '--tls' in sys.argv
+ARGS = [arg for arg in sys.argv[1:] if arg != '--tls']
+MESSAGES = int(ARGS[0]) if len(ARGS) > 0 else 200
+SERVER_DELAY = (float(ARGS[1]) if len(ARGS) > 1 else 1.0) / 1000
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Allow keep-alive
+    disable_nagle_algorithm = True
+    connections = set()
+
+    def do_POST(self):
+        FakeGraphHandler.connections.add(self.client_address)
+        self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(SERVER_DELAY)
+        body = json.dumps({'messages': [{'id': 'wamid.fake'}]}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_certificate(directory):
+    cert_file = os.path.join(directory, 'cert.pem')
+    key_file = os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-keyout', key_file, '-out', cert_file,
+        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+    ], check=True, capture_output=True)
+    return cert_file, key_file
+
+
+def start_server(certificate=None):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeGraphHandler)
+    if certificate:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(*certificate)
+        server.socket = context.wrap_socket(server.socket, server_side=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def measure(send):
+    FakeGraphHandler.connections = set()
+    latencies = []
+    for i in range(MESSAGES):
+        start = time.perf_counter()
+        assert send(f"Benchmark message {i}")
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def report(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<28} mean {statistics.mean(latencies):7.3f} ms  p50 {statistics.median(latencies):7.3f} ms  "
+          f"p95 {p95:7.3f} ms  connections {len(FakeGraphHandler.connections)}")
+
+
+def main():
+    certificate = None
+    if USE_TLS:
+        certificate = make_certificate(tempfile.mkdtemp())
+        os.environ['REQUESTS_CA_BUNDLE'] = certificate[0]
+    server = start_server(certificate)
+    scheme = 'https' if USE_TLS else 'http'
+    base_url = f"{scheme}://127.0.0.1:{server.server_port}/v17.0"
+    os.environ.update({
+        'GRAPH_API_BASE_URL': base_url,
+        'WHATSAPP_TOKEN': 'bench-token',
+        'PHONE_NUMBER_ID': '1234567890',
+        'RECIPIENT_PHONE_NUMBER': '15550000000',
+    })
+    import logging
+    logging.disable(logging.CRITICAL)
+    import webhook_handler as wh
+
+    url = f"{base_url}/1234567890/messages"
+
+    def one_shot_post(text):
+        # What send_message did before the shared client
+        response = requests.post(url, headers={
+            "Authorization": "Bearer bench-token",
+            "Content-Type": "application/json"
+        }, json={"messaging_product": "whatsapp", "to": "15550000000", "type": "text", "text": {"body": text}})
+        return response.status_code == 200
+
+    print(f"{MESSAGES} messages over {scheme}, {SERVER_DELAY * 1000:.1f} ms server delay")
+    report("requests.post per message", measure(one_shot_post))
+    report("pooled GraphClient session", measure(wh.send_message))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
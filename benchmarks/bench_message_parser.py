@@ -0,0 +1,100 @@
+"""Microbenchmark of parse_message over a corpus of synthetic WhatsApp texts.
+
+The corpus mixes weekly plans (full names, "Mon:", "mon -", bullet lists),
+status updates, check-in replies and unrelated chatter. The legacy
+check-in word test, line x weekday startswith loop and per-line re.match are
+timed alongside for comparison. Run from the repo root:
+
+    python benchmarks/bench_message_parser.py [messages]
+"""
+import collections
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from message_parser import WEEKDAYS, parse_message  # noqa: E402
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+TASKS = ['gym', 'write report', 'call mom', 'email client', 'review PR', 'groceries', 'plan sprint', 'read']
+CHATTER = ['ok thanks', "I'm feeling good today", 'tired but fine', 'see you later', 'what time is it?', 'lol']
+
+
+def make_plan(rng):
+    style = rng.choice(['full', 'short', 'dash', 'bullets'])
+    lines = []
+    for day in WEEKDAYS:
+        tasks = rng.sample(TASKS, 3)
+        if style == 'full':
+            lines.append(f"{day}: {', '.join(tasks)}")
+        elif style == 'short':
+            lines.append(f"{day[:3]}: {', '.join(tasks)}")
+        elif style == 'dash':
+            lines.append(f"{day[:3].lower()} - {', '.join(tasks)}")
+        else:
+            lines.append(f"• {day}")
+            lines.extend(f"- {task}" for task in tasks)
+    return '\n'.join(lines)
+
+
+def make_status(rng):
+    lines = ['Status Update:']
+    for i, task in enumerate(rng.sample(TASKS, 3), start=1):
+        lines.append(f"{i}. {task}: {rng.choice('✅🟡❌')} - {rng.choice(['', 'almost there', 'tomorrow'])}")
+    return '\n'.join(lines)
+
+
+def make_corpus(count, seed=11):
+    rng = random.Random(seed)
+    makers = [make_plan, make_status, lambda rng: rng.choice(CHATTER)]
+    return [rng.choice(makers)(rng) for _ in range(count)]
+
+
+LEGACY_FEELING_WORDS = {'feeling', 'feel', 'am', "i'm", 'im', 'doing', 'okay', 'good', 'great', 'tired', 'exhausted', 'fine'}
+
+
+def legacy_parse(message_text):
+    """The pre-parser logic, minus its INFO logging: check-in words, status update, then tasks."""
+    if set(message_text.lower().split()) & LEGACY_FEELING_WORDS:
+        pass  # The old handler went on to try the other formats anyway
+    if message_text.strip().startswith('Status Update:'):
+        updates = []
+        for line in message_text.strip().split('\n')[1:]:
+            match = re.match(r'(\d+)\.\s*([^:]+):\s*([✅🟡❌])\s*-?\s*(.*)', line.strip())
+            if match:
+                updates.append(match.groups())
+        if updates:
+            return updates
+    tasks = {}
+    for line in message_text.strip().split('\n'):
+        for day in WEEKDAYS:
+            if line.lower().startswith(day.lower()):
+                tasks_part = line.split(':', 1)[1] if ':' in line else ''
+                tasks[day] = [task.strip() for task in tasks_part.split(',') if task.strip()]
+                break
+    return tasks
+
+
+def main():
+    corpus = make_corpus(MESSAGES)
+
+    start = time.perf_counter()
+    kinds = collections.Counter(type(parse_message(text)).__name__ for text in corpus)
+    parser = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for text in corpus:
+        legacy_parse(text)
+    legacy = time.perf_counter() - start
+
+    print(f"{MESSAGES} messages: {dict(kinds)}")
+    print(f"  parse_message: {parser:6.3f} s  ({parser / MESSAGES * 1e6:5.1f} µs/message)")
+    print(f"         legacy: {legacy:6.3f} s  ({legacy / MESSAGES * 1e6:5.1f} µs/message, "
+          f"misses short/dash/bullet plans)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+"""Load test of the outbound message queue against a throttling fake Graph server.
+
+The local server accepts at most SERVER_RATE messages per second (its own
+token bucket). Above that it answers 429 with a Retry-After header, or
+every other time a 400 with Graph throttling error code 130429 and no
+header. It also fails a random ERROR_RATE of requests with a 503. It
+records the order messages are accepted in for each recipient.
+
+MESSAGES messages to RECIPIENTS recipients are sent three ways:
+- naively, with one attempt per message from a thread pool (roughly how
+  send_message worked before);
+- through OutboundQueue limited to the server's rate;
+- through OutboundQueue at twice the server's rate, so throttling has to be
+  handled by retrying.
+Delivered counts, 429/503 counts and per-recipient order violations are
+printed for each. Run from the repo root:
+
+    python benchmarks/bench_outbound_queue.py [messages] [recipients] [server_rate] [error_rate]
+"""
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_client import GraphClient  # noqa: E402
+from outbound_queue import OutboundQueue, TokenBucket  # noqa: E402
+
+MESSAGES = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+RECIPIENTS = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+SERVER_RATE = float(sys.argv[3]) if len(sys.argv) > 3 else 100
+ERROR_RATE = float(sys.argv[4]) if len(sys.argv) > 4 else 0.05
+SERVER_DELAY = 0.01  # seconds per request
+WORKERS = 8
+
+
+class ThrottlingGraphHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    lock = threading.Lock()
+    bucket = None
+    accepted = {}  # recipient -> [sequence numbers in acceptance order]
+    counts = {}
+
+    @classmethod
+    def reset(cls):
+        cls.bucket = _ServerBucket(SERVER_RATE)
+        cls.accepted = {}
+        cls.counts = {'requests': 0, 'throttled': 0, 'errors': 0}
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+        time.sleep(SERVER_DELAY)
+        cls = ThrottlingGraphHandler
+        with cls.lock:
+            cls.counts['requests'] += 1
+            if random.random() < ERROR_RATE:
+                cls.counts['errors'] += 1
+                return self._reply(503, {'error': {'message': 'Service unavailable', 'code': 2}})
+            if not cls.bucket.take():
+                cls.counts['throttled'] += 1
+                if cls.counts['throttled'] % 2:
+                    return self._reply(429, {'error': {'message': 'Too many requests', 'code': 130429}},
+                                       {'Retry-After': '1'})
+                return self._reply(400, {'error': {'message': 'Rate limit hit', 'code': 130429}})
+            cls.accepted.setdefault(payload['to'], []).append(int(payload['text']['body']))
+        self._reply(200, {'messages': [{'id': 'wamid.fake'}]})
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _ServerBucket(TokenBucket):
+    """Non-blocking variant: the server rejects instead of waiting."""
+
+    def take(self):
+        now = self._clock()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+def payloads():
+    sequence = {}
+    for i in range(MESSAGES):
+        to = f"1555{i % RECIPIENTS:07d}"
+        sequence[to] = sequence.get(to, 0) + 1
+        yield {'messaging_product': 'whatsapp', 'to': to, 'type': 'text', 'text': {'body': str(sequence[to])}}
+
+
+def out_of_order():
+    """Recipients whose accepted sequence numbers are not 1, 2, 3, ... in order."""
+    return sum(1 for seqs in ThrottlingGraphHandler.accepted.values() if seqs != sorted(seqs))
+
+
+def report(label, elapsed, delivered, extra=''):
+    counts = ThrottlingGraphHandler.counts
+    print(f"{label:>22}: {elapsed:6.2f} s  delivered {delivered:>5}/{MESSAGES}  "
+          f"{delivered / elapsed:6.1f} msg/s  requests {counts['requests']:>5}  "
+          f"throttled {counts['throttled']:>4}  5xx {counts['errors']:>3}  "
+          f"out of order {out_of_order()}{extra}")
+
+
+def run_naive(client):
+    ThrottlingGraphHandler.reset()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        results = list(pool.map(lambda payload: client.send(payload).status_code == 200, payloads()))
+    report('naive, one attempt', time.perf_counter() - start, sum(results))
+
+
+def run_queue(client, rate):
+    ThrottlingGraphHandler.reset()
+    outbound = OutboundQueue(client, name=f"bench-{rate:g}", workers=WORKERS, max_size=MESSAGES * 2,
+                             rate=rate, burst=max(1, rate / 10), base_delay=0.2)
+    start = time.perf_counter()
+    futures = [outbound.submit(payload) for payload in payloads()]
+    results = [future.result() for future in futures]
+    stats = outbound.stats()
+    report(f"queue at {rate:g} msg/s", time.perf_counter() - start, sum(result.ok for result in results),
+           f"  retries {stats['retries']}  max latency {stats['latency_seconds_max']:.2f} s")
+
+
+def main():
+    logging.disable(logging.CRITICAL)
+    random.seed(1)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), ThrottlingGraphHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = GraphClient('bench-token', '1234567890', base_url=f"http://127.0.0.1:{server.server_port}/v17.0",
+                         pool_size=WORKERS)
+
+    print(f"{MESSAGES} messages to {RECIPIENTS} recipients, server accepts {SERVER_RATE:g} msg/s, "
+          f"{ERROR_RATE:.0%} random 503s, {WORKERS} workers")
+    run_naive(client)
+    run_queue(client, SERVER_RATE)
+    run_queue(client, SERVER_RATE * 2)
+
+
+if __name__ == '__main__':
+    main()
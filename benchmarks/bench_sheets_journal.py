@@ -0,0 +1,157 @@
+"""Sheets write requests for a burst of status updates and check-ins.
+
+USERS users, each with their own tabs in one spreadsheet, send STATUS status
+updates and one voice check-in spread over DURATION seconds, from THREADS
+webhook threads. An in-memory Sheets stand-in with a fixed per-call latency
+counts batchUpdate requests and applies them. The burst runs twice:
+- write-through: every save is flushed at once, so there is one Sheets write
+  per save and the user waits for it (how the save functions worked before,
+  although those writes did not queue behind each other as flushes do);
+- write-behind: saves only go to the journal, and the background flusher
+  writes each spreadsheet's pending writes every FLUSH_INTERVAL seconds.
+Prints write requests (against the default quota of 60 write requests per
+minute per user, and a service account is one user), the time users wait
+for an answer, and whether every status cell and mood row ended up in the
+sheet. Run from the repo root:
+
+    python benchmarks/bench_sheets_journal.py [users] [duration_seconds] [sheets_ms] [flush_interval]
+"""
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+USERS = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+DURATION = float(sys.argv[2]) if len(sys.argv) > 2 else 10
+SHEETS_LATENCY = (float(sys.argv[3]) if len(sys.argv) > 3 else 150) / 1000
+FLUSH_INTERVAL = float(sys.argv[4]) if len(sys.argv) > 4 else 5
+STATUS = 3
+THREADS = 32
+QUOTA_PER_MINUTE = 60
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        time.sleep(SHEETS_LATENCY)
+        return self._fn()
+
+
+class FakeSheets:
+    """Serves every plan sheet's row for today and applies batchUpdate cell writes."""
+
+    def __init__(self, plan_rows):
+        self.plan_rows = plan_rows
+        self.cells = {}  # (sheetId, row index, column index) -> value
+        self.appended = {}  # sheetId -> rows
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        return _Request(lambda: {'values': self.plan_rows})
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            with self.lock:
+                self.writes += 1
+                for request in body['requests']:
+                    if 'appendCells' in request:
+                        append = request['appendCells']
+                        self.appended.setdefault(append['sheetId'], []).extend(append['rows'])
+                    else:
+                        update = request['updateCells']
+                        start = update['start']
+                        value = update['rows'][0]['values'][0]['userEnteredValue']['stringValue']
+                        self.cells[(start['sheetId'], start['rowIndex'], start['columnIndex'])] = value
+            return {'replies': [{} for _ in body['requests']]}
+        return _Request(run)
+
+
+def start_environment():
+    directory = tempfile.mkdtemp()
+    os.environ.update({
+        'WHATSAPP_TOKEN': 'bench-token',
+        'PHONE_NUMBER_ID': '1234567890',
+        'STATE_BACKEND': 'memory',
+        'USER_REGISTRY_PATH': os.path.join(directory, 'users.db'),
+        'SHEETS_JOURNAL_PATH': os.path.join(directory, 'sheets_journal.db'),
+        'SHEETS_FLUSH_INTERVAL': str(FLUSH_INTERVAL),
+    })
+    os.chdir(directory)  # Keep logs and caches out of the repo
+    logging.disable(logging.CRITICAL)
+    import webhook_handler as wh
+
+    users = []
+    for i in range(USERS):
+        user = wh.new_user(f"1555{i:07d}", wh.SHEET_ID)
+        wh.USERS.add(user)
+        wh.SHEET_SCHEMA_STATE[(user.spreadsheet_id, user.plan_sheet)] = 2 * i
+        wh.SHEET_SCHEMA_STATE[(user.spreadsheet_id, user.mood_sheet)] = 2 * i + 1
+        users.append(user)
+    return wh, users
+
+
+def run(label, wh, users, write_through):
+    today = wh.user_today(users[0])
+    sheets = FakeSheets([list(wh.HEADERS), ['Monday', today, 'Report', '', 'Gym', '', 'Read', '']])
+    wh.get_google_sheets_service = lambda: sheets
+    for user in users:
+        wh.plan_cache_for(user).invalidate()
+    waits = []
+    actions = [(user, step) for step in range(STATUS + 1) for user in users]
+
+    def act(i):
+        user, step = actions[i]
+        time.sleep(max(0.0, i * DURATION / len(actions) - (time.perf_counter() - start)))
+        begin = time.perf_counter()
+        if step < STATUS:
+            ok = wh.save_status_updates([wh.StatusItem(step + 1, 'task', 'completed', f"step {step}")], user)
+        else:
+            ok = wh.save_mood_data('Feeling fine', {'mood_score': 7}, user)
+        if write_through:
+            wh.SHEETS_JOURNAL.flush()
+        waits.append(time.perf_counter() - begin)
+        return ok
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=THREADS) as pool:
+        saved = sum(pool.map(act, range(len(actions))))
+    elapsed = time.perf_counter() - start
+    while wh.SHEETS_JOURNAL.stats()['pending']:
+        time.sleep(0.1)
+    time.sleep(SHEETS_LATENCY * 2)  # Let the last flush delete its entries
+
+    expected_cells = USERS * STATUS
+    status_ok = sum(1 for value in sheets.cells.values() if value.startswith('COMPLETED'))
+    mood_rows = sum(len(rows) for rows in sheets.appended.values())
+    waits.sort()
+    per_minute = sheets.writes / elapsed * 60
+    print(f"{label:>14}: saved {saved}/{len(actions)}  write requests {sheets.writes:>4} "
+          f"({per_minute:6.0f}/min, quota {QUOTA_PER_MINUTE}{', OVER' if per_minute > QUOTA_PER_MINUTE else ''})  "
+          f"user wait p50 {waits[len(waits) // 2] * 1000:6.1f} ms  p99 {waits[int(len(waits) * 0.99)] * 1000:7.1f} ms  "
+          f"status cells {status_ok}/{expected_cells}  mood rows {mood_rows}/{USERS}")
+
+
+def main():
+    wh, users = start_environment()
+    print(f"{USERS} users x ({STATUS} status updates + 1 check-in) over {DURATION:g} s, "
+          f"sheets {SHEETS_LATENCY * 1000:.0f} ms/call, flush every {FLUSH_INTERVAL:g} s")
+    run('write-through', wh, users, write_through=True)
+    run('write-behind', wh, users, write_through=False)
+
+
+if __name__ == '__main__':
+    main()
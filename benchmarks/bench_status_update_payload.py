@@ -0,0 +1,101 @@
+"""Compare the request payload of save_status_updates as the sheet grows.
+
+The old implementation PUT the whole "Weekly Plan" range back on every status
+update; the current one journals only the changed status cells, and the
+journal flush sends them as cell updates. "save ms" is what the user waits
+for; the flush happens later in the background. Run from the repo root:
+
+    python benchmarks/bench_status_update_payload.py
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+BENCH_DIR = tempfile.mkdtemp()
+os.environ.setdefault('SHEETS_JOURNAL_PATH', os.path.join(BENCH_DIR, 'sheets_journal.db'))
+os.environ.setdefault('USER_REGISTRY_PATH', os.path.join(BENCH_DIR, 'users.db'))
+
+import webhook_handler as wh  # noqa: E402
+
+SIZES = [100, 1000, 10000, 50000]
+
+
+class _Request:
+    def __init__(self, result):
+        self._result = result
+
+    def execute(self, **kwargs):
+        return self._result
+
+
+class RecordingSheets:
+    """Just enough of the Sheets API surface to record outgoing payloads."""
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.payload_bytes = 0
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def get(self, spreadsheetId, range):
+        return _Request({'values': self.rows})
+
+    def update(self, spreadsheetId, range, valueInputOption, body):
+        self.payload_bytes += len(json.dumps(body))
+        return _Request({})
+
+    def batchUpdate(self, spreadsheetId, body):
+        self.payload_bytes += len(json.dumps(body))
+        return _Request({})
+
+
+def build_rows(count, today):
+    rows = [list(wh.HEADERS)]
+    for i in range(count - 2):
+        rows.append(['Monday', f'2020-01-{i % 28 + 1:02d}', f'task {i}', 'COMPLETED', 'task', '', 'task', ''])
+    rows.append(['Friday', today, 'Write report', '', 'Gym', '', 'Read', ''])
+    return rows
+
+
+def full_sheet_payload(rows):
+    """Size of the body the previous whole-sheet update would have sent."""
+    return len(json.dumps({'values': rows}))
+
+
+def main():
+    today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+    updates = [
+        wh.StatusItem(1, 'Write report', 'completed', ''),
+        wh.StatusItem(2, 'Gym', 'in_progress', 'half way'),
+        wh.StatusItem(3, 'Read', 'not_done', ''),
+    ]
+    user = wh.new_user('15550000000', wh.SHEET_ID)
+    wh.USERS.add(user)
+    wh.SHEET_SCHEMA_STATE.update({(user.spreadsheet_id, user.plan_sheet): 0, (user.spreadsheet_id, user.mood_sheet): 1})
+    plan_cache = wh.plan_cache_for(user)
+
+    print(f"{'rows':>8} {'whole-sheet bytes':>18} {'targeted bytes':>15} {'save ms':>9}")
+    for size in SIZES:
+        service = RecordingSheets(build_rows(size, today))
+        wh.get_google_sheets_service = lambda: service
+        plan_cache.invalidate()
+        plan_cache.snapshot()  # Warm the cache, as a preceding get_todays_tasks would
+
+        start = time.perf_counter()
+        assert wh.save_status_updates(updates, user)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        wh.SHEETS_JOURNAL.flush()
+
+        print(f"{size:>8} {full_sheet_payload(service.rows):>18} {service.payload_bytes:>15} {elapsed_ms:>9.2f}")
+
+
+if __name__ == '__main__':
+    main()
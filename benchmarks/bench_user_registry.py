@@ -0,0 +1,55 @@
+"""Per-message user lookup cost as the registry grows.
+
+Fills a fresh UserRegistry with N users, then times USERS.get for random
+senders: cold (first lookup reads SQLite) and warm (served from the
+in-process cache). Warm lookups should stay flat as N grows. Run from the
+repo root:
+
+    python benchmarks/bench_user_registry.py [lookups]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from user_registry import UserRegistry, new_user  # noqa: E402
+
+SIZES = [100, 1000, 10000, 50000]
+LOOKUPS = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+
+
+def fill(registry, count):
+    connection = registry._connection()
+    connection.execute('BEGIN')
+    for i in range(count):
+        user = new_user(f"1555{i:07d}", 'bench-sheet', timezone='Europe/London')
+        connection.execute(
+            'INSERT INTO users (wa_id, name, timezone, spreadsheet_id, plan_sheet, mood_sheet) '
+            'VALUES (?, ?, ?, ?, ?, ?)', tuple(user)
+        )
+    connection.execute('COMMIT')
+
+
+def time_lookups(registry, wa_ids):
+    start = time.perf_counter()
+    for wa_id in wa_ids:
+        assert registry.get(wa_id) is not None
+    return (time.perf_counter() - start) / len(wa_ids) * 1e6
+
+
+def main():
+    print(f"{'users':>8} {'cold us/lookup':>15} {'warm us/lookup':>15}")
+    for size in SIZES:
+        registry = UserRegistry(os.path.join(tempfile.mkdtemp(), 'users.db'))
+        fill(registry, size)
+        wa_ids = [f"1555{random.randrange(size):07d}" for _ in range(LOOKUPS)]
+        cold = time_lookups(registry, sorted(set(wa_ids)))
+        warm = time_lookups(registry, wa_ids)
+        print(f"{size:>8} {cold:>15.2f} {warm:>15.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""Peak memory of the voice-note path for 1 MB - 50 MB synthetic OGG payloads.
+
+A local fake server plays the Graph media endpoints and a Deepgram-style
+/listen endpoint that reads and discards the upload. For each payload size
+this compares the previous approach (`response.content` bytes, posted as one
+buffer) with download_voice_note's spooled streaming download, streamed on to
+transcribe_voice_note. Peak memory is measured with tracemalloc. Run from the
+repo root:
+
+    python benchmarks/bench_voice_download.py
+"""
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SIZES_MB = [1, 5, 10, 25, 50]
+CHUNK = 64 * 1024
+# An Ogg page header followed by filler; content does not matter to the pipeline
+OGG_HEADER = b'OggS\x00\x02' + b'\x00' * 22
+
+
+class FakeMediaHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        media = re.match(r'/v17\.0/media-(\d+)$', self.path)
+        if media:
+            size = int(media.group(1))
+            host = self.headers['Host']
+            self._send_json({'url': f"http://{host}/download/{size}", 'file_size': size})
+            return
+        download = re.match(r'/download/(\d+)$', self.path)
+        size = int(download.group(1))
+        self.send_response(200)
+        self.send_header('Content-Type', 'audio/ogg')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        self.wfile.write(OGG_HEADER)
+        remaining = size - len(OGG_HEADER)
+        filler = b'\x5a' * CHUNK
+        while remaining > 0:
+            self.wfile.write(filler[:min(CHUNK, remaining)])
+            remaining -= CHUNK
+
+    def do_POST(self):
+        # Deepgram stand-in: drain the upload without keeping it
+        received = 0
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            while True:
+                length = int(self.rfile.readline().strip(), 16)
+                if not length:
+                    self.rfile.readline()
+                    break
+                received += len(self.rfile.read(length))
+                self.rfile.readline()
+        else:
+            remaining = int(self.headers.get('Content-Length', 0))
+            while remaining:
+                data = self.rfile.read(min(CHUNK, remaining))
+                received += len(data)
+                remaining -= len(data)
+        self._send_json({'results': {'channels': [{'alternatives': [{'transcript': f'{received} bytes'}]}]}})
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def peak_memory(fn):
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, result
+
+
+def main():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ.update({
+        'GRAPH_API_BASE_URL': f"{base}/v17.0",
+        'DEEPGRAM_API_URL': f"{base}/v1/listen",
+        'DEEPGRAM_API_KEY': 'bench-key',
+        'WHATSAPP_TOKEN': 'bench-token',
+        'STATE_BACKEND': 'memory',
+        'VOICE_NOTE_MAX_BYTES': str(64 * 1024 * 1024),
+    })
+    os.chdir(tempfile.mkdtemp())  # Keep the app's log file out of the repo
+    import logging
+    logging.disable(logging.CRITICAL)
+    import webhook_handler as wh
+
+    def buffered(size):
+        # What handle_voice_checkin did before: whole file in memory, posted as one buffer
+        url = requests.get(f"{base}/v17.0/media-{size}").json()['url']
+        audio_data = requests.get(url).content
+        return requests.post(f"{base}/v1/listen", data=audio_data).json()
+
+    def streamed(size):
+        audio_file, _ = wh.download_voice_note(f"media-{size}")
+        with audio_file:
+            return wh.VOICE_LOOP.run(wh.transcribe_voice_note, audio_file, timeout=120)
+
+    print(f"{'payload':>8} {'buffered peak MB':>17} {'streamed peak MB':>17} {'streamed s':>11}")
+    for size_mb in SIZES_MB:
+        size = size_mb * 1024 * 1024
+        buffered_peak, _, _ = peak_memory(lambda: buffered(size))
+        streamed_peak, elapsed, transcript = peak_memory(lambda: streamed(size))
+        assert transcript == f"{size} bytes", transcript
+        print(f"{size_mb:>6}MB {buffered_peak / 2**20:>17.1f} {streamed_peak / 2**20:>17.1f} {elapsed:>11.2f}")
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
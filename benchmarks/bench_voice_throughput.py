@@ -0,0 +1,140 @@
+"""End-to-end voice check-in throughput with no network access.
+
+Uses the fake transcription engine (TRANSCRIPTION_ENGINE=fake) with a
+configurable latency, a local fake Graph media server and an in-memory Sheets
+stand-in. NOTES distinct voice notes go through the voice pipeline stages
+twice: once one note after another per thread (how handle_voice_checkin used
+to work, with CONCURRENCY threads), and once through the staged pipeline,
+which also reports per-stage latency and backlog. Mood rows go through the
+Sheets write journal; "sheets writes" counts the batchUpdates that flushed
+them. Run from the repo root:
+
+    python benchmarks/bench_voice_throughput.py [notes] [concurrency] [transcribe_ms] [sheets_ms]
+"""
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_voice_download import FakeMediaHandler  # noqa: E402
+
+NOTES = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+CONCURRENCY = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+TRANSCRIBE_LATENCY = (float(sys.argv[3]) if len(sys.argv) > 3 else 300) / 1000
+SHEETS_LATENCY = (float(sys.argv[4]) if len(sys.argv) > 4 else 150) / 1000
+
+
+class _Request:
+    def __init__(self, fn):
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        time.sleep(SHEETS_LATENCY)
+        return self._fn()
+
+
+class FakeSheets:
+    """Applies appendCells to in-memory lists with a fixed per-call latency."""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def spreadsheets(self):
+        return self
+
+    def values(self):
+        return self
+
+    def batchUpdate(self, spreadsheetId, body):
+        def run():
+            with self.lock:
+                self.calls += 1
+                for request in body['requests']:
+                    append = request.get('appendCells')
+                    if append:
+                        self.rows.setdefault(append['sheetId'], []).extend(append['rows'])
+            return {'replies': [{} for _ in body['requests']]}
+        return _Request(run)
+
+
+def start_environment():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeMediaHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+    os.environ.update({
+        'GRAPH_API_BASE_URL': f"{base}/v17.0",
+        'WHATSAPP_TOKEN': 'bench-token',
+        'PHONE_NUMBER_ID': '1234567890',
+        'RECIPIENT_PHONE_NUMBER': '15550000000',
+        'TRANSCRIPTION_ENGINE': 'fake',
+        'FAKE_TRANSCRIPTION_LATENCY': str(TRANSCRIBE_LATENCY),
+        'TRANSCRIPTION_CONCURRENCY': str(max(CONCURRENCY, 4)),
+        'STATE_BACKEND': 'memory',
+        'VOICE_FETCH_WORKERS': str(CONCURRENCY),
+    })
+    os.chdir(tempfile.mkdtemp())  # Fresh transcript cache, and keep logs out of the repo
+    import logging
+    logging.disable(logging.CRITICAL)
+    import webhook_handler as wh
+    sheets = FakeSheets()
+    wh.get_google_sheets_service = lambda: sheets
+    user = wh.default_user()
+    wh.SHEET_SCHEMA_STATE.update({(user.spreadsheet_id, user.plan_sheet): 0, (user.spreadsheet_id, user.mood_sheet): 1})
+    return wh, sheets
+
+
+def run_sequential(wh, first_note):
+    user = wh.default_user()
+
+    def one_note(i):
+        job = {'media_id': f"media-{first_note + i}", 'user': user, 'received_at': wh.datetime.now()}
+        job = wh.analyze_voice_job(wh.transcribe_voice_job(wh.fetch_voice_note(job)))
+        wh.persist_voice_jobs([job])
+        wh.notify_voice_job(job)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=CONCURRENCY) as pool:
+        list(pool.map(one_note, range(NOTES)))
+    return time.perf_counter() - start
+
+
+def run_pipeline(wh, first_note):
+    start = time.perf_counter()
+    for i in range(NOTES):
+        assert wh.handle_voice_checkin({'voice': {'id': f"media-{first_note + i}"}}, wh.default_user())
+    wh.VOICE_PIPELINE.drain()
+    return time.perf_counter() - start
+
+
+def main():
+    wh, sheets = start_environment()
+    print(f"{NOTES} notes, transcribe {TRANSCRIBE_LATENCY * 1000:.0f} ms, "
+          f"sheets {SHEETS_LATENCY * 1000:.0f} ms/call, {CONCURRENCY} threads/workers")
+
+    # Distinct sizes give distinct audio, so every note misses the transcript cache
+    for label, run, first_note in (('sequential', run_sequential, 20000), ('pipeline', run_pipeline, 40000)):
+        calls = sheets.calls
+        elapsed = run(wh, first_note)
+        wh.SHEETS_JOURNAL.flush()
+        print(f"{label:>10}: {elapsed:6.2f} s  {NOTES / elapsed:6.1f} notes/s  "
+              f"sheets writes {sheets.calls - calls}")
+
+    stats = wh.VOICE_PIPELINE.stats()
+    print(f"pipeline: completed {stats['completed']} failed {stats['failed']}  "
+          f"mean latency {stats['latency_seconds_avg'] * 1000:.0f} ms  max {stats['latency_seconds_max'] * 1000:.0f} ms")
+    for name, stage in stats['stages'].items():
+        print(f"  {name:>10}: wait avg {stage['wait_seconds_avg'] * 1000:6.0f} ms max {stage['wait_seconds_max'] * 1000:6.0f} ms"
+              f"  run avg {stage['run_seconds_avg'] * 1000:6.0f} ms  batches {stage['batches']:3d}  backlog {stage['backlog']}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,219 @@
+import collections
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FAILURE_THRESHOLD = 5  # consecutive failures that open the breaker
+DEFAULT_RESET_TIMEOUT = 30  # seconds an open breaker rejects calls before letting a probe through
+DEFAULT_MAX_DEFERRED = 1000
+LATENCY_SAMPLES = 1000  # recent calls kept for percentiles
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is unavailable, retry in {retry_in:.1f} s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class Dependency:
+    """Health tracking and circuit breaker for one external service.
+
+    Every call through `call` is timed. A call that raises, returns a result
+    `failed_result` rejects, or takes longer than `timeout` is a failure.
+    The timeout itself is enforced by the client library; here it only
+    classifies slow calls. After `failure_threshold` failures in a row the
+    breaker opens, and calls raise CircuitOpen at once instead of queueing
+    up behind a service that is down or stalled. After `reset_timeout` one
+    probe call is let through (half-open). Its success closes the breaker,
+    its failure opens it again.
+
+    Work that can wait is handed to `defer`. It is kept in memory, in order,
+    and replayed in the background: one piece as the half-open probe, the
+    rest once the breaker has closed. Deferred work handles its own errors
+    and may defer itself again.
+    """
+
+    def __init__(self, name, timeout, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 reset_timeout=DEFAULT_RESET_TIMEOUT, counts_as_failure=lambda error: True,
+                 failed_result=lambda result: False, max_deferred=DEFAULT_MAX_DEFERRED):
+        self.name = name
+        self.timeout = timeout
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._counts_as_failure = counts_as_failure
+        self._failed_result = failed_result
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probing = False
+        self._consecutive_failures = 0
+        self._latencies = collections.deque(maxlen=LATENCY_SAMPLES)
+        self._last_error = None
+        self._deferred = collections.deque(maxlen=max_deferred)
+        self._replay_timer = None
+        self._replay_pid = None
+        self._replay_thread = None  # Work this thread defers again goes back to the front
+        self._stats = {
+            'calls': 0,
+            'failures': 0,
+            'slow_calls': 0,
+            'rejected': 0,
+            'opened': 0,
+            'deferred': 0,
+            'replayed': 0,
+            'deferred_dropped': 0,
+        }
+
+    def call(self, fn, *args, **kwargs):
+        """Call `fn(*args, **kwargs)` if the breaker allows it; raise CircuitOpen otherwise."""
+        self._before_call()
+        start = time.monotonic()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception as e:
+            self._after_call(time.monotonic() - start, error=e if self._counts_as_failure(e) else None)
+            raise
+        self._after_call(
+            time.monotonic() - start,
+            error=f"unhealthy response: {result!r}"[:200] if self._failed_result(result) else None
+        )
+        return result
+
+    def outage(self, error):
+        """Whether a failed call should be deferred: it was rejected, or the breaker is open now."""
+        return isinstance(error, CircuitOpen) or not self.available()
+
+    def available(self):
+        """Whether a call would be let through now (closed, or due a probe)."""
+        with self._lock:
+            return self._state == CLOSED or (
+                not self._probing and time.monotonic() - self._opened_at >= self._reset_timeout
+            )
+
+    def defer(self, fn, *args, description=None):
+        """Queue `fn(*args)` to run through this dependency once it is healthy again."""
+        description = description or getattr(fn, '__name__', repr(fn))
+        with self._lock:
+            if len(self._deferred) == self._deferred.maxlen:
+                self._stats['deferred_dropped'] += 1
+                logger.error("%s deferred queue is full, dropping oldest work", self.name)
+            if threading.get_ident() == self._replay_thread:
+                self._deferred.appendleft((fn, args, description))
+            else:
+                self._deferred.append((fn, args, description))
+                self._stats['deferred'] += 1
+        logger.warning("Deferred %s until %s recovers", description, self.name)
+        self._schedule_replay()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            latencies = sorted(self._latencies)
+            stats.update({
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'timeout_seconds': self.timeout,
+                'last_error': self._last_error,
+                'retry_in_seconds': self._retry_in() if self._state != CLOSED else 0.0,
+                'deferred_pending': len(self._deferred),
+            })
+        for name, fraction in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+            stats[f"latency_{name}_ms"] = (
+                round(latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000, 1)
+                if latencies else None
+            )
+        stats['latency_max_ms'] = round(latencies[-1] * 1000, 1) if latencies else None
+        stats['latency_samples'] = len(latencies)
+        return stats
+
+    def _retry_in(self):
+        return max(0.0, self._reset_timeout - (time.monotonic() - self._opened_at))
+
+    def _before_call(self):
+        with self._lock:
+            self._stats['calls'] += 1
+            if self._state == CLOSED:
+                return
+            if self._probing or self._retry_in() > 0:
+                self._stats['rejected'] += 1
+                raise CircuitOpen(self.name, self._retry_in() or self._reset_timeout)
+            # Let this call through as the probe
+            self._state = HALF_OPEN
+            self._probing = True
+
+    def _after_call(self, elapsed, error=None):
+        with self._lock:
+            self._latencies.append(elapsed)
+            if error is None and elapsed > self.timeout:
+                self._stats['slow_calls'] += 1
+                error = f"slow call: {elapsed:.2f} s > {self.timeout} s"
+            self._probing = False
+
+            if error is None:
+                if self._state != CLOSED:
+                    logger.info("%s recovered, closing circuit breaker", self.name)
+                self._state = CLOSED
+                self._consecutive_failures = 0
+                recovered = bool(self._deferred)
+            else:
+                self._stats['failures'] += 1
+                self._consecutive_failures += 1
+                self._last_error = str(error)[:500]
+                recovered = False
+                if self._state == HALF_OPEN or self._consecutive_failures >= self._failure_threshold:
+                    if self._state != OPEN:
+                        self._stats['opened'] += 1
+                        logger.error("%s failing (%s), opening circuit breaker for %d s",
+                                     self.name, self._last_error, self._reset_timeout)
+                    self._state = OPEN
+                    self._opened_at = time.monotonic()
+        if recovered:
+            self._schedule_replay(delay=0)
+
+    def _schedule_replay(self, delay=None):
+        with self._lock:
+            if not self._deferred:
+                return
+            # A timer started before a fork does not run in the child
+            if self._replay_timer is not None and self._replay_pid == os.getpid():
+                if delay != 0:
+                    return
+                self._replay_timer.cancel()  # Recovered: replay now rather than at the next probe
+            if delay is None:
+                delay = 0 if self._state == CLOSED else (self._retry_in() or self._reset_timeout)
+            self._replay_timer = threading.Timer(delay, self._replay)
+            self._replay_timer.daemon = True
+            self._replay_timer.start()
+            self._replay_pid = os.getpid()
+
+    def _replay(self):
+        with self._lock:
+            self._replay_timer = None
+        while True:
+            with self._lock:
+                if not self._deferred:
+                    return
+                probe = self._state != CLOSED
+                fn, args, description = self._deferred.popleft()
+                self._stats['replayed'] += 1
+                self._replay_thread = threading.get_ident()
+            try:
+                fn(*args)
+            except Exception:
+                logger.exception("Deferred %s failed", description)
+            finally:
+                with self._lock:
+                    self._replay_thread = None
+            if probe:
+                # Only one piece of work goes out while the breaker is open;
+                # the rest follow once a successful call closes it
+                break
+        self._schedule_replay()
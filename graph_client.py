@@ -0,0 +1,74 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+GRAPH_API_BASE_URL = os.environ.get('GRAPH_API_BASE_URL', 'https://graph.facebook.com/v17.0').rstrip('/')
+GRAPH_CONNECT_TIMEOUT = float(os.environ.get('GRAPH_CONNECT_TIMEOUT', 3.05))  # seconds
+GRAPH_READ_TIMEOUT = float(os.environ.get('GRAPH_READ_TIMEOUT', 15))  # seconds
+GRAPH_POOL_SIZE = int(os.environ.get('GRAPH_POOL_SIZE', 10))
+
+
+class GraphClient:
+    """Shared WhatsApp Graph API client with a pooled keep-alive session.
+
+    One `requests.Session` is kept per worker process so messages reuse the
+    TCP/TLS connection to graph.facebook.com instead of opening a new one for
+    every call. Every request carries a connect and read timeout. With a
+    `dependency`, every request is timed and guarded by its circuit breaker,
+    and raises dependency_health.CircuitOpen while the API is down.
+    """
+
+    def __init__(self, token, phone_number_id, base_url=GRAPH_API_BASE_URL,
+                 connect_timeout=GRAPH_CONNECT_TIMEOUT, read_timeout=GRAPH_READ_TIMEOUT,
+                 pool_size=GRAPH_POOL_SIZE, dependency=None):
+        self.base_url = base_url.rstrip('/')
+        self.phone_number_id = phone_number_id
+        self.messages_url = f"{self.base_url}/{phone_number_id}/messages"
+        self.timeout = (connect_timeout, read_timeout)
+        self._pool_size = pool_size
+        self.dependency = dependency
+        self._auth_headers = {"Authorization": f"Bearer {token}"}
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+
+    @property
+    def session(self):
+        # Sessions hold sockets, so never share one across a fork
+        if self._session is None or self._pid != os.getpid():
+            with self._lock:
+                if self._session is None or self._pid != os.getpid():
+                    self._session = self._build_session()
+                    self._pid = os.getpid()
+        return self._session
+
+    def _build_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self._pool_size)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        session.headers.update(self._auth_headers)
+        logger.info("Created Graph API session (pool size %d)", self._pool_size)
+        return session
+
+    def send(self, payload):
+        """POST a message payload to the phone number's /messages endpoint."""
+        return self._request(self.session.post, self.messages_url, json=payload, timeout=self.timeout)
+
+    def get(self, url, **kwargs):
+        """GET a Graph API or media URL with the shared auth headers."""
+        kwargs.setdefault('timeout', self.timeout)
+        return self._request(self.session.get, url, **kwargs)
+
+    def _request(self, method, url, **kwargs):
+        if self.dependency is None:
+            return method(url, **kwargs)
+        return self.dependency.call(method, url, **kwargs)
+
+    def media_url(self, media_id):
+        return f"{self.base_url}/{media_id}"
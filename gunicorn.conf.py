@@ -0,0 +1,8 @@
+# gunicorn settings for the web process (see Procfile)
+
+
+def post_worker_init(worker):
+    # Background threads do not survive a fork, so each worker starts its own
+    # once it has loaded the app; the scheduler's run ledger runs each job once
+    from webhook_handler import start_background_services
+    start_background_services()
@@ -0,0 +1,180 @@
+import hashlib
+import json
+import re
+
+# Curly apostrophes (as typed on phones) are matched as straight ones
+_APOSTROPHES = str.maketrans({'’': "'", '‘': "'"})
+
+
+def normalize(text):
+    """Lowercase text and straighten apostrophes before matching."""
+    return text.lower().translate(_APOSTROPHES)
+
+
+def _trie_pattern(phrases):
+    """Regex matching any of `phrases`, factored by common prefix.
+
+    Python's re tries alternatives one by one, so a flat alternation costs
+    one attempt per phrase at every position. As a trie ("t(?:ask|ired)") a
+    position is rejected after one or two characters. Optional groups are
+    greedy, so longer phrases are still tried before their prefixes.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[''] = {}  # End of a phrase
+
+    def pattern(node):
+        branches = [
+            (r'\s+' if char == ' ' else re.escape(char)) + pattern(child)
+            for char, child in sorted(node.items()) if char
+        ]
+        if not branches:
+            return ''
+        if '' in node:
+            return f"(?:{'|'.join(branches)})?"
+        return branches[0] if len(branches) == 1 else f"(?:{'|'.join(branches)})"
+
+    return pattern(trie)
+
+
+class Lexicon:
+    """Precompiled matcher for words and multi-word phrases grouped into categories.
+
+    All phrases go into one regex, factored into a prefix trie and anchored
+    on word boundaries. One scan of the text finds every phrase, even next to
+    punctuation ("tired." or "let's go!"). Words inside phrases may be
+    separated by any whitespace, and a phrase never matches inside a longer
+    word or contraction ("im" does not match "imagine"). A phrase can belong
+    to several categories. Where phrases overlap at the same position, the
+    longest one wins, and it also counts as every shorter phrase it contains
+    ("not bad" counts as "bad" too). Phrase lists that overlap can therefore
+    share one lexicon and still be counted as if each were scanned alone.
+    """
+
+    def __init__(self, categories):
+        self.categories = tuple(categories)
+        # Changes whenever a phrase is added, removed or recategorized, so
+        # results kept from an earlier lexicon can be told apart
+        self.fingerprint = hashlib.sha256(json.dumps(
+            {category: sorted(phrases) for category, phrases in categories.items()}, sort_keys=True
+        ).encode()).hexdigest()[:16]
+        self.categories_by_phrase = {}
+        for category, phrases in categories.items():
+            for phrase in phrases:
+                key = ' '.join(normalize(phrase).split())
+                self.categories_by_phrase.setdefault(key, []).append(category)
+
+        # Every phrase of the lexicon found inside each phrase, itself included
+        self.subphrases = {}
+        for phrase in self.categories_by_phrase:
+            words = phrase.split()
+            self.subphrases[phrase] = tuple(dict.fromkeys(
+                ' '.join(words[start:end])
+                for start in range(len(words)) for end in range(start + 1, len(words) + 1)
+                if ' '.join(words[start:end]) in self.categories_by_phrase
+            ))
+
+        self._multiword = any(' ' in phrase for phrase in self.categories_by_phrase)
+        alternation = _trie_pattern(self.categories_by_phrase)
+        # Not preceded by a word character (or "x'"), not followed by one (or "'x")
+        self._pattern = re.compile(rf"(?<!\w)(?<!\w')(?:{alternation})(?!\w)(?!'\w)")
+
+    def findall(self, text):
+        """Return every phrase occurrence in `text`, in order."""
+        matches = self._pattern.findall(normalize(text))
+        if self._multiword:
+            return [self._phrase(match) for match in matches]
+        return matches
+
+    def finditer(self, text):
+        """Yield (offset, phrase) for every occurrence, offsets into normalize(text)."""
+        for match in self._pattern.finditer(normalize(text)):
+            phrase = match.group()
+            yield match.start(), self._phrase(phrase) if self._multiword else phrase
+
+    def _phrase(self, match):
+        # Collapse the whitespace matched between words, unless it is a single space already
+        return match if match in self.categories_by_phrase else ' '.join(match.split())
+
+    def phrases(self, text):
+        """Return the set of distinct lexicon phrases found in `text`, including those inside longer ones."""
+        found = set()
+        for phrase in self.findall(text):
+            found.update(self.subphrases[phrase])
+        return found
+
+    def count(self, phrases):
+        """Return {category: number of the given distinct phrases in it} for every category."""
+        counts = dict.fromkeys(self.categories, 0)
+        for phrase in phrases:
+            for category in self.categories_by_phrase[phrase]:
+                counts[category] += 1
+        return counts
+
+    def counts(self, text):
+        """Return {category: number of distinct phrases found} for every category."""
+        return self.count(self.phrases(text))
+
+
+# Word lists for the rule-based mood analysis
+SENTIMENT_WORDS = {
+    'positive': {'happy', 'good', 'great', 'awesome', 'excellent', 'excited', 'joy', 'wonderful', 'fantastic'},
+    'negative': {'sad', 'bad', 'terrible', 'awful', 'worried', 'stressed', 'angry', 'frustrated', 'tired'},
+}
+ENERGY_WORDS = {
+    'high': {'energetic', 'active', 'motivated', 'excited', 'pumped'},
+    'low': {'tired', 'exhausted', 'drained', 'sleepy', 'lazy'}
+}
+# Common topics to look for in check-ins
+TOPIC_KEYWORDS = {
+    'work': {'work', 'project', 'meeting', 'deadline', 'task', 'job', 'client'},
+    'health': {'health', 'exercise', 'workout', 'sleep', 'rest', 'tired', 'energy'},
+    'mood': {'feeling', 'mood', 'emotion', 'stress', 'anxiety', 'happy', 'sad'},
+    'relationships': {'family', 'friend', 'relationship', 'social', 'people', 'team'},
+    'goals': {'goal', 'plan', 'future', 'achieve', 'progress', 'improvement'}
+}
+ACTION_VERBS = {'need', 'want', 'going', 'plan', 'will', 'must', 'should'}
+
+# Words that suggest a reply to "how are you feeling?"
+CHECKIN_WORDS = {'feeling', 'feel', 'am', "i'm", 'im', 'doing', 'okay', 'good', 'great', 'tired', 'exhausted', 'fine'}
+
+# Phrases that signal the user's energy in a check-in reply
+CHECKIN_ENERGY_PHRASES = {
+    # High energy indicators
+    'high': {
+        'pumped', 'excited', 'ready', 'motivated', 'energized', 'focused',
+        "let's go", 'feeling great', 'on top of things', 'productive',
+        'inspired', 'crushing it'
+    },
+    # Neutral energy indicators
+    'neutral': {
+        'okay', 'fine', 'alright', 'meh', 'not bad', 'decent',
+        'hanging in there', 'could be better', 'managing', 'doing my best'
+    },
+    # Low energy indicators
+    'low': {
+        'tired', 'exhausted', 'drained', 'burnt out', 'overwhelmed',
+        'stressed', 'anxious', 'struggling', "can't focus", 'not feeling it',
+        'heavy', 'unmotivated', 'foggy', 'no energy'
+    },
+    # Distress signals
+    'distress': {
+        'hopeless', 'defeated', 'stuck', 'numb', "can't do anything",
+        "what's the point", 'done with everything', 'just want to sleep',
+        'empty'
+    },
+}
+
+# Every list above in one matcher, so a message is scanned once whatever is
+# asked of it: LEXICON.counts(text) has a count for every category
+LEXICON = Lexicon({
+    **SENTIMENT_WORDS,
+    **{f"energy:{level}": words for level, words in ENERGY_WORDS.items()},
+    **{f"topic:{topic}": words for topic, words in TOPIC_KEYWORDS.items()},
+    'action': ACTION_VERBS,
+    'checkin': CHECKIN_WORDS,
+    **{f"checkin_energy:{level}": phrases for level, phrases in CHECKIN_ENERGY_PHRASES.items()},
+})
@@ -0,0 +1,113 @@
+import re
+from typing import NamedTuple
+
+from lexicon import LEXICON
+
+WEEKDAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+STATUS_EMOJIS = {
+    '✅': 'completed',
+    '🟡': 'in_progress',
+    '❌': 'not_done'
+}
+
+# Day names and the abbreviations people type
+_DAY_ALIASES = {
+    'monday': 'Monday', 'mon': 'Monday',
+    'tuesday': 'Tuesday', 'tues': 'Tuesday', 'tue': 'Tuesday',
+    'wednesday': 'Wednesday', 'weds': 'Wednesday', 'wed': 'Wednesday',
+    'thursday': 'Thursday', 'thurs': 'Thursday', 'thur': 'Thursday', 'thu': 'Thursday',
+    'friday': 'Friday', 'fri': 'Friday',
+}
+_DAY_PATTERN = '|'.join(sorted(_DAY_ALIASES, key=len, reverse=True))
+_BULLET = r'(?:[-*•·–]|\d+[.)])'
+_SPACE = r'[^\S\n]'  # Whitespace within a line
+
+# Every line kind the bot understands. Each alternative is wrapped in a group
+# named after its kind, so match.lastgroup says which one matched; lines that
+# match nothing else are "other".
+LINE_PATTERN = re.compile(rf'''
+    ^{_SPACE}*(?:
+        (?P<header>status{_SPACE}*update\b.*)
+      | (?P<status_line>(?:[-*•·]{_SPACE}*)?(\d+)[.)]{_SPACE}*([^:\n]+):{_SPACE}*
+        ([{''.join(STATUS_EMOJIS)}]){_SPACE}*(?:-{_SPACE}*)?(.*))
+      | (?P<day_line>(?:{_BULLET}{_SPACE}*)?({_DAY_PATTERN})\b\.?
+        (?:{_SPACE}*[:\-–—]|[^:\n]*:|(?={_SPACE}*$)){_SPACE}*(.*))
+      | (?P<item>{_BULLET}{_SPACE}+(.+))
+      | (?P<other>.*)
+    )$
+''', re.IGNORECASE | re.VERBOSE | re.MULTILINE)
+
+
+class StatusItem(NamedTuple):
+    task_num: int
+    task: str
+    status: str  # 'completed', 'in_progress' or 'not_done'
+    note: str
+
+
+class WeeklyPlan(NamedTuple):
+    tasks: dict  # Day name -> list of task strings, in message order
+
+
+class StatusUpdate(NamedTuple):
+    items: list  # StatusItem per task line
+
+
+class CheckinReply(NamedTuple):
+    text: str
+    counts: dict  # LEXICON.counts(text), for callers that look at other categories
+
+
+class Unrecognized(NamedTuple):
+    text: str
+
+
+def parse_message(message_text):
+    """Classify a text message and parse it in one regex scan over its lines.
+
+    Returns a StatusUpdate for a "Status Update:" header followed by lines
+    like "1. Task: ✅ - note", a WeeklyPlan for lines starting with a
+    weekday ("Monday: a, b", "Mon - a", "• Tue: a", or a day line followed
+    by bulleted tasks), a CheckinReply for free text that answers "how are
+    you feeling?" (a LEXICON 'checkin' word), and Unrecognized otherwise.
+    """
+    is_status_update = False
+    first_line = True
+    items = []
+    tasks = {}
+    current_day = None
+
+    for match in LINE_PATTERN.finditer(message_text):
+        kind = match.lastgroup
+        if kind == 'other':
+            if match.group('other').strip():
+                first_line = False
+                current_day = None
+            continue  # Blank lines change nothing
+
+        if kind == 'header':
+            # The header only counts as the first line
+            is_status_update = is_status_update or first_line
+            current_day = None
+        elif kind == 'status_line':
+            if is_status_update:
+                task_num, task, emoji, note = match.group(3, 4, 5, 6)
+                items.append(StatusItem(int(task_num), task.strip(), STATUS_EMOJIS[emoji], note.strip()))
+            current_day = None
+        elif kind == 'day_line':
+            current_day = _DAY_ALIASES[match.group(8).lower()]
+            # Tasks after the day are comma separated
+            tasks[current_day] = [task.strip() for task in match.group(9).split(',') if task.strip()]
+        elif current_day is not None:
+            # Bulleted tasks under a day line
+            tasks[current_day].append(match.group(11).strip())
+        first_line = False
+
+    if items:
+        return StatusUpdate(items)
+    if tasks:
+        return WeeklyPlan(tasks)
+    counts = LEXICON.counts(message_text)
+    if counts['checkin'] > 0:
+        return CheckinReply(message_text, counts)
+    return Unrecognized(message_text)
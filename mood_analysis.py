@@ -0,0 +1,127 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import threading
+
+from lexicon import ACTION_VERBS, LEXICON, TOPIC_KEYWORDS, normalize
+
+logger = logging.getLogger(__name__)
+
+
+def _scan(text):
+    """Scan a transcript once with LEXICON.
+
+    Returns the distinct phrases found, and the indexes into
+    text.split('.') of the sentences holding an action verb.
+    """
+    phrases = set()
+    sentences = set()
+    normalized = normalize(text)
+    sentence = position = 0
+    for offset, phrase in LEXICON.finditer(text):
+        found = LEXICON.subphrases[phrase]
+        phrases.update(found)
+        if not ACTION_VERBS.isdisjoint(found):
+            # Lowercasing never adds or removes a '.', so counting them gives the sentence
+            sentence += normalized.count('.', position, offset)
+            position = offset
+            sentences.add(sentence)
+    return phrases, sentences
+
+
+def analyze_mood_from_text(text):
+    """Analyze mood and emotions from transcribed text."""
+    try:
+        # Simple rule-based sentiment analysis
+        # You can make this more sophisticated or integrate with a sentiment analysis service
+        phrases, action_sentences = _scan(text)
+        counts = LEXICON.count(phrases)
+        
+        # Calculate mood score
+        positive_count = counts['positive']
+        negative_count = counts['negative']
+        total_sentiment_words = positive_count + negative_count
+        
+        if total_sentiment_words > 0:
+            mood_score = round((positive_count / total_sentiment_words) * 10)
+        else:
+            mood_score = 5  # Neutral score if no sentiment words found
+        
+        # Determine energy level
+        high_energy_count = counts['energy:high']
+        low_energy_count = counts['energy:low']
+        
+        if high_energy_count > low_energy_count:
+            energy_level = 'High'
+        elif low_energy_count > high_energy_count:
+            energy_level = 'Low'
+        else:
+            energy_level = 'Medium'
+        
+        # Extract potential action items (sentences with action verbs)
+        sentences = text.split('.')
+        action_items = [sentences[i].strip() for i in sorted(action_sentences)]
+        
+        return {
+            'mood_score': mood_score,
+            'primary_emotion': 'Positive' if mood_score > 5 else 'Negative' if mood_score < 5 else 'Neutral',
+            'secondary_emotions': 'Varied',
+            'key_topics': topics_from_counts(counts),
+            'energy_level': energy_level,
+            'action_items': '. '.join(action_items) if action_items else '',
+            'follow_up_needed': 'Yes' if action_items else 'No'
+        }
+        
+    except Exception as e:
+        logger.error(f"Error analyzing mood: {str(e)}")
+        return {
+            'mood_score': 5,
+            'primary_emotion': 'Neutral',
+            'secondary_emotions': '',
+            'key_topics': '',
+            'energy_level': 'Medium',
+            'action_items': '',
+            'follow_up_needed': 'No'
+        }
+
+def topics_from_counts(counts):
+    """Format the topics matched by LEXICON.counts() for the sheet."""
+    found_topics = [topic for topic in TOPIC_KEYWORDS if counts[f"topic:{topic}"]]
+    return ', '.join(found_topics) if found_topics else 'General check-in'
+
+def extract_key_topics(text):
+    """Extract key topics from text using simple keyword extraction."""
+    return topics_from_counts(LEXICON.counts(text))
+
+
+class MoodAnalysisPool:
+    """Runs `analyze_mood_from_text` in a small process pool.
+
+    Keeps the CPU-bound scoring off the web worker's threads so it does not
+    compete with them for the GIL. With `processes=0` the analysis runs
+    inline instead. The pool is created lazily and again after a fork. Its
+    processes are spawned rather than forked from the threaded web worker,
+    where a fork could copy a lock some other thread holds.
+    """
+
+    def __init__(self, processes=1):
+        self._processes = processes
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _executor(self):
+        with self._lock:
+            if self._pool is None or self._pid != os.getpid():
+                self._pool = concurrent.futures.ProcessPoolExecutor(
+                    max_workers=self._processes, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._pid = os.getpid()
+                logger.info("Started mood analysis pool (%d processes)", self._processes)
+            return self._pool
+
+    def analyze(self, text):
+        if not self._processes:
+            return analyze_mood_from_text(text)
+        return self._executor().submit(analyze_mood_from_text, text).result()
@@ -0,0 +1,333 @@
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import NamedTuple
+
+import requests
+
+from dependency_health import CircuitOpen
+
+logger = logging.getLogger(__name__)
+
+# Messages per second per business phone number for WhatsApp Cloud API throughput tiers
+THROUGHPUT_TIERS = {
+    'standard': 80,
+    'high': 1000,
+}
+# Graph error codes that mean "slow down" even when the HTTP status is not 429
+THROTTLING_ERROR_CODES = {
+    4,       # Application request limit reached
+    80007,   # WhatsApp Business Account rate limit
+    130429,  # Cloud API throughput reached
+    131056,  # Too many messages to the same recipient (pair rate limit)
+}
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_BASE_DELAY = 0.5  # seconds, doubled per retry
+DEFAULT_MAX_DELAY = 30.0  # seconds
+DEFAULT_MAX_WAIT = 120.0  # seconds from queueing a message that its sender waits for the result
+
+
+class DeliveryResult(NamedTuple):
+    ok: bool
+    status_code: int  # Last HTTP status, 0 if no response was received
+    attempts: int
+    response_text: str
+    error: str  # Why delivery failed, '' on success
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, bursts up to `burst`.
+
+    `acquire` blocks until a token is free. `pause` stops handing out tokens
+    for a while, so every sender backs off together when the API says it is
+    overloaded.
+    """
+
+    def __init__(self, rate, burst=None, clock=time.monotonic):
+        self.rate = rate
+        self.capacity = burst or rate
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def acquire(self):
+        """Take one token, sleeping until one is available; return seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                wait = self._paused_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def pause(self, seconds):
+        with self._lock:
+            now = self._clock()
+            self._paused_until = max(self._paused_until, now + seconds)
+            self._tokens = 0  # Resume gently rather than with a full burst
+
+
+def retry_after_seconds(response):
+    """Seconds asked for by a Retry-After header (delta or HTTP date), or None."""
+    value = response.headers.get('Retry-After')
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def graph_error_code(response):
+    try:
+        return response.json().get('error', {}).get('code')
+    except (ValueError, AttributeError):
+        return None
+
+
+class OutboundQueue:
+    """Queue of outgoing WhatsApp messages, rate limited and retried.
+
+    Messages are sharded by recipient over a fixed pool of daemon workers,
+    like WorkQueue, so messages to one recipient are sent one at a time in
+    submission order. A worker keeps retrying its current message before
+    moving on, so a retry never lets a later message overtake an earlier
+    one. Every attempt takes a token from a shared TokenBucket sized to the
+    phone number's throughput tier.
+
+    429s, 5xx responses, Graph throttling error codes and network errors are
+    retried up to `max_attempts` times with exponential backoff and full
+    jitter (capped at `max_delay`), or after the server's Retry-After if it
+    sent one. A Retry-After longer than the retries left could wait
+    (`max_delay` each), or than is left of the message's `max_wait`, fails
+    the message at once as throttled rather than holding up its worker. A
+    throttling response also pauses the bucket, for at most `max_delay`, so
+    all workers back off together.
+    Other errors (bad payload, invalid recipient) fail at once. While the
+    client's circuit breaker is open, the worker holds its message and
+    waits for the breaker to let calls through again, without using up
+    attempts. Threads are started lazily, and restarted after a fork.
+    """
+
+    def __init__(self, client, name='outbound', workers=8, max_size=1000, rate=THROUGHPUT_TIERS['standard'],
+                 burst=None, max_attempts=DEFAULT_MAX_ATTEMPTS, base_delay=DEFAULT_BASE_DELAY,
+                 max_delay=DEFAULT_MAX_DELAY, max_wait=DEFAULT_MAX_WAIT):
+        self.name = name
+        self._client = client
+        self._workers = workers
+        self._max_size = max_size
+        self._bucket = TokenBucket(rate, burst)
+        self._max_attempts = max_attempts
+        self._base_delay = base_delay
+        self._max_delay = max_delay
+        self._max_wait = max_wait
+        self._lock = threading.Lock()
+        self._queues = []
+        self._pid = None
+        self._stats = {
+            'submitted': 0,
+            'delivered': 0,
+            'failed': 0,
+            'dropped': 0,
+            'attempts': 0,
+            'retries': 0,
+            'throttled': 0,
+            'retry_after_too_long': 0,
+            'server_errors': 0,
+            'network_errors': 0,
+            'held': 0,
+            'held_seconds_total': 0.0,
+            'rate_wait_seconds_total': 0.0,
+            'latency_seconds_total': 0.0,
+            'latency_seconds_max': 0.0,
+        }
+
+    def submit(self, payload):
+        """Queue a /messages payload; return a Future resolving to a DeliveryResult.
+
+        If the queue is full the Future is already resolved with a failure.
+        """
+        self._ensure_started()
+        future = Future()
+        shard = hash(payload.get('to')) % self._workers
+        try:
+            self._queues[shard].put_nowait((time.monotonic(), payload, future))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            logger.warning("Outbound queue %s-%d is full, dropping message to %s", self.name, shard, payload.get('to'))
+            future.set_result(DeliveryResult(False, 0, 0, '', 'queue full'))
+            return future
+        with self._lock:
+            self._stats['submitted'] += 1
+        return future
+
+    def send(self, payload, timeout=None):
+        """Queue a payload and wait for its DeliveryResult."""
+        return self.send_batch([payload], timeout)[0]
+
+    def submit_batch(self, payloads):
+        """Queue several payloads at once; return a Future per payload, in order.
+
+        Messages to different recipients are sent concurrently by different
+        workers. Messages to the same recipient go to that recipient's worker
+        back to back, in the order given. If one of them cannot be queued,
+        the later ones to that recipient are not queued either, so the
+        recipient never gets them out of order.
+        """
+        futures = []
+        dropped = set()
+        for payload in payloads:
+            recipient = payload.get('to')
+            if recipient in dropped:
+                future = Future()
+                future.set_result(DeliveryResult(False, 0, 0, '', 'earlier message to recipient was not queued'))
+            else:
+                future = self.submit(payload)
+                if future.done() and not future.result().ok:
+                    dropped.add(recipient)
+            futures.append(future)
+        return futures
+
+    def send_batch(self, payloads, timeout=None):
+        """Queue several payloads and wait for them; return a DeliveryResult per payload, in order.
+
+        `timeout` bounds the wait for the whole batch. A message with no
+        result in time is reported as failed but stays queued.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        results = []
+        for future in self.submit_batch(payloads):
+            try:
+                remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+                results.append(future.result(remaining))
+            except FutureTimeoutError:
+                # Still queued; it may be delivered later
+                results.append(DeliveryResult(False, 0, 0, '', f"no result within {timeout} s"))
+        return results
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats['delivered'] + stats['failed']
+        stats['depth'] = sum(work.qsize() for work in self._queues)
+        stats['max_size'] = self._max_size
+        stats['workers'] = self._workers
+        stats['rate'] = self._bucket.rate
+        stats['latency_seconds_avg'] = stats['latency_seconds_total'] / finished if finished else 0.0
+        return stats
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            shard_size = max(1, self._max_size // self._workers)
+            self._queues = [queue.Queue(maxsize=shard_size) for _ in range(self._workers)]
+            for i, work in enumerate(self._queues):
+                threading.Thread(target=self._run, args=(work,), name=f"{self.name}-{i}", daemon=True).start()
+            self._pid = os.getpid()
+            logger.info("Started outbound queue %s with %d workers at %s msg/s",
+                        self.name, self._workers, self._bucket.rate)
+
+    def _run(self, work):
+        while True:
+            enqueued_at, payload, future = work.get()
+            try:
+                result = self._deliver(payload, enqueued_at + self._max_wait)
+            except Exception as e:
+                logger.exception("Unexpected error delivering message to %s", payload.get('to'))
+                result = DeliveryResult(False, 0, 0, '', str(e))
+            latency = time.monotonic() - enqueued_at
+            with self._lock:
+                self._stats['delivered' if result.ok else 'failed'] += 1
+                self._stats['latency_seconds_total'] += latency
+                self._stats['latency_seconds_max'] = max(self._stats['latency_seconds_max'], latency)
+            future.set_result(result)
+            work.task_done()
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self._max_delay, self._base_delay * 2 ** (attempt - 1)))
+
+    def _deliver(self, payload, deadline):
+        while True:
+            try:
+                return self._attempt_delivery(payload, deadline)
+            except CircuitOpen as e:
+                # The API is down; keep the message (and everything behind it) queued until it is back
+                with self._lock:
+                    self._stats['held'] += 1
+                    self._stats['held_seconds_total'] += e.retry_in
+                logger.warning("Holding message to %s: %s", payload.get('to'), e)
+                time.sleep(e.retry_in)
+
+    def _attempt_delivery(self, payload, deadline):
+        status_code, text, error = 0, '', ''
+        for attempt in range(1, self._max_attempts + 1):
+            waited = self._bucket.acquire()
+            with self._lock:
+                self._stats['attempts'] += 1
+                self._stats['rate_wait_seconds_total'] += waited
+                if attempt > 1:
+                    self._stats['retries'] += 1
+
+            try:
+                response = self._client.send(payload)
+            except requests.RequestException as e:
+                status_code, text, error = 0, '', f"{type(e).__name__}: {e}"
+                delay = self._backoff(attempt)
+                with self._lock:
+                    self._stats['network_errors'] += 1
+            else:
+                status_code, text = response.status_code, response.text
+                if status_code == 200:
+                    return DeliveryResult(True, status_code, attempt, text, '')
+
+                throttled = status_code == 429 or graph_error_code(response) in THROTTLING_ERROR_CODES
+                if not throttled and status_code < 500:
+                    return DeliveryResult(False, status_code, attempt, text, f"HTTP {status_code}")
+
+                error = f"HTTP {status_code}"
+                retry_after = retry_after_seconds(response)
+                with self._lock:
+                    self._stats['throttled' if throttled else 'server_errors'] += 1
+                if retry_after is None:
+                    delay = self._backoff(attempt)
+                else:
+                    budget = min(self._max_delay * (self._max_attempts - attempt), deadline - time.monotonic())
+                    if retry_after > budget:
+                        # Waiting would outlast the retries or the sender; let the caller decide
+                        with self._lock:
+                            self._stats['retry_after_too_long'] += 1
+                        return DeliveryResult(False, status_code, attempt, text,
+                                              f"throttled, retry after {retry_after:.0f} s")
+                    delay = retry_after + random.uniform(0, self._base_delay)
+                if throttled:
+                    self._bucket.pause(min(delay, self._max_delay))
+
+            if attempt < self._max_attempts:
+                logger.warning("Send to %s failed (%s), retry %d in %.2f s",
+                               payload.get('to'), error, attempt, delay)
+                time.sleep(delay)
+
+        return DeliveryResult(False, status_code, self._max_attempts, text, error)
@@ -0,0 +1,203 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class Stage:
+    """One step of a Pipeline: a bounded queue and its own worker threads."""
+
+    def __init__(self, name, fn, workers=1, max_size=100, batch_size=1, batch_wait=0.0):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.queue = None
+        self.busy = 0
+        self.stats = {
+            'processed': 0,
+            'failed': 0,
+            'batches': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'run_seconds_total': 0.0,
+            'run_seconds_max': 0.0,
+        }
+
+
+class Pipeline:
+    """Chain of stages connected by bounded queues, each with its own concurrency.
+
+    Every stage runs `workers` threads, so a slow stage (say, transcription)
+    holds only its own workers while the other stages keep draining their
+    queues. A stage function takes one item and returns the item to pass on,
+    or None to stop there. A stage with `batch_size > 1` receives a list of
+    up to that many items (waiting at most `batch_wait` seconds to fill it)
+    and returns the list to pass on. Queues between stages are bounded, so a
+    backed-up stage blocks the one before it, and `submit` refuses new work
+    when the first queue is full (after waiting up to `timeout` for room).
+    A failing item is logged, counted and passed to `on_error`. Threads are
+    started lazily (and restarted after a fork).
+    """
+
+    def __init__(self, name, on_error=None):
+        self.name = name
+        self._stages = []
+        self._on_error = on_error
+        self._lock = threading.Lock()
+        self._pid = None
+        self._in_flight = 0
+        self._idle = threading.Condition(self._lock)
+        self._stats = {'submitted': 0, 'completed': 0, 'failed': 0, 'dropped': 0,
+                       'latency_seconds_total': 0.0, 'latency_seconds_max': 0.0}
+
+    def add_stage(self, name, fn, workers=1, max_size=100, batch_size=1, batch_wait=0.0):
+        self._stages.append(Stage(name, fn, workers, max_size, batch_size, batch_wait))
+        return self
+
+    def submit(self, item, timeout=None):
+        """Queue `item` for the first stage; return False if that stage is full.
+
+        With a `timeout`, wait up to that many seconds for room first.
+        """
+        self._ensure_started()
+        with self._lock:
+            self._in_flight += 1
+        entry = (time.monotonic(), time.monotonic(), item)
+        try:
+            if timeout:
+                self._stages[0].queue.put(entry, timeout=timeout)
+            else:
+                self._stages[0].queue.put_nowait(entry)
+        except queue.Full:
+            with self._lock:
+                self._in_flight -= 1
+                self._stats['dropped'] += 1
+                self._idle.notify_all()
+            logger.warning("Pipeline %s is full, dropping item", self.name)
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def drain(self, timeout=None):
+        """Wait until every submitted item has finished; return False on timeout."""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._in_flight == 0, timeout)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['in_flight'] = self._in_flight
+            stages = {}
+            for stage in self._stages:
+                stage_stats = dict(stage.stats)
+                finished = stage_stats['batches']
+                stage_stats.update({
+                    'backlog': stage.queue.qsize() if stage.queue else 0,
+                    'max_size': stage.max_size,
+                    'workers': stage.workers,
+                    'busy': stage.busy,
+                    'wait_seconds_avg': stage_stats['wait_seconds_total'] / finished if finished else 0.0,
+                    'run_seconds_avg': stage_stats['run_seconds_total'] / finished if finished else 0.0,
+                })
+                stages[stage.name] = stage_stats
+        finished = stats['completed'] + stats['failed']
+        stats['latency_seconds_avg'] = stats['latency_seconds_total'] / finished if finished else 0.0
+        stats['stages'] = stages
+        return stats
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._in_flight = 0
+            for index, stage in enumerate(self._stages):
+                stage.queue = queue.Queue(maxsize=stage.max_size)
+                stage.busy = 0
+                for i in range(stage.workers):
+                    threading.Thread(
+                        target=self._run, args=(index,), name=f"{self.name}-{stage.name}-{i}", daemon=True
+                    ).start()
+            self._pid = os.getpid()
+            logger.info("Started pipeline %s: %s", self.name,
+                        ' -> '.join(f"{stage.name}({stage.workers})" for stage in self._stages))
+
+    def _take(self, stage):
+        batch = [stage.queue.get()]
+        if stage.batch_size > 1:
+            deadline = time.monotonic() + stage.batch_wait
+            while len(batch) < stage.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(stage.queue.get(timeout=remaining) if remaining > 0 else stage.queue.get_nowait())
+                except queue.Empty:
+                    break
+        return batch
+
+    def _run(self, index):
+        stage = self._stages[index]
+        next_stage = self._stages[index + 1] if index + 1 < len(self._stages) else None
+        while True:
+            batch = self._take(stage)
+            started_at = time.monotonic()
+            items = [item for _, _, item in batch]
+            with self._lock:
+                stage.busy += 1
+            try:
+                if stage.batch_size > 1:
+                    results = stage.fn(items)
+                else:
+                    results = [stage.fn(items[0])]
+            except Exception as e:
+                logger.exception("Stage %s of pipeline %s failed", stage.name, self.name)
+                self._finish(stage, batch, started_at, failed=True)
+                for (submitted_at, _, item) in batch:
+                    self._fail(item, e)
+                    self._complete(submitted_at, failed=True)
+                continue
+
+            self._finish(stage, batch, started_at)
+            # Results line up with the batch, so each keeps its own submit time
+            for (submitted_at, _, _), result in zip(batch, results):
+                if result is None or next_stage is None:
+                    self._complete(submitted_at)
+                else:
+                    next_stage.queue.put((submitted_at, time.monotonic(), result))
+
+    def _finish(self, stage, batch, started_at, failed=False):
+        finished_at = time.monotonic()
+        run = finished_at - started_at
+        wait = max(started_at - enqueued_at for _, enqueued_at, _ in batch)
+        with self._lock:
+            stage.busy -= 1
+            stats = stage.stats
+            stats['failed' if failed else 'processed'] += len(batch)
+            stats['batches'] += 1
+            stats['wait_seconds_total'] += wait
+            stats['wait_seconds_max'] = max(stats['wait_seconds_max'], wait)
+            stats['run_seconds_total'] += run
+            stats['run_seconds_max'] = max(stats['run_seconds_max'], run)
+
+    def _complete(self, submitted_at, failed=False):
+        latency = time.monotonic() - submitted_at
+        with self._lock:
+            self._in_flight -= 1
+            self._stats['failed' if failed else 'completed'] += 1
+            self._stats['latency_seconds_total'] += latency
+            self._stats['latency_seconds_max'] = max(self._stats['latency_seconds_max'], latency)
+            self._idle.notify_all()
+
+    def _fail(self, item, error):
+        if self._on_error is not None:
+            try:
+                self._on_error(item, error)
+            except Exception:
+                logger.exception("Error handler of pipeline %s failed", self.name)
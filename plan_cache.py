@@ -0,0 +1,122 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL = 60  # seconds
+
+# Column positions in the "Weekly Plan" sheet (0-indexed)
+DATE_COLUMN = 1
+
+
+class PlanSnapshot:
+    """View of the plan sheet with a date -> row number index."""
+
+    __slots__ = ('rows', 'date_index', 'fetched_at')
+
+    def __init__(self, rows, fetched_at):
+        self.rows = rows
+        self.fetched_at = fetched_at
+        self.date_index = build_date_index(rows)
+
+    def row_for_date(self, date_str):
+        """Return (row_number, row) of the most recent row for a date, or None."""
+        row_number = self.date_index.get(date_str)
+        if row_number is None:
+            return None
+        return row_number, self.rows[row_number - 1]
+
+
+def build_date_index(rows):
+    """Map each date to the 1-indexed sheet row of its most recent entry."""
+    index = {}
+    for i, row in enumerate(rows[1:], start=2):  # Row 1 is the header
+        if len(row) > DATE_COLUMN and row[DATE_COLUMN]:
+            index[row[DATE_COLUMN]] = i  # Later rows win, matching "most recent entry"
+    return index
+
+
+class PlanCache:
+    """Read-through cache of the weekly plan sheet.
+
+    `loader` returns the sheet values as a list of rows. The snapshot is
+    reused until it is older than `ttl` seconds or until our own code writes
+    to the sheet and calls `invalidate()`.
+    """
+
+    def __init__(self, loader, ttl=DEFAULT_TTL):
+        self._loader = loader
+        self._ttl = ttl
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def snapshot(self):
+        """Return a fresh-enough snapshot, loading the sheet at most once per TTL."""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - snapshot.fetched_at < self._ttl:
+            self._stats['hits'] += 1
+            return snapshot
+
+        with self._lock:
+            # Another thread may have reloaded while we waited for the lock
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot.fetched_at < self._ttl:
+                self._stats['hits'] += 1
+                return snapshot
+            self._stats['misses'] += 1
+            rows = self._loader()
+            snapshot = PlanSnapshot(rows, time.monotonic())
+            self._snapshot = snapshot
+            logger.info("Loaded %d plan rows (%d dates indexed)", len(rows), len(snapshot.date_index))
+            return snapshot
+
+    def row_for_date(self, date_str):
+        """Return (row_number, row) of the most recent row for a date, or None."""
+        return self.snapshot().row_for_date(date_str)
+
+    def apply_cell_updates(self, row_number, cells):
+        """Patch cells we just wrote so the snapshot stays valid without a reload.
+
+        `cells` maps 0-indexed column positions to their new values.
+        """
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or row_number > len(snapshot.rows):
+                return
+            row = list(snapshot.rows[row_number - 1])
+            for col, value in cells.items():
+                while len(row) <= col:
+                    row.append('')
+                row[col] = value
+            snapshot.rows[row_number - 1] = row
+
+    def apply_append(self, start_row, new_rows):
+        """Add rows we just appended at `start_row` without re-reading the sheet."""
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            if start_row != len(snapshot.rows) + 1:
+                # Someone else wrote to the sheet since we loaded it
+                self._snapshot = None
+                self._stats['invalidations'] += 1
+                return
+            for offset, row in enumerate(new_rows):
+                snapshot.rows.append(list(row))
+                if len(row) > DATE_COLUMN and row[DATE_COLUMN]:
+                    snapshot.date_index[row[DATE_COLUMN]] = start_row + offset
+
+    def invalidate(self):
+        """Forget the cached snapshot; the next lookup reloads the sheet."""
+        with self._lock:
+            self._snapshot = None
+            self._stats['invalidations'] += 1
+
+    def stats(self):
+        snapshot = self._snapshot
+        stats = dict(self._stats)
+        stats['cached_rows'] = len(snapshot.rows) if snapshot else 0
+        stats['age_seconds'] = round(time.monotonic() - snapshot.fetched_at, 3) if snapshot else None
+        return stats
@@ -0,0 +1,400 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, time as day_time, timedelta, timezone
+from functools import partial
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TICK = 30  # seconds between checks when nothing is due sooner
+DEFAULT_FANOUT_WORKERS = 8  # concurrent sends per timezone bucket
+DEFAULT_FANOUT_RATE = 20  # users started per second; a status request is up to 3 messages
+DEFAULT_LEASE = 120  # seconds a running job owns its run without renewing it
+
+
+class DailySchedule:
+    """Fires once a day at a local time, on the given weekdays (0=Monday)."""
+
+    def __init__(self, at, weekdays=range(7), tz='UTC'):
+        hour, minute = (int(part) for part in at.split(':'))
+        self.at = day_time(hour, minute)
+        self.weekdays = frozenset(weekdays)
+        self.tz = ZoneInfo(tz)
+
+    def _occurrence(self, day):
+        return datetime.combine(day, self.at, tzinfo=self.tz).astimezone(timezone.utc)
+
+    def latest(self, now):
+        """Most recent firing time at or before `now` (UTC), or None."""
+        today = now.astimezone(self.tz).date()
+        for days_back in range(8):
+            day = today - timedelta(days=days_back)
+            if day.weekday() in self.weekdays and self._occurrence(day) <= now:
+                return self._occurrence(day)
+        return None
+
+    def next(self, now):
+        """First firing time after `now` (UTC), or None."""
+        today = now.astimezone(self.tz).date()
+        for days_ahead in range(8):
+            day = today + timedelta(days=days_ahead)
+            if day.weekday() in self.weekdays and self._occurrence(day) > now:
+                return self._occurrence(day)
+        return None
+
+    def __repr__(self):
+        return f"DailySchedule({self.at:%H:%M}, weekdays={sorted(self.weekdays)}, tz={self.tz.key})"
+
+
+class RunLedger:
+    """Record of scheduled runs in a SQLite file, keyed by (job, due time).
+
+    A run is claimed with an INSERT before the job starts, so each due time
+    runs at most once, across restarts and across several schedulers
+    sharing the file. A claim is a lease that the running job renews as it
+    goes. If the worker running it dies (a deploy, a timeout, a recycled
+    worker), the lease runs out and the next scheduler to check claims the
+    run again. Fan-out jobs also record each user they reach, so a run that
+    is taken over resumes with the users not reached yet, and nobody is
+    messaged twice.
+    """
+
+    def __init__(self, path, lease=DEFAULT_LEASE):
+        self._path = path
+        self._lease = lease
+        self._local = threading.local()
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS job_runs ('
+            'job TEXT NOT NULL, due_at TEXT NOT NULL, status TEXT NOT NULL, '
+            'started_at REAL NOT NULL, finished_at REAL, error TEXT, detail TEXT, '
+            'claimed_until REAL NOT NULL DEFAULT 0, '
+            'PRIMARY KEY (job, due_at))'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS job_run_users ('
+            'job TEXT NOT NULL, due_at TEXT NOT NULL, user TEXT NOT NULL, reached_at REAL NOT NULL, '
+            'PRIMARY KEY (job, due_at, user))'
+        )
+        # Ledgers created before fan-out jobs have no detail column, and
+        # ledgers created before leases have no claimed_until column
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(job_runs)')}
+        for column, definition in (('detail', 'TEXT'), ('claimed_until', 'REAL NOT NULL DEFAULT 0')):
+            if column not in columns:
+                try:
+                    connection.execute(f'ALTER TABLE job_runs ADD COLUMN {column} {definition}')
+                except sqlite3.OperationalError:
+                    pass  # Added by another process in the meantime
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def claim(self, job, due_at):
+        """Mark `job` as running for `due_at`; return False if that run is finished or still leased."""
+        now = time.time()
+        connection = self._connection()
+        if connection.execute(
+            'INSERT OR IGNORE INTO job_runs (job, due_at, status, started_at, claimed_until) VALUES (?, ?, ?, ?, ?)',
+            (job, due_at.isoformat(), 'running', now, now + self._lease)
+        ).rowcount == 1:
+            return True
+        # Take over a run whose worker stopped renewing its lease
+        if connection.execute(
+            "UPDATE job_runs SET claimed_until = ? WHERE job = ? AND due_at = ? AND status = 'running' "
+            'AND claimed_until <= ?',
+            (now + self._lease, job, due_at.isoformat(), now)
+        ).rowcount == 1:
+            logger.warning("Taking over %s for %s: the worker running it stopped", job, due_at.isoformat())
+            return True
+        return False
+
+    def renew(self, job, due_at):
+        """Extend the lease on a run that is still going."""
+        self._connection().execute(
+            "UPDATE job_runs SET claimed_until = ? WHERE job = ? AND due_at = ? AND status = 'running'",
+            (time.time() + self._lease, job, due_at.isoformat())
+        )
+
+    def reach(self, job, due_at, user):
+        """Record that a run is messaging `user`; return False if the run already did.
+
+        Also renews the run's lease.
+        """
+        reached = self._connection().execute(
+            'INSERT OR IGNORE INTO job_run_users (job, due_at, user, reached_at) VALUES (?, ?, ?, ?)',
+            (job, due_at.isoformat(), user, time.time())
+        ).rowcount == 1
+        self.renew(job, due_at)
+        return reached
+
+    def finish(self, job, due_at, succeeded, error=None, detail=None):
+        """Record the outcome of a run; `detail` is an optional JSON-serializable summary."""
+        self._connection().execute(
+            'UPDATE job_runs SET status = ?, finished_at = ?, error = ?, detail = ?, claimed_until = 0 '
+            'WHERE job = ? AND due_at = ?',
+            ('succeeded' if succeeded else 'failed', time.time(), error,
+             json.dumps(detail) if detail is not None else None, job, due_at.isoformat())
+        )
+
+    def recent(self, limit=20):
+        rows = self._connection().execute(
+            'SELECT job, due_at, status, started_at, finished_at, error, detail FROM job_runs '
+            'ORDER BY started_at DESC LIMIT ?', (limit,)
+        ).fetchall()
+        return [
+            dict(zip(('job', 'due_at', 'status', 'started_at', 'finished_at', 'error', 'detail'),
+                     row[:6] + (json.loads(row[6]) if row[6] else None,)))
+            for row in rows
+        ]
+
+
+class FanOutJob:
+    """A daily job run once per user, at the same local time in each user's timezone.
+
+    Users are grouped into buckets by timezone. Each bucket has its own
+    DailySchedule and its own ledger entry ("name:tz"), so it fires at its
+    local time and is caught up or skipped like any other job. The users in
+    a bucket are sent to by at most `workers` threads at once, and no more
+    than `rate` users are started per second, so however large the bucket
+    is the requests towards the Graph API stay within its rate budget.
+
+    `users` is read on every check, so it must be the registry the webhook
+    registers senders into; the scheduler runs in the web workers for that
+    reason.
+    """
+
+    def __init__(self, name, fn, users, at, weekdays=range(7), max_lateness=timedelta(hours=1),
+                 workers=DEFAULT_FANOUT_WORKERS, rate=None):
+        self.name = name
+        self.fn = fn  # fn(user) -> bool, False when there was nothing to send
+        self.users = users  # users() -> every user, each with a .timezone
+        self.at = at
+        self.weekdays = weekdays
+        self.max_lateness = max_lateness
+        self.workers = workers
+        self.rate = rate  # users per second, None for no limit
+        self._schedules = {}  # tz -> DailySchedule, or None for an unknown timezone
+
+    def schedule(self, tz):
+        if tz not in self._schedules:
+            try:
+                self._schedules[tz] = DailySchedule(self.at, self.weekdays, tz)
+            except (ValueError, ZoneInfoNotFoundError):
+                logger.warning("Skipping users with unknown timezone %r for %s", tz, self.name)
+                self._schedules[tz] = None
+        return self._schedules[tz]
+
+    def schedules(self):
+        """Schedules of every bucket seen so far."""
+        return [schedule for schedule in self._schedules.values() if schedule is not None]
+
+    def buckets(self):
+        """Group users by timezone: {tz: [user, ...]}."""
+        buckets = {}
+        for user in self.users():
+            buckets.setdefault(user.timezone, []).append(user)
+        return buckets
+
+    def _wait_for_slot(self):
+        """Space user starts 1/rate seconds apart across the bucket's workers."""
+        with self._pace_lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1 / self.rate
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _run_one(self, user, reach):
+        # Recorded before sending, so a run taken over never messages this user again
+        if reach is not None and not reach(getattr(user, 'wa_id', user)):
+            return 'already_reached'
+        if self.rate:
+            self._wait_for_slot()
+        try:
+            return 'sent' if self.fn(user) else 'not_sent'
+        except Exception:
+            logger.exception("%s failed for %s", self.name, getattr(user, 'wa_id', user))
+            return 'errors'
+
+    def run_bucket(self, users, reach=None):
+        """Run the job for every user in a bucket; return a summary of the outcomes.
+
+        `reach(user_id)` records each user as they are started and returns
+        False for a user an earlier run of this bucket already reached.
+        """
+        start = time.monotonic()
+        self._pace_lock = threading.Lock()
+        self._next_slot = start
+        detail = {'users': len(users), 'sent': 0, 'not_sent': 0, 'errors': 0, 'already_reached': 0}
+        with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(users))),
+                                thread_name_prefix=f"fanout-{self.name}") as pool:
+            for outcome in pool.map(lambda user: self._run_one(user, reach), users):
+                detail[outcome] += 1
+        detail['seconds'] = round(time.monotonic() - start, 3)
+        return detail
+
+
+class Scheduler:
+    """Runs jobs in-process at their scheduled times, recorded in a RunLedger.
+
+    On each check, every job's most recent due time is looked up. If it is
+    no older than the job's `max_lateness` and the ledger has no run for it,
+    the job runs now. A missed run (the worker was down or restarting) is
+    therefore caught up once when the worker comes back, while a run that
+    already happened is never repeated. Only the latest missed run of each
+    job is caught up. A run cut short by its worker dying is taken over once
+    its ledger lease runs out.
+
+    `start` runs it on a daemon thread of the web worker, so jobs see the
+    same conversation state and users as the webhook. Every worker that
+    starts one shares the ledger, so each due time still runs once.
+    """
+
+    def __init__(self, ledger, tick=DEFAULT_TICK, clock=lambda: datetime.now(timezone.utc)):
+        self._ledger = ledger
+        self._tick = tick
+        self._clock = clock
+        self._jobs = []
+        self._fanouts = []
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def add_job(self, name, fn, schedule, max_lateness=timedelta(hours=1)):
+        self._jobs.append((name, fn, schedule, max_lateness))
+        logger.info("Scheduled %s: %r (catch-up window %s)", name, schedule, max_lateness)
+        return self
+
+    def add_fanout(self, job):
+        """Add a FanOutJob, run per timezone bucket of its users."""
+        self._fanouts.append(job)
+        logger.info("Scheduled %s: %s local time on weekdays %s, per timezone "
+                    "(catch-up window %s, %d workers, %s users/s)",
+                    job.name, job.at, sorted(job.weekdays), job.max_lateness, job.workers, job.rate or 'unlimited')
+        return self
+
+    def _due(self, name, schedule, max_lateness, now):
+        """The due time to run `name` for now, if it is due and was claimed by this call."""
+        due_at = schedule.latest(now)
+        if due_at is None or now - due_at > max_lateness:
+            return None
+        if not self._ledger.claim(name, due_at):
+            return None
+        return due_at
+
+    def run_pending(self):
+        """Run every job or bucket that is due and not yet in the ledger; return [(name, due_at, succeeded)]."""
+        now = self._clock()
+        ran = []
+        for name, fn, schedule, max_lateness in self._jobs:
+            due_at = self._due(name, schedule, max_lateness, now)
+            if due_at is None:
+                continue
+
+            logger.info("Running %s for %s (%s late)", name, due_at.isoformat(), now - due_at)
+            error = None
+            try:
+                succeeded = bool(fn())
+            except Exception as e:
+                logger.exception("Scheduled job %s failed", name)
+                succeeded, error = False, str(e)
+            self._ledger.finish(name, due_at, succeeded, error)
+            ran.append((name, due_at, succeeded))
+
+        for job in self._fanouts:
+            for tz, users in job.buckets().items():
+                schedule = job.schedule(tz)
+                if schedule is None:
+                    continue
+                name = f"{job.name}:{tz}"
+                due_at = self._due(name, schedule, job.max_lateness, now)
+                if due_at is None:
+                    continue
+
+                logger.info("Running %s for %d user(s) due %s (%s late)",
+                            name, len(users), due_at.isoformat(), now - due_at)
+                detail = job.run_bucket(users, partial(self._ledger.reach, name, due_at))
+                succeeded = detail['errors'] == 0
+                error = None if succeeded else f"{detail['errors']} of {detail['users']} user(s) raised"
+                self._ledger.finish(name, due_at, succeeded, error, detail)
+                logger.info("Finished %s in %.1f s: %s", name, detail['seconds'], detail)
+                ran.append((name, due_at, succeeded))
+        return ran
+
+    def seconds_until_next(self):
+        now = self._clock()
+        schedules = [schedule for _, _, schedule, _ in self._jobs]
+        schedules += [schedule for job in self._fanouts for schedule in job.schedules()]
+        upcoming = [schedule.next(now) for schedule in schedules]
+        upcoming = [due_at for due_at in upcoming if due_at is not None]
+        if not upcoming:
+            return self._tick
+        return max(0.0, min(self._tick, (min(upcoming) - now).total_seconds()))
+
+    def start(self):
+        """Run the scheduler on a daemon thread (started again in a forked child)."""
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self.run_forever, name='scheduler', daemon=True).start()
+            self._pid = os.getpid()
+
+    def stats(self):
+        """Users per timezone bucket of each fan-out job, as the next check sees them, and the latest runs."""
+        return {
+            'running': self._pid == os.getpid(),
+            'jobs': [name for name, _, _, _ in self._jobs],
+            'fanouts': {job.name: {tz: len(users) for tz, users in job.buckets().items()} for job in self._fanouts},
+            'recent_runs': self._ledger.recent(),
+        }
+
+    def run_forever(self):
+        logger.info("Scheduler started with %d job(s) and %d fan-out job(s)", len(self._jobs), len(self._fanouts))
+        while True:
+            try:
+                self.run_pending()
+            except Exception:
+                logger.exception("Scheduler check failed")
+            time.sleep(self.seconds_until_next())
+
+
+def build_scheduler(handler):
+    """Scheduler for the app's three recurring messages, sent to every registered
+    user at their local time, configured from the environment.
+
+    `handler` is the webhook_handler module, passed in so the scheduler
+    module itself has no app dependencies.
+    """
+    weekdays = range(5)  # Plans cover Monday to Friday
+    workers = int(os.environ.get('FANOUT_WORKERS', DEFAULT_FANOUT_WORKERS))
+    rate = float(os.environ.get('FANOUT_USERS_PER_SECOND', DEFAULT_FANOUT_RATE))
+    ledger = RunLedger(os.environ.get('SCHEDULER_DB_PATH', 'data/scheduler.db'))
+    return (
+        Scheduler(ledger)
+        .add_fanout(FanOutJob('morning_checkin', handler.run_morning_checkin, handler.USERS.all,
+                              os.environ.get('MORNING_CHECKIN_TIME', '08:00'), weekdays,
+                              max_lateness=timedelta(hours=2), workers=workers, rate=rate))
+        .add_fanout(FanOutJob('status_request', handler.send_status_request, handler.USERS.all,
+                              os.environ.get('STATUS_REQUEST_TIME', '18:00'), weekdays,
+                              max_lateness=timedelta(hours=3), workers=workers, rate=rate))
+        .add_fanout(FanOutJob('sunday_planning', handler.send_sunday_planning_message, handler.USERS.all,
+                              os.environ.get('SUNDAY_PLANNING_TIME', '18:00'), [6],
+                              max_lateness=timedelta(hours=6), workers=workers, rate=rate))
+    )
+
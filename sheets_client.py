@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+import httplib2
+from google.auth.exceptions import TransportError
+from google.auth.transport.requests import Request
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build_from_document
+from googleapiclient.discovery_cache import get_static_doc
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpRequest
+
+logger = logging.getLogger(__name__)
+
+# Refresh the access token this long before it actually expires
+DEFAULT_REFRESH_MARGIN = 300  # 5 minutes in seconds
+
+
+def is_sheets_outage(error):
+    """Whether a Sheets call failure says the API is unhealthy rather than the request being wrong."""
+    if isinstance(error, HttpError):
+        return error.resp.status >= 500 or error.resp.status == 429
+    # Network errors and timeouts (socket errors are OSErrors), including while refreshing the token
+    return isinstance(error, (OSError, httplib2.HttpLib2Error, TransportError))
+
+
+def guarded_request_builder(dependency):
+    """An HttpRequest class whose `execute` goes through a dependency_health.Dependency."""
+
+    class GuardedHttpRequest(HttpRequest):
+        def execute(self, http=None, num_retries=0):
+            return dependency.call(super().execute, http=http, num_retries=num_retries)
+
+    return GuardedHttpRequest
+
+
+class SheetsClientHolder:
+    """Long-lived holder for the Google Sheets client of one worker process.
+
+    Credentials are loaded once and the Sheets service is built from the
+    discovery document bundled with googleapiclient, so no request pays for a
+    credential parse or a discovery fetch. httplib2 connections are not
+    thread-safe, so each thread gets its own service object on top of the
+    shared credentials.
+
+    With a `timeout`, every request gives up after that many seconds instead
+    of httplib2's default of 60. With a `dependency`, every `execute()` is
+    timed and guarded by its circuit breaker.
+    """
+
+    def __init__(self, credentials_loader, refresh_margin=DEFAULT_REFRESH_MARGIN, timeout=None, dependency=None):
+        self._credentials_loader = credentials_loader
+        self._refresh_margin = refresh_margin
+        self._timeout = timeout
+        self._request_builder = guarded_request_builder(dependency) if dependency else HttpRequest
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._pid = os.getpid()
+        self._credentials = None
+        self._discovery_doc = None
+        self._generation = 0
+        self._stats = {
+            'credential_loads': 0,
+            'builds': 0,
+            'refreshes': 0,
+            'refresh_failures': 0,
+        }
+
+    def get_service(self):
+        """Return a ready-to-use Sheets service for the calling thread."""
+        self._reset_after_fork()
+        credentials = self._get_credentials()
+        self._refresh_if_needed(credentials)
+
+        service = getattr(self._local, 'service', None)
+        if service is None or self._local.generation != self._generation:
+            if self._timeout is not None:
+                http = AuthorizedHttp(credentials, http=httplib2.Http(timeout=self._timeout))
+                service = build_from_document(self._discovery_doc, http=http, requestBuilder=self._request_builder)
+            else:
+                service = build_from_document(self._discovery_doc, credentials=credentials,
+                                              requestBuilder=self._request_builder)
+            self._local.service = service
+            self._local.generation = self._generation
+            with self._lock:
+                self._stats['builds'] += 1
+            logger.info("Built Google Sheets service for thread %s", threading.current_thread().name)
+        return service
+
+    def reset(self):
+        """Drop cached credentials and services so the next call starts fresh."""
+        with self._lock:
+            self._credentials = None
+            self._generation += 1
+
+    def stats(self):
+        """Return build/refresh counters and the current token expiry."""
+        with self._lock:
+            stats = dict(self._stats)
+            credentials = self._credentials
+        expiry = getattr(credentials, 'expiry', None) if credentials else None
+        stats['token_expiry'] = expiry.isoformat() if expiry else None
+        stats['pid'] = self._pid
+        return stats
+
+    def _reset_after_fork(self):
+        # gunicorn with --preload forks after import; never share a client across processes
+        if os.getpid() != self._pid:
+            with self._lock:
+                self._pid = os.getpid()
+                self._credentials = None
+                self._generation += 1
+                self._local = threading.local()
+
+    def _get_credentials(self):
+        credentials = self._credentials
+        if credentials is not None:
+            return credentials
+        with self._lock:
+            if self._credentials is None:
+                if self._discovery_doc is None:
+                    self._discovery_doc = json.loads(get_static_doc('sheets', 'v4'))
+                self._credentials = self._credentials_loader()
+                self._stats['credential_loads'] += 1
+            return self._credentials
+
+    def _needs_refresh(self, credentials):
+        if not credentials.token:
+            return True
+        if credentials.expiry is None:
+            return False
+        now = datetime.now(timezone.utc).replace(tzinfo=None)  # google-auth uses naive UTC
+        return (credentials.expiry - now).total_seconds() <= self._refresh_margin
+
+    def _refresh_if_needed(self, credentials):
+        if not self._needs_refresh(credentials):
+            return
+        with self._lock:
+            # Another thread may have refreshed while we were waiting for the lock
+            if not self._needs_refresh(credentials):
+                return
+            try:
+                credentials.refresh(Request())
+                self._stats['refreshes'] += 1
+                logger.info("Refreshed Google access token, expires at %s", credentials.expiry)
+            except Exception:
+                self._stats['refresh_failures'] += 1
+                raise
@@ -0,0 +1,341 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import NamedTuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 5  # seconds
+DEFAULT_FLUSH_BATCH = 500  # journal entries per spreadsheet per batchUpdate
+DEFAULT_LEASE = 120  # seconds a flushing process owns a spreadsheet's entries
+DEFAULT_MAX_ATTEMPTS = 5  # failed flushes (not counting outages) before an entry is parked
+
+APPEND, UPDATE, UPDATE_AT = 'append', 'update', 'update_at'
+
+
+class JournalEntry(NamedTuple):
+    id: int
+    wa_id: str
+    sheet: str
+    kind: str  # APPEND, UPDATE or UPDATE_AT
+    data: dict  # {'rows': [...]}, {'row': n, 'cells': {column index: value}} or {'key': key, 'cells': {...}}
+
+
+def cell_data(value):
+    """A CellData for a value written as-is, like valueInputOption=RAW."""
+    if value is None or value == '':
+        return {}
+    if isinstance(value, bool):
+        return {'userEnteredValue': {'boolValue': value}}
+    if isinstance(value, (int, float)):
+        return {'userEnteredValue': {'numberValue': value}}
+    return {'userEnteredValue': {'stringValue': str(value)}}
+
+
+def coalesce(entries, sheet_id):
+    """Turn journal entries for one spreadsheet into the requests of a single batchUpdate.
+
+    Appends to the same sheet become one appendCells, in journal order.
+    Updates to the same cell keep only the last value. `sheet_id` maps a
+    sheet title to its sheetId. UPDATE_AT entries must have been resolved to
+    UPDATE entries first.
+    """
+    appends = {}
+    cells = {}
+    for entry in entries:
+        if entry.kind == APPEND:
+            appends.setdefault(entry.sheet, []).extend(entry.data['rows'])
+        else:
+            for column, value in entry.data['cells'].items():
+                cells[(entry.sheet, entry.data['row'], int(column))] = value
+
+    requests = [
+        {'appendCells': {
+            'sheetId': sheet_id(sheet),
+            'rows': [{'values': [cell_data(value) for value in row]} for row in rows],
+            'fields': 'userEnteredValue',
+        }}
+        for sheet, rows in appends.items()
+    ]
+    requests.extend(
+        {'updateCells': {
+            'start': {'sheetId': sheet_id(sheet), 'rowIndex': row - 1, 'columnIndex': column},
+            'rows': [{'values': [cell_data(value)]}],
+            'fields': 'userEnteredValue',
+        }}
+        for (sheet, row, column), value in cells.items()
+    )
+    return requests
+
+
+class SheetsWriteJournal:
+    """Write-behind journal of Google Sheets writes in a WAL-mode SQLite file.
+
+    Callers record appended rows and cell updates, which are on disk once the
+    call returns, so the user can be answered straight away. A background
+    flusher hands each spreadsheet's entries to `flush_fn(spreadsheet_id,
+    entries)` every `flush_interval` seconds, which writes them in a single
+    batchUpdate, and deletes them once that succeeds. Entries left by a
+    crash or restart are flushed when the journal starts.
+
+    Every worker on the host shares the file. A flusher leases a
+    spreadsheet's entries before writing them, and never while another
+    lease on that spreadsheet is live, so writes to one spreadsheet go out
+    in order. A write that fails because Sheets is unavailable (`is_outage`)
+    is simply retried on the next flush. After any other failure the batch
+    is written again in halves, down to single entries, so only the entries
+    that fail on their own count an attempt; they are parked after
+    `max_attempts` and kept for inspection. Later entries for the sheet of
+    an entry that failed are held back with it until it is written or
+    parked, so an older value never overwrites a newer one.
+    A crash between the write and the delete replays the entries, so delivery
+    is at least once.
+    """
+
+    def __init__(self, path, flush_fn, flush_interval=DEFAULT_FLUSH_INTERVAL, flush_batch=DEFAULT_FLUSH_BATCH,
+                 lease=DEFAULT_LEASE, max_attempts=DEFAULT_MAX_ATTEMPTS, is_outage=lambda error: False):
+        self._path = path
+        self._flush_fn = flush_fn
+        self._flush_interval = flush_interval
+        self._flush_batch = flush_batch
+        self._lease = lease
+        self._max_attempts = max_attempts
+        self._is_outage = is_outage
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flush_event = threading.Event()
+        self._pid = None
+        self._stats = {
+            'recorded': 0,
+            'flushes': 0,
+            'entries_flushed': 0,
+            'failed_flushes': 0,
+            'failed_entries': 0,
+            'outages': 0,
+        }
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._create_schema()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')  # An acknowledged write must survive a power cut
+            connection.execute('PRAGMA busy_timeout=5000')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS sheet_writes ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, spreadsheet_id TEXT NOT NULL, wa_id TEXT, '
+            'sheet TEXT NOT NULL, kind TEXT NOT NULL, data TEXT NOT NULL, created_at REAL NOT NULL, '
+            'attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, '
+            'claim TEXT, claimed_until REAL NOT NULL DEFAULT 0)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS sheet_writes_spreadsheet ON sheet_writes (spreadsheet_id, id)')
+        connection.execute('CREATE INDEX IF NOT EXISTS sheet_writes_claim ON sheet_writes (claim)')
+
+    def append_rows(self, spreadsheet_id, sheet, rows, wa_id=None):
+        """Record rows to append after the last row of a sheet."""
+        self._record(spreadsheet_id, sheet, APPEND, {'rows': [list(row) for row in rows]}, wa_id)
+
+    def update_cells(self, spreadsheet_id, sheet, row_number, cells, wa_id=None):
+        """Record cell values for one row; `cells` maps 0-indexed column positions to values."""
+        self._record(spreadsheet_id, sheet, UPDATE, {'row': row_number, 'cells': cells}, wa_id)
+
+    def update_cells_at(self, spreadsheet_id, sheet, key, cells, wa_id=None):
+        """Record cell values for the row identified by `key` (such as a plan date).
+
+        Use this when the row number cannot be looked up yet; `flush_fn`
+        resolves the key to a row when the entry is flushed.
+        """
+        self._record(spreadsheet_id, sheet, UPDATE_AT, {'key': key, 'cells': cells}, wa_id)
+
+    def _record(self, spreadsheet_id, sheet, kind, data, wa_id):
+        self._ensure_flusher()
+        self._connection().execute(
+            'INSERT INTO sheet_writes (spreadsheet_id, wa_id, sheet, kind, data, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (spreadsheet_id, wa_id, sheet, kind, json.dumps(data), time.time())
+        )
+        with self._lock:
+            self._stats['recorded'] += 1
+
+    def start(self):
+        """Start the flusher now, replaying whatever an earlier process left in the journal."""
+        self._ensure_flusher()
+        self._flush_event.set()
+
+    def flush(self):
+        """Write each spreadsheet's pending entries in one batchUpdate; return the number written."""
+        with self._flush_lock:
+            now = time.time()
+            spreadsheet_ids = [row[0] for row in self._connection().execute(
+                'SELECT DISTINCT spreadsheet_id FROM sheet_writes WHERE attempts < ? AND claimed_until <= ?',
+                (self._max_attempts, now)
+            ).fetchall()]
+            written = 0
+            for spreadsheet_id in spreadsheet_ids:
+                claim, entries = self._claim(spreadsheet_id)
+                if not entries:
+                    continue
+                try:
+                    written += self._write(spreadsheet_id, claim, entries, blocked=set())
+                except Exception as e:
+                    # Whatever is still claimed was not written
+                    self._release(claim, e, count_attempt=False)
+                    if not self._is_outage(e):
+                        raise
+                    with self._lock:
+                        self._stats['outages'] += 1
+                    logger.warning("Sheets unavailable, keeping journaled writes to %s: %s", spreadsheet_id, e)
+                    break  # Every spreadsheet goes through the same API; try again next flush
+            return written
+
+    def _write(self, spreadsheet_id, claim, entries, blocked):
+        """Write claimed entries and delete them; return the number written.
+
+        If the write fails for a reason other than an outage, the two halves
+        are written separately, so an entry that cannot be written does not
+        hold back the others, except later ones for the same sheet: its
+        sheet goes into `blocked`, and their claim is given back unwritten.
+        An outage is raised, leaving the unwritten entries claimed.
+        """
+        held = [entry.id for entry in entries if entry.sheet in blocked]
+        if held:
+            self._release(claim, 'held back behind a failed earlier write to its sheet',
+                          count_attempt=False, ids=held)
+            entries = [entry for entry in entries if entry.sheet not in blocked]
+            if not entries:
+                return 0
+        try:
+            self._flush_fn(spreadsheet_id, entries)
+        except Exception as e:
+            if self._is_outage(e):
+                raise
+            with self._lock:
+                self._stats['failed_flushes'] += 1
+            if len(entries) == 1:
+                with self._lock:
+                    self._stats['failed_entries'] += 1
+                logger.exception("Failed to flush journaled write %d to %s", entries[0].id, spreadsheet_id)
+                self._release(claim, e, count_attempt=True, ids=[entries[0].id])
+                blocked.add(entries[0].sheet)
+                return 0
+            logger.warning("Failed to flush %d journaled write(s) to %s, retrying in halves: %s",
+                           len(entries), spreadsheet_id, e)
+            # The first half is settled before the second is tried, so blocking follows journal order
+            middle = len(entries) // 2
+            return self._write(spreadsheet_id, claim, entries[:middle], blocked) + \
+                self._write(spreadsheet_id, claim, entries[middle:], blocked)
+        ids = [entry.id for entry in entries]
+        self._connection().execute(
+            f"DELETE FROM sheet_writes WHERE id IN ({', '.join('?' * len(ids))})", ids
+        )
+        with self._lock:
+            self._stats['flushes'] += 1
+            self._stats['entries_flushed'] += len(entries)
+        return len(entries)
+
+    def _claim(self, spreadsheet_id):
+        now = time.time()
+        claim = uuid.uuid4().hex
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            leased = connection.execute(
+                'SELECT 1 FROM sheet_writes WHERE spreadsheet_id = ? AND claimed_until > ? LIMIT 1',
+                (spreadsheet_id, now)
+            ).fetchone()
+            if not leased:
+                connection.execute(
+                    'UPDATE sheet_writes SET claim = ?, claimed_until = ? WHERE id IN ('
+                    'SELECT id FROM sheet_writes WHERE spreadsheet_id = ? AND attempts < ? ORDER BY id LIMIT ?)',
+                    (claim, now + self._lease, spreadsheet_id, self._max_attempts, self._flush_batch)
+                )
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            raise
+        if leased:
+            return claim, []
+        rows = connection.execute(
+            'SELECT id, wa_id, sheet, kind, data FROM sheet_writes WHERE claim = ? ORDER BY id', (claim,)
+        ).fetchall()
+        return claim, [JournalEntry(id, wa_id, sheet, kind, json.loads(data)) for id, wa_id, sheet, kind, data in rows]
+
+    def _release(self, claim, error, count_attempt, ids=None):
+        """Give back claimed entries (only `ids`, if given), counting an attempt against them if asked."""
+        where, params = 'claim = ?', [claim]
+        if ids is not None:
+            where += f" AND id IN ({', '.join('?' * len(ids))})"
+            params.extend(ids)
+        connection = self._connection()
+        parked = 0
+        if count_attempt:
+            parked = connection.execute(
+                f'SELECT COUNT(*) FROM sheet_writes WHERE {where} AND attempts + 1 >= ?', params + [self._max_attempts]
+            ).fetchone()[0]
+        connection.execute(
+            'UPDATE sheet_writes SET claim = NULL, claimed_until = 0, last_error = ?, '
+            f'attempts = attempts + ? WHERE {where}',
+            [str(error)[:500], 1 if count_attempt else 0] + params
+        )
+        if parked:
+            logger.error("Parked %d journaled Sheets write(s) after %d failed attempts: %s",
+                         parked, self._max_attempts, error)
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            threading.Thread(target=self._run_flusher, name='sheets-journal', daemon=True).start()
+            self._pid = os.getpid()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        if self._pid == os.getpid():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush Sheets write journal %s at exit", self._path)
+
+    def _run_flusher(self):
+        while True:
+            self._flush_event.wait(self._flush_interval)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush Sheets write journal %s", self._path)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        connection = self._connection()
+        pending, oldest = connection.execute(
+            'SELECT COUNT(*), MIN(created_at) FROM sheet_writes WHERE attempts < ?', (self._max_attempts,)
+        ).fetchone()
+        stats['pending'] = pending
+        stats['oldest_pending_seconds'] = round(time.time() - oldest, 3) if oldest else None
+        stats['parked'] = connection.execute(
+            'SELECT COUNT(*) FROM sheet_writes WHERE attempts >= ?', (self._max_attempts,)
+        ).fetchone()[0]
+        stats['flush_interval'] = self._flush_interval
+        stats['path'] = self._path
+        return stats
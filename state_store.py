@@ -0,0 +1,270 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+
+from ttl_cache import TTLDedupeCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_FLUSH_INTERVAL = 0.5  # seconds
+DEFAULT_FLUSH_BATCH = 100  # pending writes
+PURGE_INTERVAL = 60  # seconds between deletes of expired rows
+
+
+class StateBackend(ABC):
+    """Storage for short-lived conversation state shared by request handlers.
+
+    Holds two kinds of state: processed message IDs used for webhook
+    dedupe, and small JSON values grouped by namespace (check-ins, daily
+    energy levels), both with TTL expiry.
+    """
+
+    @abstractmethod
+    def seen_message(self, message_id):
+        """Record a message ID and return True if it was already processed."""
+
+    @abstractmethod
+    def forget_message(self, message_id):
+        """Forget a message ID so a redelivery is processed again."""
+
+    @abstractmethod
+    def put(self, namespace, key, value, ttl=None):
+        """Store a JSON-serializable value, expiring after `ttl` seconds if given."""
+
+    @abstractmethod
+    def get(self, namespace, key, default=None):
+        """Return a stored value, or `default` if it is missing or expired."""
+
+    def stats(self):
+        return {'backend': type(self).__name__}
+
+
+class MemoryStateBackend(StateBackend):
+    """Per-process state; only correct with a single worker."""
+
+    def __init__(self, message_ttl, message_max_size):
+        self._messages = TTLDedupeCache(ttl=message_ttl, max_size=message_max_size)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def seen_message(self, message_id):
+        return self._messages.seen(message_id)
+
+    def forget_message(self, message_id):
+        self._messages.discard(message_id)
+
+    def put(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._values[(namespace, key)] = (value, expires_at)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            value, expires_at = self._values.get((namespace, key), (default, None))
+            if expires_at is not None and expires_at <= time.time():
+                del self._values[(namespace, key)]
+                return default
+            return value
+
+    def stats(self):
+        stats = super().stats()
+        stats['messages'] = len(self._messages)
+        stats['values'] = len(self._values)
+        return stats
+
+
+class SQLiteStateBackend(StateBackend):
+    """State shared by every worker on one host through a WAL-mode SQLite file.
+
+    Message dedupe is write-through, since an INSERT OR IGNORE is what makes
+    check-and-insert atomic across workers. IDs this process has already seen
+    are answered from a local cache without touching the database. Namespaced
+    values are buffered (and visible to this process straight away) and
+    written in batches by a background flusher, which also deletes expired
+    rows.
+    """
+
+    def __init__(self, path, message_ttl, message_max_size,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, flush_batch=DEFAULT_FLUSH_BATCH):
+        self._path = path
+        self._message_ttl = message_ttl
+        self._flush_interval = flush_interval
+        self._flush_batch = flush_batch
+        self._local_messages = TTLDedupeCache(ttl=message_ttl, max_size=message_max_size)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._pending = {}  # (namespace, key) -> (json value, expires_at)
+        self._flushing = {}  # Writes taken by an in-progress flush
+        self._flush_event = threading.Event()
+        self._flusher = None
+        self._pid = None
+        self._last_purge = 0.0
+        self._stats = {'message_checks': 0, 'local_hits': 0, 'flushes': 0, 'rows_flushed': 0, 'rows_expired': 0}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._create_schema()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute('PRAGMA busy_timeout=5000')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def _create_schema(self):
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS seen_messages ('
+            'message_id TEXT PRIMARY KEY, expires_at REAL NOT NULL)'
+        )
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS state_values ('
+            'namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, expires_at REAL, '
+            'PRIMARY KEY (namespace, key))'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS seen_messages_expiry ON seen_messages (expires_at)')
+
+    def seen_message(self, message_id):
+        if message_id in self._local_messages:
+            with self._lock:
+                self._stats['local_hits'] += 1
+            return True
+        with self._lock:
+            self._stats['message_checks'] += 1
+
+        now = time.time()
+        expires_at = now + self._message_ttl
+        connection = self._connection()
+        inserted = connection.execute(
+            'INSERT OR IGNORE INTO seen_messages (message_id, expires_at) VALUES (?, ?)',
+            (message_id, expires_at)
+        ).rowcount
+        if not inserted:
+            # Present already; treat it as new only if that entry has expired
+            inserted = connection.execute(
+                'UPDATE seen_messages SET expires_at = ? WHERE message_id = ? AND expires_at <= ?',
+                (expires_at, message_id, now)
+            ).rowcount
+        self._local_messages.seen(message_id)
+        return not inserted
+
+    def forget_message(self, message_id):
+        self._local_messages.discard(message_id)
+        self._connection().execute('DELETE FROM seen_messages WHERE message_id = ?', (message_id,))
+
+    def put(self, namespace, key, value, ttl=None):
+        expires_at = time.time() + ttl if ttl else None
+        self._ensure_flusher()
+        with self._lock:
+            self._pending[(namespace, key)] = (json.dumps(value), expires_at)
+            if len(self._pending) >= self._flush_batch:
+                self._flush_event.set()
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            pending = self._pending.get((namespace, key)) or self._flushing.get((namespace, key))
+        if pending is not None:
+            value, expires_at = pending
+        else:
+            row = self._connection().execute(
+                'SELECT value, expires_at FROM state_values WHERE namespace = ? AND key = ?',
+                (namespace, key)
+            ).fetchone()
+            if row is None:
+                return default
+            value, expires_at = row
+        if expires_at is not None and expires_at <= time.time():
+            return default
+        return json.loads(value)
+
+    def flush(self):
+        """Write pending values in one transaction and delete expired rows."""
+        now = time.time()
+        with self._lock:
+            if not self._pending and now - self._last_purge < PURGE_INTERVAL:
+                return
+            pending, self._pending = self._pending, {}
+            self._flushing = pending
+        connection = self._connection()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            if pending:
+                connection.executemany(
+                    'INSERT OR REPLACE INTO state_values (namespace, key, value, expires_at) VALUES (?, ?, ?, ?)',
+                    [(namespace, key, value, expires_at) for (namespace, key), (value, expires_at) in pending.items()]
+                )
+            expired = connection.execute('DELETE FROM seen_messages WHERE expires_at <= ?', (now,)).rowcount
+            expired += connection.execute(
+                'DELETE FROM state_values WHERE expires_at IS NOT NULL AND expires_at <= ?', (now,)
+            ).rowcount
+            connection.execute('COMMIT')
+        except Exception:
+            if connection.in_transaction:
+                connection.execute('ROLLBACK')
+            with self._lock:
+                # Keep the failed writes unless newer values arrived meanwhile
+                for item, entry in pending.items():
+                    self._pending.setdefault(item, entry)
+                self._flushing = {}
+            raise
+        self._last_purge = now
+        with self._lock:
+            self._flushing = {}
+            self._stats['flushes'] += 1
+            self._stats['rows_flushed'] += len(pending)
+            self._stats['rows_expired'] += expired
+
+    def _ensure_flusher(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._flusher = threading.Thread(target=self._run_flusher, name='state-flusher', daemon=True)
+            self._flusher.start()
+            self._pid = os.getpid()
+            atexit.register(self._flush_at_exit)
+
+    def _flush_at_exit(self):
+        if self._pending and self._pid == os.getpid():
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush state to %s at exit", self._path)
+
+    def _run_flusher(self):
+        while True:
+            self._flush_event.wait(self._flush_interval)
+            self._flush_event.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Failed to flush state to %s", self._path)
+
+    def stats(self):
+        stats = super().stats()
+        with self._lock:
+            stats.update(self._stats)
+            stats['pending_writes'] = len(self._pending)
+        stats['path'] = self._path
+        return stats
+
+
+def create_state_backend(kind, path, message_ttl, message_max_size):
+    """Build the configured state backend ('sqlite' or 'memory')."""
+    if kind == 'memory':
+        return MemoryStateBackend(message_ttl, message_max_size)
+    if kind == 'sqlite':
+        return SQLiteStateBackend(path, message_ttl, message_max_size)
+    raise ValueError(f"Unknown state backend: {kind!r}")
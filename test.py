@@ -0,0 +1,67 @@
+import os
+import tempfile
+import unittest
+
+from sheets_journal import SheetsWriteJournal, coalesce
+
+
+class FakeSpreadsheet:
+    """Applies coalesced journal entries to a dict of cells; writing a value in `failing` raises."""
+
+    def __init__(self):
+        self.cells = {}  # (sheet, row, column) -> value
+        self.failing = set()
+
+    def flush(self, spreadsheet_id, entries):
+        for entry in entries:
+            if not self.failing.isdisjoint(entry.data['cells'].values()):
+                raise LookupError(f"Could not find row {entry.data['row']} in {entry.sheet}")
+        for request in coalesce(entries, lambda title: title):
+            update = request['updateCells']
+            start = update['start']
+            value = update['rows'][0]['values'][0]['userEnteredValue']['stringValue']
+            self.cells[(start['sheetId'], start['rowIndex'] + 1, start['columnIndex'])] = value
+
+
+class SheetsWriteJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.sheets = FakeSpreadsheet()
+        self.journal = SheetsWriteJournal(
+            os.path.join(tempfile.mkdtemp(), 'journal.db'), self.sheets.flush, flush_interval=3600, max_attempts=3
+        )
+
+    def test_last_writer_wins_after_partial_failure(self):
+        self.journal.update_cells('spreadsheet', 'Plan', 2, {3: 'old'})
+        self.journal.update_cells('spreadsheet', 'Other', 5, {1: 'other'})
+        self.journal.update_cells('spreadsheet', 'Plan', 4, {3: 'newer'})
+        self.journal.update_cells('spreadsheet', 'Plan', 2, {3: 'new'})
+
+        # The first write to Plan fails alone; later Plan writes wait for it
+        self.sheets.failing.add('old')
+        self.journal.flush()
+        self.assertEqual(self.sheets.cells, {('Other', 5, 1): 'other'})
+        self.assertEqual(self.journal.stats()['pending'], 3)
+
+        self.sheets.failing.clear()
+        self.journal.flush()
+        self.assertEqual(self.sheets.cells[('Plan', 2, 3)], 'new')
+        self.assertEqual(self.sheets.cells[('Plan', 4, 3)], 'newer')
+        self.assertEqual(self.journal.stats()['pending'], 0)
+
+    def test_later_writes_go_out_once_a_failing_write_is_parked(self):
+        self.journal.update_cells('spreadsheet', 'Plan', 2, {3: 'old'})
+        self.journal.update_cells('spreadsheet', 'Plan', 4, {3: 'new'})
+        self.sheets.failing.add('old')
+
+        for _ in range(3):
+            self.journal.flush()
+        self.assertEqual(self.sheets.cells, {})
+        self.assertEqual(self.journal.stats()['parked'], 1)
+
+        self.journal.flush()
+        self.assertEqual(self.sheets.cells, {('Plan', 4, 3): 'new'})
+        self.assertEqual(self.journal.stats()['pending'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_BYTES = 50 * 1024 * 1024
+
+
+class TranscriptCache:
+    """On-disk cache of voice-note transcripts and their mood analysis.
+
+    Entries are content-addressed by a hash of the audio bytes, and WhatsApp
+    media IDs point at those hashes. A media ID hit skips the download, and a
+    hash hit (the same note forwarded or redelivered under a new ID) skips the
+    transcription. When the stored entries exceed `max_bytes`, the least
+    recently used ones are evicted.
+
+    Each analysis is stored with the `analysis_version` (the lexicon
+    fingerprint) it was computed with. An analysis from another version is
+    not returned, so the caller scores the transcript again and puts the new
+    analysis.
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, analysis_version=None):
+        self._path = path
+        self._max_bytes = max_bytes
+        self._analysis_version = analysis_version
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._stats = {'media_hits': 0, 'hash_hits': 0, 'misses': 0, 'stale_analyses': 0, 'evictions': 0}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        connection = self._connection()
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS transcripts ('
+            'content_hash TEXT PRIMARY KEY, transcript TEXT NOT NULL, analysis TEXT NOT NULL, '
+            'analysis_version TEXT, size_bytes INTEGER NOT NULL, last_used REAL NOT NULL)'
+        )
+        # Caches from before analyses were versioned (or from when they were
+        # not cached) keep their transcripts; their analyses count as stale
+        columns = {row[1] for row in connection.execute('PRAGMA table_info(transcripts)')}
+        for column, definition in (('analysis', "TEXT NOT NULL DEFAULT 'null'"), ('analysis_version', 'TEXT')):
+            if column not in columns:
+                try:
+                    connection.execute(f'ALTER TABLE transcripts ADD COLUMN {column} {definition}')
+                except sqlite3.OperationalError:
+                    pass  # Added by another process in the meantime
+        connection.execute(
+            'CREATE TABLE IF NOT EXISTS media ('
+            'media_id TEXT PRIMARY KEY, content_hash TEXT NOT NULL)'
+        )
+        connection.execute('CREATE INDEX IF NOT EXISTS transcripts_last_used ON transcripts (last_used)')
+        connection.execute('CREATE INDEX IF NOT EXISTS media_content_hash ON media (content_hash)')
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get_by_media_id(self, media_id):
+        """Return {'content_hash', 'transcript', 'analysis'} for a media ID, or None.
+
+        'analysis' is None if it was computed with another analysis version.
+        """
+        row = self._connection().execute(
+            'SELECT t.content_hash, t.transcript, t.analysis, t.analysis_version FROM media m '
+            'JOIN transcripts t ON t.content_hash = m.content_hash WHERE m.media_id = ?',
+            (media_id,)
+        ).fetchone()
+        return self._hit(row, 'media_hits')
+
+    def get_by_hash(self, content_hash):
+        """Return {'content_hash', 'transcript', 'analysis'} for audio content, or None."""
+        row = self._connection().execute(
+            'SELECT content_hash, transcript, analysis, analysis_version FROM transcripts WHERE content_hash = ?',
+            (content_hash,)
+        ).fetchone()
+        return self._hit(row, 'hash_hits')
+
+    def link_media(self, media_id, content_hash):
+        """Point another media ID at already cached content."""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO media (media_id, content_hash) VALUES (?, ?)',
+            (media_id, content_hash)
+        )
+
+    def put(self, content_hash, media_id, transcript, analysis):
+        analysis_json = json.dumps(analysis)
+        size = len(transcript.encode()) + len(analysis_json)
+        connection = self._connection()
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            connection.execute(
+                'INSERT OR REPLACE INTO transcripts '
+                '(content_hash, transcript, analysis, analysis_version, size_bytes, last_used) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (content_hash, transcript, analysis_json, self._analysis_version, size, time.time())
+            )
+            if media_id:
+                connection.execute(
+                    'INSERT OR REPLACE INTO media (media_id, content_hash) VALUES (?, ?)',
+                    (media_id, content_hash)
+                )
+            evicted = self._evict(connection)
+            connection.execute('COMMIT')
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        if evicted:
+            with self._lock:
+                self._stats['evictions'] += evicted
+
+    def _evict(self, connection):
+        total = connection.execute('SELECT COALESCE(SUM(size_bytes), 0) FROM transcripts').fetchone()[0]
+        evicted = 0
+        if total <= self._max_bytes:
+            return evicted
+        for content_hash, size in connection.execute(
+            'SELECT content_hash, size_bytes FROM transcripts ORDER BY last_used'
+        ).fetchall():
+            if total <= self._max_bytes:
+                break
+            connection.execute('DELETE FROM transcripts WHERE content_hash = ?', (content_hash,))
+            connection.execute('DELETE FROM media WHERE content_hash = ?', (content_hash,))
+            total -= size
+            evicted += 1
+        return evicted
+
+    def record_miss(self):
+        with self._lock:
+            self._stats['misses'] += 1
+
+    def _hit(self, row, counter):
+        if row is None:
+            return None
+        content_hash, transcript, analysis, analysis_version = row
+        self._connection().execute(
+            'UPDATE transcripts SET last_used = ? WHERE content_hash = ?', (time.time(), content_hash)
+        )
+        stale = analysis_version != self._analysis_version
+        with self._lock:
+            self._stats[counter] += 1
+            if stale:
+                self._stats['stale_analyses'] += 1
+        return {'content_hash': content_hash, 'transcript': transcript,
+                'analysis': None if stale else json.loads(analysis)}
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        entries, size = self._connection().execute(
+            'SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM transcripts'
+        ).fetchone()
+        stats.update({'entries': entries, 'size_bytes': size, 'max_bytes': self._max_bytes,
+                      'analysis_version': self._analysis_version})
+        return stats
@@ -0,0 +1,190 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+
+logger = logging.getLogger(__name__)
+
+DEEPGRAM_OPTIONS = {
+    "punctuate": "true",
+    "model": "general",
+    "language": "en",
+    "smart_format": "true"
+}
+
+
+class TranscriptionEngine(ABC):
+    """Turns a voice note (bytes or a readable file object) into text.
+
+    `transcribe` is a coroutine run on the app's transcription event loop.
+    """
+
+    name = 'base'
+
+    @abstractmethod
+    async def transcribe(self, audio):
+        """Return the transcript of `audio`."""
+
+
+async def run_file_io(fn, *args):
+    """Run blocking file I/O in the default executor, off the event loop.
+
+    If the caller is cancelled, the I/O is let finish before the
+    cancellation propagates, so the file is not in use once the coroutine
+    has stopped and its owner can close it.
+    """
+    future = asyncio.get_running_loop().run_in_executor(None, fn, *args)
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        await asyncio.wait([future])
+        raise
+
+
+async def read_audio(audio):
+    """Return the audio as bytes, reading file objects off the event loop."""
+    if isinstance(audio, (bytes, bytearray)):
+        return bytes(audio)
+    return await run_file_io(audio.read)
+
+
+def _spill_audio(audio, audio_file):
+    if isinstance(audio, (bytes, bytearray)):
+        audio_file.write(audio)
+    else:
+        shutil.copyfileobj(audio, audio_file)
+    audio_file.flush()
+
+
+class DeepgramEngine(TranscriptionEngine):
+    """Deepgram's hosted prerecorded /listen API."""
+
+    name = 'deepgram'
+
+    def __init__(self, api_key, api_url, session_factory):
+        self._api_key = api_key
+        self._api_url = api_url
+        self._session_factory = session_factory  # Coroutine returning a shared aiohttp session
+
+    async def transcribe(self, audio):
+        if not self._api_key:
+            raise RuntimeError("DEEPGRAM_API_KEY is not set; use TRANSCRIPTION_ENGINE=local or fake instead")
+        headers = {
+            "Authorization": f"Token {self._api_key}",
+            "Content-Type": "audio/ogg"
+        }
+        # File objects are streamed by aiohttp rather than read into memory
+        session = await self._session_factory()
+        async with session.post(self._api_url, params=DEEPGRAM_OPTIONS, headers=headers, data=audio) as response:
+            if response.status != 200:
+                raise Exception(f"Deepgram returned {response.status}: {await response.text()}")
+            result = await response.json()
+        return result["results"]["channels"][0]["alternatives"][0]["transcript"]
+
+
+# Loaded once in each process of the local engine's pool
+_local_model = None
+
+
+def _load_local_model(model_name):
+    global _local_model
+    try:
+        from faster_whisper import WhisperModel
+    except ImportError:
+        raise RuntimeError(
+            "The local transcription engine needs the optional faster-whisper package "
+            "(pip install faster-whisper)"
+        )
+    _local_model = WhisperModel(model_name, device='cpu', compute_type='int8')
+
+
+def _transcribe_locally(audio_path, language):
+    # Whisper decodes OGG/Opus itself, it just wants a file
+    segments, _ = _local_model.transcribe(audio_path, language=language, beam_size=1)
+    return ' '.join(segment.text.strip() for segment in segments).strip()
+
+
+class LocalEngine(TranscriptionEngine):
+    """Offline CPU transcription with a small Whisper model in a process pool.
+
+    Each pool process loads the model once. Decoding runs outside the web
+    worker, so it neither holds the GIL nor needs network access. The note
+    is spilled to a named temporary file and only its path is sent to the
+    pool, so it is never held in memory whole. Pool processes are spawned
+    rather than forked, since the web worker runs many threads that may hold
+    locks at the time of a fork.
+    """
+
+    name = 'local'
+
+    def __init__(self, model_name='tiny.en', workers=None, language='en'):
+        self._model_name = model_name
+        self._workers = workers or os.cpu_count() or 1
+        self._language = language
+        self._pool = None
+        self._pid = None
+
+    def _executor(self):
+        if self._pool is None or self._pid != os.getpid():
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self._workers,
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_load_local_model,
+                initargs=(self._model_name,)
+            )
+            self._pid = os.getpid()
+            logger.info("Started local transcription pool (%d processes, model %s)", self._workers, self._model_name)
+        return self._pool
+
+    async def transcribe(self, audio):
+        with tempfile.NamedTemporaryFile(suffix='.ogg') as audio_file:
+            await run_file_io(_spill_audio, audio, audio_file)
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor(), _transcribe_locally, audio_file.name, self._language
+            )
+
+
+FAKE_SENTENCES = [
+    "I'm feeling good today and ready to work on the project.",
+    "Honestly a bit tired, the meeting ran late and I need more sleep.",
+    "Feeling stressed about the deadline but I will plan my tasks.",
+    "Had a great workout this morning, energy is high.",
+    "Family stuff kept me busy, I want to make progress on my goals.",
+]
+
+
+class FakeEngine(TranscriptionEngine):
+    """Deterministic stand-in for load tests: same audio, same transcript.
+
+    Sleeps `latency` seconds to model the vendor round trip, then picks a
+    canned sentence from a hash of the audio content.
+    """
+
+    name = 'fake'
+
+    def __init__(self, latency=0.0):
+        self._latency = latency
+
+    async def transcribe(self, audio):
+        audio_bytes = await read_audio(audio)
+        if self._latency:
+            await asyncio.sleep(self._latency)
+        digest = hashlib.sha256(audio_bytes).digest()
+        return FAKE_SENTENCES[digest[0] % len(FAKE_SENTENCES)]
+
+
+def create_transcription_engine(kind, deepgram_api_key=None, deepgram_api_url=None, session_factory=None,
+                                local_model='tiny.en', local_workers=None, fake_latency=0.0):
+    """Build the configured engine ('deepgram', 'local' or 'fake')."""
+    if kind == 'deepgram':
+        return DeepgramEngine(deepgram_api_key, deepgram_api_url, session_factory)
+    if kind == 'local':
+        return LocalEngine(local_model, workers=local_workers)
+    if kind == 'fake':
+        return FakeEngine(latency=fake_latency)
+    raise ValueError(f"Unknown transcription engine: {kind!r}")
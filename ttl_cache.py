@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLDedupeCache:
+    """Thread-safe set of recently seen keys with TTL expiry and an LRU size cap.
+
+    Entries live in an OrderedDict of key -> expiry time. Expiry is always
+    `now + ttl` on a monotonic clock and touched keys move to the end, so the
+    dict stays sorted by expiry: purging only ever looks at the head and each
+    call costs O(1) amortized no matter how many keys are held. Each entry is
+    a single float plus the dict link, so memory per key is fixed.
+    """
+
+    __slots__ = ('_ttl', '_max_size', '_entries', '_lock', '_clock')
+
+    def __init__(self, ttl, max_size, clock=time.monotonic):
+        self._ttl = ttl
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def seen(self, key):
+        """Record `key` and return True if it was already present and unexpired."""
+        entries = self._entries
+        with self._lock:
+            now = self._clock()  # Read under the lock so expiries stay in order
+            self._purge_expired(now)
+            present = key in entries
+            entries[key] = now + self._ttl
+            if present:
+                entries.move_to_end(key)
+            elif len(entries) > self._max_size:
+                entries.popitem(last=False)  # Evict the least recently seen key
+            return present
+
+    def discard(self, key):
+        """Forget `key` so the next `seen(key)` reports it as new."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def purge(self):
+        """Drop every expired key now rather than on the next `seen`."""
+        with self._lock:
+            self._purge_expired(self._clock())
+
+    def _purge_expired(self, now):
+        entries = self._entries
+        while entries:
+            key, expires_at = next(iter(entries.items()))
+            if expires_at > now:
+                break
+            entries.popitem(last=False)
+
+    def __contains__(self, key):
+        with self._lock:
+            expires_at = self._entries.get(key)
+            return expires_at is not None and expires_at > self._clock()
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,163 @@
+import argparse
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import NamedTuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_REFRESH_INTERVAL = 300  # seconds a cached user is trusted before re-reading it
+
+
+class User(NamedTuple):
+    wa_id: str  # WhatsApp ID, the sender's phone number in international format
+    name: str
+    timezone: str  # IANA name, e.g. 'Africa/Lagos'
+    spreadsheet_id: str
+    plan_sheet: str
+    mood_sheet: str
+
+
+def new_user(wa_id, spreadsheet_id, name='', timezone='UTC', plan_sheet=None, mood_sheet=None):
+    """Build a User whose plan and mood sheets are tabs named after their WhatsApp ID."""
+    return User(
+        wa_id=wa_id,
+        name=name,
+        timezone=timezone,
+        spreadsheet_id=spreadsheet_id,
+        plan_sheet=plan_sheet or f"Weekly Plan {wa_id}",
+        mood_sheet=mood_sheet or f"Mood Tracker {wa_id}",
+    )
+
+
+class UserRegistry:
+    """Users of the bot keyed by WhatsApp ID, stored in a SQLite file.
+
+    Each user has their own timezone and plan/mood sheets. Lookups are
+    served from an in-process dict, so they stay O(1) however many users
+    there are. A cached entry is re-read from the database once it is older
+    than `refresh_interval`, so edits made by another process (the CLI
+    below, or another worker) show up without a restart.
+    """
+
+    def __init__(self, path, refresh_interval=DEFAULT_REFRESH_INTERVAL):
+        self._path = path
+        self._refresh_interval = refresh_interval
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._cache = {}  # wa_id -> (User, fetched_at)
+        self._stats = {'hits': 0, 'loads': 0}
+
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS users ('
+            'wa_id TEXT PRIMARY KEY, name TEXT NOT NULL, timezone TEXT NOT NULL, '
+            'spreadsheet_id TEXT NOT NULL, plan_sheet TEXT NOT NULL, mood_sheet TEXT NOT NULL)'
+        )
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self._path, timeout=5, isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def get(self, wa_id):
+        """Return the User for a WhatsApp ID, or None if they are not registered."""
+        now = time.monotonic()
+        cached = self._cache.get(wa_id)
+        if cached is not None and now - cached[1] < self._refresh_interval:
+            self._stats['hits'] += 1
+            return cached[0]
+
+        row = self._connection().execute(
+            'SELECT wa_id, name, timezone, spreadsheet_id, plan_sheet, mood_sheet FROM users WHERE wa_id = ?',
+            (wa_id,)
+        ).fetchone()
+        with self._lock:
+            self._stats['loads'] += 1
+        if row is None:
+            return None  # Not cached, so unknown senders cannot grow the cache
+        user = User(*row)
+        with self._lock:
+            self._cache[wa_id] = (user, now)
+        return user
+
+    def add(self, user):
+        """Register a user, or update them if the WhatsApp ID is already known."""
+        self._connection().execute(
+            'INSERT OR REPLACE INTO users (wa_id, name, timezone, spreadsheet_id, plan_sheet, mood_sheet) '
+            'VALUES (?, ?, ?, ?, ?, ?)',
+            tuple(user)
+        )
+        with self._lock:
+            self._cache[user.wa_id] = (user, time.monotonic())
+        return user
+
+    def remove(self, wa_id):
+        self._connection().execute('DELETE FROM users WHERE wa_id = ?', (wa_id,))
+        with self._lock:
+            self._cache.pop(wa_id, None)
+
+    def all(self):
+        """Every registered user, read fresh from the database."""
+        rows = self._connection().execute(
+            'SELECT wa_id, name, timezone, spreadsheet_id, plan_sheet, mood_sheet FROM users ORDER BY wa_id'
+        ).fetchall()
+        return [User(*row) for row in rows]
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM users').fetchone()[0]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats['cached'] = len(self._cache)
+        stats['users'] = len(self)
+        return stats
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Manage the users the bot talks to.")
+    parser.add_argument('--db', default=os.environ.get('USER_REGISTRY_PATH', 'data/users.db'))
+    commands = parser.add_subparsers(dest='command', required=True)
+    add = commands.add_parser('add', help="register or update a user")
+    add.add_argument('wa_id', help="WhatsApp ID (phone number with country code, digits only)")
+    add.add_argument('--name', default='')
+    add.add_argument('--timezone', default='UTC')
+    add.add_argument('--spreadsheet-id', default=os.environ.get('SHEET_ID'))
+    add.add_argument('--plan-sheet')
+    add.add_argument('--mood-sheet')
+    remove = commands.add_parser('remove', help="unregister a user")
+    remove.add_argument('wa_id')
+    commands.add_parser('list', help="list registered users")
+    args = parser.parse_args()
+
+    registry = UserRegistry(args.db)
+    if args.command == 'add':
+        if not args.spreadsheet_id:
+            parser.error("--spreadsheet-id is required when SHEET_ID is not set")
+        try:
+            ZoneInfo(args.timezone)
+        except (ValueError, ZoneInfoNotFoundError):
+            parser.error(f"Unknown timezone: {args.timezone}")
+        user = registry.add(new_user(
+            args.wa_id, args.spreadsheet_id, name=args.name, timezone=args.timezone,
+            plan_sheet=args.plan_sheet, mood_sheet=args.mood_sheet
+        ))
+        logger.info(f"Registered {user}")
+    elif args.command == 'remove':
+        registry.remove(args.wa_id)
+        logger.info(f"Removed {args.wa_id}")
+    else:
+        for user in registry.all():
+            print('\t'.join(user))
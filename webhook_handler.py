@@ -1,19 +1,37 @@
 from flask import Flask, request, jsonify
-import re
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
 from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
 import pickle
 import os
+import sys
+import hashlib
 import json
 import logging
+import tempfile
 from datetime import datetime, timedelta, timezone
+from zoneinfo import ZoneInfo
 from logging.handlers import RotatingFileHandler
-import requests
-from collections import OrderedDict
 import time
-from deepgram import Deepgram
+import threading
+from async_runner import AsyncLoopRunner
+from transcript_cache import TranscriptCache
+from lexicon import LEXICON
+from transcription import create_transcription_engine
+from message_parser import CheckinReply, StatusItem, StatusUpdate, WeeklyPlan, WEEKDAYS, parse_message
+from mood_analysis import MoodAnalysisPool, analyze_mood_from_text
+from googleapiclient.errors import HttpError
+from sheets_client import SheetsClientHolder, is_sheets_outage
+from dependency_health import Dependency
+from sheets_journal import APPEND, UPDATE, UPDATE_AT, JournalEntry, SheetsWriteJournal, coalesce
+from plan_cache import PlanCache
+from graph_client import GRAPH_POOL_SIZE, GRAPH_READ_TIMEOUT, GraphClient
+from outbound_queue import DeliveryResult, OutboundQueue, THROUGHPUT_TIERS
+from work_queue import WorkQueue
+from pipeline import Pipeline
+from state_store import create_state_backend
+from user_registry import UserRegistry, User, new_user
+from scheduler import build_scheduler
 
 app = Flask(__name__)
 
@@ -25,13 +43,65 @@ if not VERIFY_TOKEN:
     app.logger.error("VERIFY_TOKEN not set in environment variables!")
     VERIFY_TOKEN = "your_verify_token_here"  # fallback for development
 
-# Configure Deepgram
+# Configure transcription: 'deepgram' (hosted), 'local' (offline Whisper) or 'fake' (load tests)
+TRANSCRIPTION_ENGINE = os.environ.get('TRANSCRIPTION_ENGINE', 'deepgram')
 DEEPGRAM_API_KEY = os.environ.get('DEEPGRAM_API_KEY')
-if DEEPGRAM_API_KEY:
-    deepgram = Deepgram(DEEPGRAM_API_KEY)
-    app.logger.info("Deepgram API key configured successfully")
-else:
-    app.logger.error("DEEPGRAM_API_KEY not set in environment variables!")
+DEEPGRAM_API_URL = os.environ.get('DEEPGRAM_API_URL', 'https://api.deepgram.com/v1/listen')
+if TRANSCRIPTION_ENGINE == 'deepgram':
+    if DEEPGRAM_API_KEY:
+        app.logger.info("Deepgram API key configured successfully")
+    else:
+        app.logger.error("DEEPGRAM_API_KEY not set in environment variables!")
+
+# Sheets, Graph and transcription calls each go through a circuit breaker: after
+# BREAKER_FAILURE_THRESHOLD failures in a row they fail fast for BREAKER_RESET_TIMEOUT
+# seconds and the work is queued until the service answers again
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', 30))  # seconds
+
+# Voice notes are transcribed on one long-lived event loop per worker
+TRANSCRIPTION_CONCURRENCY = int(os.environ.get('TRANSCRIPTION_CONCURRENCY', 4))
+TRANSCRIPTION_TIMEOUT = float(os.environ.get('TRANSCRIPTION_TIMEOUT', 60))  # seconds
+TRANSCRIPTION_HEALTH = Dependency(
+    'transcription',
+    timeout=TRANSCRIPTION_TIMEOUT,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_TIMEOUT
+)
+VOICE_LOOP = AsyncLoopRunner('transcription', max_concurrency=TRANSCRIPTION_CONCURRENCY)
+
+TRANSCRIBER = create_transcription_engine(
+    TRANSCRIPTION_ENGINE,
+    deepgram_api_key=DEEPGRAM_API_KEY,
+    deepgram_api_url=DEEPGRAM_API_URL,
+    session_factory=VOICE_LOOP.http_session,
+    local_model=os.environ.get('LOCAL_TRANSCRIPTION_MODEL', 'tiny.en'),
+    local_workers=int(os.environ.get('LOCAL_TRANSCRIPTION_WORKERS', 0)) or None,
+    fake_latency=float(os.environ.get('FAKE_TRANSCRIPTION_LATENCY', 0))
+)
+app.logger.info(f"Transcription engine: {TRANSCRIBER.name}")
+
+# Voice note downloads are streamed and capped in size
+VOICE_NOTE_MAX_BYTES = int(os.environ.get('VOICE_NOTE_MAX_BYTES', 16 * 1024 * 1024))  # WhatsApp's audio limit
+VOICE_NOTE_SPOOL_BYTES = int(os.environ.get('VOICE_NOTE_SPOOL_BYTES', 1024 * 1024))  # Kept in memory below this
+VOICE_NOTE_CHUNK_BYTES = 64 * 1024
+
+# Transcripts and mood analysis of voice notes we have already processed
+TRANSCRIPT_CACHE_PATH = os.environ.get('TRANSCRIPT_CACHE_PATH', 'data/transcripts.db')
+TRANSCRIPT_CACHE_MAX_BYTES = int(os.environ.get('TRANSCRIPT_CACHE_MAX_BYTES', 50 * 1024 * 1024))
+# Cached analyses from another version of the lexicon are recomputed
+TRANSCRIPT_CACHE = TranscriptCache(TRANSCRIPT_CACHE_PATH, max_bytes=TRANSCRIPT_CACHE_MAX_BYTES,
+                                   analysis_version=LEXICON.fingerprint)
+
+# Voice check-ins run as a staged pipeline: fetch -> transcribe -> analyze -> persist -> notify
+VOICE_PIPELINE_QUEUE_SIZE = int(os.environ.get('VOICE_PIPELINE_QUEUE_SIZE', 100))  # Per stage
+VOICE_FETCH_WORKERS = int(os.environ.get('VOICE_FETCH_WORKERS', 4))
+VOICE_ANALYSIS_PROCESSES = int(os.environ.get('VOICE_ANALYSIS_PROCESSES', 1))  # 0 analyzes in-thread
+VOICE_PERSIST_BATCH = int(os.environ.get('VOICE_PERSIST_BATCH', 20))  # Rows per Sheets append
+VOICE_PERSIST_WAIT = float(os.environ.get('VOICE_PERSIST_WAIT', 1.0))  # seconds to wait for a fuller batch
+VOICE_NOTIFY_WORKERS = int(os.environ.get('VOICE_NOTIFY_WORKERS', 2))
+VOICE_SUBMIT_TIMEOUT = float(os.environ.get('VOICE_SUBMIT_TIMEOUT', 30))  # seconds to wait for room in the pipeline
+MOOD_ANALYSIS_POOL = MoodAnalysisPool(VOICE_ANALYSIS_PROCESSES)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -51,6 +121,7 @@ app.logger.info('Webhook startup')
 SCOPES = ['https://www.googleapis.com/auth/spreadsheets']  # Full access to read and write
 SHEET_ID = os.environ.get('SHEET_ID', "1mbO96co-uwzwcpX6UUGnmeZ0-YIl8gan7iA6-2iZ_68")
 SHEET_NAME = "Weekly Plan"
+PLAN_CACHE_TTL = int(os.environ.get('PLAN_CACHE_TTL', 60))  # seconds
 
 # Constants for mood tracking
 MOOD_SHEET_NAME = "Mood Tracker"
@@ -72,6 +143,38 @@ WHATSAPP_TOKEN = os.environ.get('WHATSAPP_TOKEN')
 PHONE_NUMBER_ID = os.environ.get('PHONE_NUMBER_ID')
 RECIPIENT_PHONE_NUMBER = os.environ.get('RECIPIENT_PHONE_NUMBER')
 
+# Outgoing messages are rate limited to the phone number's throughput tier and retried
+WHATSAPP_THROUGHPUT_TIER = os.environ.get('WHATSAPP_THROUGHPUT_TIER', 'standard')
+OUTBOUND_RATE = float(os.environ.get('OUTBOUND_RATE', THROUGHPUT_TIERS[WHATSAPP_THROUGHPUT_TIER]))  # messages/second
+# Messages to different recipients in flight at once; each worker holds one pooled connection
+OUTBOUND_WORKERS = int(os.environ.get('OUTBOUND_WORKERS', 8))
+
+OUTBOUND_QUEUE_SIZE = int(os.environ.get('OUTBOUND_QUEUE_SIZE', 1000))
+OUTBOUND_MAX_ATTEMPTS = int(os.environ.get('OUTBOUND_MAX_ATTEMPTS', 5))
+OUTBOUND_SEND_TIMEOUT = float(os.environ.get('OUTBOUND_SEND_TIMEOUT', 120))  # seconds a caller waits for delivery
+
+# 5xx responses and network errors count against the Graph API breaker; 4xx and 429s do not
+GRAPH_HEALTH = Dependency(
+    'graph',
+    timeout=GRAPH_READ_TIMEOUT,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_TIMEOUT,
+    failed_result=lambda response: response.status_code >= 500
+)
+
+# Shared Graph API client with a pooled keep-alive session, big enough for every outbound worker
+GRAPH_CLIENT = GraphClient(WHATSAPP_TOKEN, PHONE_NUMBER_ID, pool_size=max(GRAPH_POOL_SIZE, OUTBOUND_WORKERS),
+                           dependency=GRAPH_HEALTH)
+
+OUTBOUND_QUEUE = OutboundQueue(
+    GRAPH_CLIENT,
+    workers=OUTBOUND_WORKERS,
+    max_size=OUTBOUND_QUEUE_SIZE,
+    rate=OUTBOUND_RATE,
+    max_attempts=OUTBOUND_MAX_ATTEMPTS,
+    max_wait=OUTBOUND_SEND_TIMEOUT
+)
+
 # Log startup information
 app.logger.info(f"Starting with VERIFY_TOKEN: {VERIFY_TOKEN}")
 app.logger.info("WhatsApp configuration:")
@@ -79,164 +182,328 @@ app.logger.info(f"WHATSAPP_TOKEN set: {bool(WHATSAPP_TOKEN)}")
 app.logger.info(f"PHONE_NUMBER_ID set: {bool(PHONE_NUMBER_ID)}")
 app.logger.info(f"RECIPIENT_PHONE_NUMBER set: {bool(RECIPIENT_PHONE_NUMBER)}")
 
+# Users the bot talks to, keyed by WhatsApp ID, each with their own sheets, timezone and state
+USER_REGISTRY_PATH = os.environ.get('USER_REGISTRY_PATH', 'data/users.db')
+# Register unknown senders with their own tabs in SHEET_ID instead of ignoring them
+AUTO_REGISTER_USERS = os.environ.get('AUTO_REGISTER_USERS', 'false').lower() == 'true'
+USERS = UserRegistry(USER_REGISTRY_PATH)
+
+# The original single user keeps the un-suffixed sheets
+if RECIPIENT_PHONE_NUMBER and USERS.get(RECIPIENT_PHONE_NUMBER) is None:
+    USERS.add(User(
+        wa_id=RECIPIENT_PHONE_NUMBER,
+        name='',
+        timezone=os.environ.get('SCHEDULE_TIMEZONE', 'UTC'),
+        spreadsheet_id=SHEET_ID,
+        plan_sheet=SHEET_NAME,
+        mood_sheet=MOOD_SHEET_NAME
+    ))
+app.logger.info(f"Registered users: {len(USERS)}")
+
+def default_user():
+    """The user behind RECIPIENT_PHONE_NUMBER, used when no user is given."""
+    return USERS.get(RECIPIENT_PHONE_NUMBER) if RECIPIENT_PHONE_NUMBER else None
+
+def user_now(user):
+    """Current time in the user's timezone; every per-user date is taken from this."""
+    return datetime.now(ZoneInfo(user.timezone))
+
+def user_today(user):
+    """Today's date in the user's timezone, as stored in the plan sheet."""
+    return user_now(user).strftime('%Y-%m-%d')
+
 # Define the column headers
 HEADERS = ["Day", "Date", "Task 1", "Task 1 Status", "Task 2", "Task 2 Status", "Task 3", "Task 3 Status"]
 
-# Add a simple message cache to prevent duplicate processing
-# Using OrderedDict as a simple LRU cache
-MESSAGE_CACHE = OrderedDict()
-MESSAGE_CACHE_MAX_SIZE = 100
+def column_letter(index):
+    """Convert a 0-indexed column position to its A1 letter (0 -> A, 26 -> AA)."""
+    letters = ''
+    index += 1
+    while index:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+# Conversation state (processed message IDs, check-ins, daily energy levels)
+# is shared by all workers on the host through the state backend
+STATE_BACKEND = os.environ.get('STATE_BACKEND', 'sqlite')  # 'sqlite' or 'memory'
+STATE_DB_PATH = os.environ.get('STATE_DB_PATH', 'data/state.db')
+MESSAGE_CACHE_MAX_SIZE = int(os.environ.get('MESSAGE_CACHE_MAX_SIZE', 200000))
 MESSAGE_CACHE_TTL = 300  # 5 minutes in seconds
-
-# Add to the constants at the top of the file
-CHECKIN_CACHE = OrderedDict()
 CHECKIN_CACHE_TTL = 300  # 5 minutes
 MORNING_CHECKIN_WINDOW = 300  # 5 minutes window to consider a message as a check-in response
-DAILY_ENERGY_LEVELS = {}  # Store energy levels for the day
+ENERGY_LEVEL_TTL = 2 * 24 * 60 * 60  # Keep daily energy levels for 2 days
+
+STATE = create_state_backend(STATE_BACKEND, STATE_DB_PATH, MESSAGE_CACHE_TTL, MESSAGE_CACHE_MAX_SIZE)
+
+# Webhook events are acknowledged immediately and processed by this pool
+WEBHOOK_WORKERS = int(os.environ.get('WEBHOOK_WORKERS', 4))
+WEBHOOK_QUEUE_SIZE = int(os.environ.get('WEBHOOK_QUEUE_SIZE', 500))
+WEBHOOK_QUEUE = WorkQueue('webhook', workers=WEBHOOK_WORKERS, max_size=WEBHOOK_QUEUE_SIZE)
 
 def is_duplicate_message(message_id):
-    """Check if a message has been recently processed."""
-    current_time = time.time()
-    
-    # Clean old entries
-    for mid, timestamp in list(MESSAGE_CACHE.items()):
-        if current_time - timestamp > MESSAGE_CACHE_TTL:
-            MESSAGE_CACHE.pop(mid)
-    
-    # Check if message is in cache
-    if message_id in MESSAGE_CACHE:
-        return True
-    
-    # Add to cache
-    MESSAGE_CACHE[message_id] = current_time
+    """Check if a message has been recently processed, recording it if not."""
+    return STATE.seen_message(message_id)
+
+def load_google_credentials():
+    """Load Google credentials from the environment or the local credentials file."""
+    # For Railway deployment, use service account credentials from environment variable
+    if os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON'):
+        from google.oauth2 import service_account
+        
+        # Get credentials from environment variable
+        creds_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
+        creds_dict = json.loads(creds_json)
+        
+        # Create credentials from dictionary
+        creds = service_account.Credentials.from_service_account_info(
+            creds_dict,
+            scopes=SCOPES
+        )
+        app.logger.info("Successfully loaded Google credentials from environment variable")
+        return creds
     
-    # Maintain cache size
-    if len(MESSAGE_CACHE) > MESSAGE_CACHE_MAX_SIZE:
-        MESSAGE_CACHE.popitem(last=False)
+    # Local development fallback
+    credentials_file = 'kamsi-200302-89f3b687f719.json'
+    if not os.path.exists(credentials_file):
+        raise FileNotFoundError(
+            f"Credentials file '{credentials_file}' not found and "
+            "GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set. "
+            "Please configure Google credentials properly."
+        )
     
-    return False
+    flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
+    return flow.run_local_server(port=0)
+
+# Sheets requests give up after SHEETS_TIMEOUT; 5xx, 429s and network errors count against the breaker
+SHEETS_TIMEOUT = float(os.environ.get('SHEETS_TIMEOUT', 10))  # seconds
+SHEETS_HEALTH = Dependency(
+    'sheets',
+    timeout=SHEETS_TIMEOUT,
+    failure_threshold=BREAKER_FAILURE_THRESHOLD,
+    reset_timeout=BREAKER_RESET_TIMEOUT,
+    counts_as_failure=is_sheets_outage
+)
+
+# One Sheets client per worker process, reused by every request
+SHEETS_CLIENT = SheetsClientHolder(load_google_credentials, timeout=SHEETS_TIMEOUT, dependency=SHEETS_HEALTH)
 
 def get_google_sheets_service():
-    """Get or create Google Sheets service with proper authentication."""
+    """Get the cached Google Sheets service for this worker."""
     try:
-        # For Railway deployment, use service account credentials from environment variable
-        if os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON'):
-            import json
-            from google.oauth2 import service_account
-            
-            # Get credentials from environment variable
-            creds_json = os.environ.get('GOOGLE_APPLICATION_CREDENTIALS_JSON')
-            creds_dict = json.loads(creds_json)
-            
-            # Create credentials from dictionary
-            creds = service_account.Credentials.from_service_account_info(
-                creds_dict,
-                scopes=SCOPES
-            )
-            app.logger.info("Successfully loaded Google credentials from environment variable")
-        else:
-            # Local development fallback
-            credentials_file = 'kamsi-200302-89f3b687f719.json'
-            if not os.path.exists(credentials_file):
-                raise FileNotFoundError(
-                    f"Credentials file '{credentials_file}' not found and "
-                    "GOOGLE_APPLICATION_CREDENTIALS_JSON environment variable not set. "
-                    "Please configure Google credentials properly."
-                )
-            
-            flow = InstalledAppFlow.from_client_secrets_file(credentials_file, SCOPES)
-            creds = flow.run_local_server(port=0)
-
-        return build('sheets', 'v4', credentials=creds)
+        return SHEETS_CLIENT.get_service()
     except Exception as e:
         app.logger.error(f"Error in get_google_sheets_service: {str(e)}")
         raise
 
-def initialize_sheet_headers(service):
-    """Initialize the sheet with headers if they don't exist."""
-    try:
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=f"{SHEET_NAME}!A1:H1"  # Updated to include all 8 columns
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        if not values or values[0] != HEADERS:
-            body = {
-                'values': [HEADERS]
+def sheet_range(sheet_name, cells):
+    """A1 range on a sheet, quoting the sheet name ("'Weekly Plan 4477'!A:H")."""
+    return "'{}'!{}".format(sheet_name.replace("'", "''"), cells)
+
+def load_weekly_plan(user):
+    """Fetch every row of a user's weekly plan sheet."""
+    service = get_google_sheets_service()
+    result = service.spreadsheets().values().get(
+        spreadsheetId=user.spreadsheet_id,
+        range=sheet_range(user.plan_sheet, 'A:H')  # Get all rows
+    ).execute()
+    return result.get('values', [])
+
+# Cached copy of each user's weekly plan, indexed by date, keyed by (spreadsheet_id, plan_sheet)
+PLAN_CACHES = {}
+PLAN_CACHES_LOCK = threading.Lock()
+
+def plan_cache_for(user):
+    """Get the plan cache for a user's plan sheet, creating it on first use."""
+    key = (user.spreadsheet_id, user.plan_sheet)
+    cache = PLAN_CACHES.get(key)
+    if cache is None:
+        with PLAN_CACHES_LOCK:
+            cache = PLAN_CACHES.get(key)
+            if cache is None:
+                cache = PlanCache(lambda: load_weekly_plan(user), ttl=PLAN_CACHE_TTL)
+                PLAN_CACHES[key] = cache
+    return cache
+
+def sheet_schemas(user):
+    """A user's sheets, with their header row and last column."""
+    return {
+        user.plan_sheet: (HEADERS, 'H'),
+        user.mood_sheet: (MOOD_HEADERS, 'J'),
+    }
+
+# (spreadsheet_id, sheet title) -> sheetId for sheets verified by this worker, filled by ensure_sheet_schema
+SHEET_SCHEMA_STATE = {}
+SHEET_SCHEMA_LOCK = threading.Lock()
+
+def ensure_sheet_schema(service, user, force=False):
+    """Create a user's missing sheets and header rows, once per worker process."""
+    schemas = sheet_schemas(user)
+    keys = [(user.spreadsheet_id, title) for title in schemas]
+    if not force and all(key in SHEET_SCHEMA_STATE for key in keys):
+        return
+    with SHEET_SCHEMA_LOCK:
+        if not force and all(key in SHEET_SCHEMA_STATE for key in keys):
+            return
+        try:
+            for key in keys:
+                SHEET_SCHEMA_STATE.pop(key, None)
+            
+            # Check which sheets exist
+            sheet_metadata = service.spreadsheets().get(
+                spreadsheetId=user.spreadsheet_id,
+                fields='sheets.properties(sheetId,title)'
+            ).execute()
+            existing = {
+                sheet['properties']['title']: sheet['properties'].get('sheetId')
+                for sheet in sheet_metadata.get('sheets', [])
+            }
+            
+            missing = [title for title in schemas if title not in existing]
+            if missing:
+                # Create all missing sheets in one request
+                result = service.spreadsheets().batchUpdate(
+                    spreadsheetId=user.spreadsheet_id,
+                    body={'requests': [{'addSheet': {'properties': {'title': title}}} for title in missing]}
+                ).execute()
+                for reply in result.get('replies', []):
+                    properties = reply.get('addSheet', {}).get('properties', {})
+                    if properties.get('title'):
+                        existing[properties['title']] = properties.get('sheetId')
+                app.logger.info(f"Created new sheets: {', '.join(missing)}")
+            
+            # Check/Set headers for every sheet in one read and at most one write
+            header_ranges = {
+                title: sheet_range(title, f"A1:{last_column}1") for title, (_, last_column) in schemas.items()
             }
-            service.spreadsheets().values().update(
-                spreadsheetId=SHEET_ID,
-                range=f"{SHEET_NAME}!A1:H1",  # Updated to include all 8 columns
-                valueInputOption='RAW',
-                body=body
+            result = service.spreadsheets().values().batchGet(
+                spreadsheetId=user.spreadsheet_id,
+                ranges=list(header_ranges.values())
             ).execute()
-            app.logger.info("Sheet headers initialized successfully")
+            value_ranges = result.get('valueRanges', [])
             
-    except Exception as e:
-        app.logger.error(f"Error initializing headers: {str(e)}")
-        raise
+            stale = []
+            for (title, (headers, _)), value_range in zip(schemas.items(), value_ranges):
+                values = value_range.get('values', [])
+                if not values or values[0] != headers:
+                    stale.append({'range': header_ranges[title], 'values': [headers]})
+            if stale:
+                service.spreadsheets().values().batchUpdate(
+                    spreadsheetId=user.spreadsheet_id,
+                    body={'valueInputOption': 'RAW', 'data': stale}
+                ).execute()
+                app.logger.info(f"Initialized headers for {len(stale)} sheet(s)")
+            
+            for title in schemas:
+                SHEET_SCHEMA_STATE[(user.spreadsheet_id, title)] = existing.get(title)
+        except Exception as e:
+            for key in keys:
+                SHEET_SCHEMA_STATE.pop(key, None)
+            app.logger.error(f"Error initializing sheet schema: {str(e)}")
+            raise
+
+def is_missing_sheet_error(error):
+    """Check whether a Sheets API error means a sheet or range does not exist."""
+    if not isinstance(error, HttpError) or error.resp.status not in (400, 404):
+        return False
+    message = str(error).lower()
+    return 'unable to parse range' in message or 'not found' in message or 'no grid with id' in message
 
-def parse_tasks(message_text):
-    """Parse the tasks from the message text into a structured format."""
+def write_with_schema_retry(service, users, write):
+    """Run a sheet write, re-running the users' schema bootstrap once if a sheet has gone missing."""
     try:
-        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-        tasks = {}
-        
-        # Log the incoming message
-        app.logger.info(f"Parsing message: {message_text}")
-        
-        # Split the message into lines and process each line
-        lines = message_text.strip().split('\n')
-        for line in lines:
-            for day in days:
-                if line.lower().startswith(day.lower()):
-                    # Extract tasks after the colon
-                    tasks_part = line.split(':', 1)[1] if ':' in line else ''
-                    # Split tasks by comma and clean them
-                    day_tasks = [task.strip() for task in tasks_part.split(',') if task.strip()]
-                    tasks[day] = day_tasks
-                    app.logger.debug(f"Parsed tasks for {day}: {day_tasks}")
-                    break
-        
-        if not tasks:
-            app.logger.warning("No tasks were parsed from the message")
-        
-        return tasks
-    except Exception as e:
-        app.logger.error(f"Error parsing tasks: {str(e)}")
-        raise
-
-def get_monday_date():
-    """Get the date of the next or current Monday."""
-    today = datetime.now()
+        return write()
+    except HttpError as e:
+        if not is_missing_sheet_error(e):
+            raise
+        app.logger.warning(f"Sheet write failed with missing sheet/range, re-initializing schema: {str(e)}")
+        for user in users:
+            ensure_sheet_schema(service, user, force=True)
+        return write()
+
+def sheets_unavailable(error):
+    """Whether a Sheets call failed because Sheets is down (breaker open, 5xx, 429, network)."""
+    return SHEETS_HEALTH.outage(error) or is_sheets_outage(error)
+
+def resolve_plan_row(entry, user):
+    """Turn a status update journaled by plan date into an update of that date's row."""
+    date = entry.data['key']
+    found = user and plan_cache_for(user).row_for_date(date)
+    if not found:
+        raise LookupError(f"Could not find row for date {date} in {entry.sheet}")
+    row_number, _ = found
+    cells = {int(column): value for column, value in entry.data['cells'].items()}
+    plan_cache_for(user).apply_cell_updates(row_number, cells)
+    return JournalEntry(entry.id, entry.wa_id, entry.sheet, UPDATE, {'row': row_number, 'cells': cells})
+
+def flush_sheet_writes(spreadsheet_id, entries):
+    """Write a spreadsheet's journaled entries in a single batchUpdate."""
+    service = get_google_sheets_service()
+    # Users still registered; sheets of removed users are written only if their sheetId is known
+    registered = {}
+    for entry in entries:
+        if entry.wa_id and entry.wa_id not in registered:
+            registered[entry.wa_id] = USERS.get(entry.wa_id)
+    users = [user for user in registered.values() if user]
+    
+    # Status updates journaled while Sheets was down name a plan date; find its row now
+    entries = [
+        resolve_plan_row(entry, registered.get(entry.wa_id)) if entry.kind == UPDATE_AT else entry
+        for entry in entries
+    ]
+    
+    # Make sure every sheet written to exists, so its sheetId is known (checked once per worker)
+    for user in users:
+        ensure_sheet_schema(service, user)
+    
+    def write():
+        requests = coalesce(entries, lambda title: SHEET_SCHEMA_STATE[(spreadsheet_id, title)])
+        service.spreadsheets().batchUpdate(
+            spreadsheetId=spreadsheet_id,
+            body={'requests': requests}
+        ).execute()
+        return len(requests)
+    
+    count = write_with_schema_retry(service, users, write)
+    app.logger.info(f"Flushed {len(entries)} journaled write(s) to {spreadsheet_id} as {count} request(s)")
+    
+    # Appended plan rows landed at rows we do not know; reload those plans on next use
+    for user in users:
+        if any(entry.kind == APPEND and entry.sheet == user.plan_sheet for entry in entries):
+            plan_cache_for(user).invalidate()
+
+# Sheets writes are journaled on disk, the user is answered straight away, and a
+# background flusher writes each spreadsheet's pending writes in one batchUpdate
+SHEETS_JOURNAL_PATH = os.environ.get('SHEETS_JOURNAL_PATH', 'data/sheets_journal.db')
+SHEETS_FLUSH_INTERVAL = float(os.environ.get('SHEETS_FLUSH_INTERVAL', 5))  # seconds
+SHEETS_JOURNAL = SheetsWriteJournal(
+    SHEETS_JOURNAL_PATH,
+    flush_sheet_writes,
+    flush_interval=SHEETS_FLUSH_INTERVAL,
+    # Unavailable Sheets (breaker open, 5xx, 429, network) never uses up an entry's attempts
+    is_outage=sheets_unavailable
+)
+
+def get_monday_date(user):
+    """Get the date of the next or current Monday in the user's timezone."""
+    today = user_now(user)
     days_until_monday = (0 - today.weekday()) % 7
     return today + timedelta(days=days_until_monday)
 
-def save_tasks_to_sheets(tasks):
-    """Save the parsed tasks to Google Sheets by appending to existing data."""
+def save_tasks_to_sheets(tasks, user=None):
+    """Save the parsed tasks to the user's plan sheet by appending to existing data.
+    
+    The rows are journaled and appended by the next Sheets flush.
+    """
     try:
-        service = get_google_sheets_service()
-        
-        # Initialize headers if needed
-        initialize_sheet_headers(service)
-        
-        # Get the current sheet data to find the last row
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=f"{SHEET_NAME}!A:H"  # Get all rows
-        ).execute()
-        
-        values = result.get('values', [])
-        next_row = len(values) + 1  # Next available row (1-indexed)
+        user = user or default_user()
         
         # Prepare the data for Google Sheets
-        monday = get_monday_date()
+        monday = get_monday_date(user)
         rows = []
         
         for day, day_tasks in tasks.items():
-            current_date = monday + timedelta(days=['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday'].index(day))
+            current_date = monday + timedelta(days=WEEKDAYS.index(day))
             date_str = current_date.strftime('%Y-%m-%d')
             
             # Create row with tasks and empty status columns
@@ -252,25 +519,10 @@ def save_tasks_to_sheets(tasks):
             rows.append(row)
             app.logger.debug(f"Prepared row for {day}: {row}")
         
-        # Prepare the update
-        body = {
-            'values': rows
-        }
-        
-        # Calculate the range for the new rows
-        start_row = next_row
-        end_row = next_row + len(rows) - 1
-        range_name = f"{SHEET_NAME}!A{start_row}:H{end_row}"
+        # Append the new rows after the last row of the sheet
+        SHEETS_JOURNAL.append_rows(user.spreadsheet_id, user.plan_sheet, rows, user.wa_id)
         
-        # Append the new rows
-        service.spreadsheets().values().update(
-            spreadsheetId=SHEET_ID,
-            range=range_name,
-            valueInputOption='RAW',
-            body=body
-        ).execute()
-        
-        app.logger.info(f"Successfully appended {len(rows)} days of tasks to sheet starting at row {start_row}")
+        app.logger.info(f"Journaled {len(rows)} days of tasks for {user.plan_sheet}")
         return True
     except Exception as e:
         app.logger.error(f"Error saving to sheets: {str(e)}")
@@ -325,109 +577,53 @@ def test_webhook_token():
         'environment': os.environ.get('RAILWAY_ENVIRONMENT', 'development')
     })
 
-def parse_status_update(message_text):
-    """Parse the status update message into a structured format."""
-    try:
-        # Check if this is a status update message
-        if not message_text.strip().startswith('Status Update:'):
-            return None
-            
-        app.logger.info("Parsing status update message")
-        
-        # Split the message into lines and process each line
-        lines = message_text.strip().split('\n')
-        updates = []
-        
-        for line in lines[1:]:  # Skip the "Status Update:" header
-            line = line.strip()
-            if not line:  # Skip empty lines
-                continue
-                
-            # Match the format: "1. Task: [emoji] - note"
-            match = re.match(r'(\d+)\.\s*([^:]+):\s*([✅🟡❌])\s*-?\s*(.*)', line)
-            if match:
-                task_num = int(match.group(1))
-                task = match.group(2).strip()
-                status = match.group(3)
-                note = match.group(4).strip()
-                
-                status_map = {
-                    '✅': 'completed',
-                    '🟡': 'in_progress',
-                    '❌': 'not_done'
-                }
-                
-                updates.append({
-                    'task_num': task_num,
-                    'task': task,
-                    'status': status_map.get(status, 'unknown'),
-                    'note': note
-                })
-                app.logger.debug(f"Parsed status update: {updates[-1]}")
-        
-        return updates if updates else None
-        
-    except Exception as e:
-        app.logger.error(f"Error parsing status update: {str(e)}")
-        return None
-
-def save_status_updates(updates):
-    """Save the status updates to Google Sheets."""
+def save_status_updates(updates, user=None, today=None):
+    """Save the status updates to the user's plan sheet.
+    
+    `today` is the plan date the updates are for; it defaults to the user's today.
+    The cells are journaled and written by the next Sheets flush. If the plan
+    cannot be read because Sheets is down, they are journaled by date and the
+    flush finds the row.
+    """
     try:
         if not updates:
             return False
             
-        service = get_google_sheets_service()
-        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
-        
-        # Get all sheet data
-        range_name = f"{SHEET_NAME}!A:H"  # Get all rows
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=range_name
-        ).execute()
-        
-        values = result.get('values', [])
-        if not values:
-            app.logger.warning('No data found in sheet')
-            return False
-            
-        # Find today's rows and get the most recent one
-        today_rows = [(i, row) for i, row in enumerate(values) if len(row) >= 2 and row[1] == today]
-        if not today_rows:
-            app.logger.error(f"Could not find row for date {today}")
-            return False
-            
-        # Use the most recent row for today
-        row_index, _ = today_rows[-1]
+        user = user or default_user()
+        today = today or user_today(user)
         
         # Update status columns (columns 4, 6, and 8 are status columns)
+        cells = {}
         for update in updates:
-            task_num = update['task_num']
-            status_col = (task_num - 1) * 2 + 3  # Calculate status column
+            status_col = (update.task_num - 1) * 2 + 3  # Calculate status column
             
-            # Ensure row has enough columns
-            while len(values[row_index]) <= status_col:
-                values[row_index].append('')
-                
             # Update status and note
-            status_text = f"{update['status'].upper()}"
-            if update['note']:
-                status_text += f" - {update['note']}"
-            values[row_index][status_col] = status_text
+            status_text = f"{update.status.upper()}"
+            if update.note:
+                status_text += f" - {update.note}"
+            cells[status_col] = status_text
+        
+        # Find the most recent row for today from the cached plan
+        plan_cache = plan_cache_for(user)
+        try:
+            found = plan_cache.row_for_date(today)
+        except Exception as e:
+            if not sheets_unavailable(e):
+                raise
+            app.logger.warning(f"Sheets unavailable, journaling status updates for {today}: {str(e)}")
+            SHEETS_JOURNAL.update_cells_at(user.spreadsheet_id, user.plan_sheet, today, cells, user.wa_id)
+            return True
+        if not found:
+            app.logger.error(f"Could not find row for date {today}")
+            return False
             
-        # Update the sheet with all values
-        body = {
-            'values': values
-        }
-        service.spreadsheets().values().update(
-            spreadsheetId=SHEET_ID,
-            range=range_name,
-            valueInputOption='RAW',
-            body=body
-        ).execute()
+        row_number, _ = found
+        
+        # Journal only the changed status cells
+        SHEETS_JOURNAL.update_cells(user.spreadsheet_id, user.plan_sheet, row_number, cells, user.wa_id)
+        plan_cache.apply_cell_updates(row_number, cells)
         
-        app.logger.info("Status updates saved successfully")
+        app.logger.info(f"Journaled {len(cells)} status update(s) for row {row_number}")
         return True
         
     except Exception as e:
@@ -470,142 +666,64 @@ def trigger_checkin_prompt():
 
 @app.route('/webhook', methods=['POST'])
 def webhook():
-    """Handle incoming webhook requests from WhatsApp."""
+    """Validate incoming webhook requests from WhatsApp and queue them for processing."""
     try:
-        data = request.get_json()
+        data = request.get_json(silent=True)
         app.logger.info(f"Received webhook data: {data}")
         
-        # Extract the message from the WhatsApp webhook payload
-        changes = data.get('entry', [{}])[0].get('changes', [{}])[0]
-        value = changes.get('value', {})
-        message = value.get('messages', [{}])[0] if value.get('messages') else {}
-        
-        if not message:
-            return jsonify({'status': 'success', 'message': 'No message in webhook'}), 200
-        
-        # Check for duplicate message
-        message_id = message.get('id')
-        if message_id and is_duplicate_message(message_id):
-            app.logger.info(f"Skipping duplicate message {message_id}")
+        if not isinstance(data, dict) or not isinstance(data.get('entry'), list):
+            app.logger.warning("Invalid webhook payload received")
             return jsonify({
-                'status': 'success',
-                'message': 'Duplicate message skipped'
-            }), 200
+                'status': 'error',
+                'message': 'Invalid webhook payload'
+            }), 400
         
-        # Handle different message types
-        message_type = message.get('type')
+        queued = duplicates = 0
+        dropped = []
         
-        if message_type == 'text':
-            message_text = message.get('text', {}).get('body', '')
-            app.logger.info(f"Received text message: {message_text}")
-            
-            # Check if this is a morning check-in response
-            if is_morning_checkin_response(message):
-                app.logger.info("Detected morning check-in response")
-                energy_level = detect_energy_level(message_text)
-                app.logger.info(f"Detected energy level: {energy_level}")
+        # A delivery can batch several entries, changes, messages and statuses
+        for entry in data['entry']:
+            for change in entry.get('changes', []):
+                value = change.get('value', {})
                 
-                # Save the energy level for later use
-                save_energy_level(energy_level)
+                for message in value.get('messages', []):
+                    # Check for duplicate message
+                    message_id = message.get('id')
+                    if message_id and is_duplicate_message(message_id):
+                        app.logger.info(f"Skipping duplicate message {message_id}")
+                        duplicates += 1
+                        continue
+                    
+                    # Messages from the same sender are processed in order
+                    if WEBHOOK_QUEUE.submit(process_message, message, key=message.get('from')):
+                        queued += 1
+                    else:
+                        dropped.append(message_id)
                 
-                today_data = get_todays_tasks()
-                if today_data and today_data['tasks']:
-                    response = get_energy_response(energy_level, today_data['tasks'])
-                    if send_message(response):
-                        app.logger.info("Sent energy-based response successfully")
-                        return jsonify({
-                            'status': 'success',
-                            'message': 'Energy response sent'
-                        }), 200
+                for status in value.get('statuses', []):
+                    if WEBHOOK_QUEUE.submit(handle_status_callback, status, key=status.get('recipient_id')):
+                        queued += 1
                     else:
-                        app.logger.error("Failed to send energy-based response")
-                else:
-                    app.logger.info("No tasks found for energy-based response")
-            
-            # Handle other message types as before...
-            if message_text.strip().startswith('status update:'):
-                updates = parse_status_update(message_text)
-                if updates and save_status_updates(updates):
-                    app.logger.info("Status updates saved successfully")
-                    confirmation = "Thanks for the update! I've saved your progress. Keep up the great work! 💪"
-                    if send_message(confirmation):
-                        app.logger.info("Status confirmation sent")
-                    return jsonify({
-                        'status': 'success',
-                        'message': 'Status updates saved successfully'
-                    }), 200
-            
-            # Handle weekly planning
-            tasks = parse_tasks(message_text)
-            if tasks and save_tasks_to_sheets(tasks):
-                app.logger.info("Tasks saved successfully")
-                confirmation_message = "Great job planning your week!✅  I'll remind you about these each morning."
-                if send_message(confirmation_message):
-                    app.logger.info("Confirmation message sent successfully")
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Tasks saved successfully'
-                }), 200
-        
-        # Handle voice messages
-        elif message_type == 'voice':
-            if handle_voice_checkin(message):
-                return jsonify({
-                    'status': 'success',
-                    'message': 'Voice check-in processed successfully'
-                }), 200
-            else:
-                return jsonify({
-                    'status': 'error',
-                    'message': 'Failed to process voice check-in'
-                }), 400
-        
-        # Handle interactive messages (button responses)
-        elif message_type == 'interactive' and message.get('interactive', {}).get('type') == 'button_reply':
-            button_reply = message['interactive']['button_reply']
-            button_id = button_reply.get('id', '')
-            
-            if button_id.startswith('task_'):
-                parts = button_id.split('_')
-                if len(parts) == 3:
-                    task_num = int(parts[1])
-                    status = parts[2]
-                    
-                    status_emoji = {
-                        'complete': '✅',
-                        'progress': '🟡',
-                        'incomplete': '❌'
-                    }.get(status)
-                    
-                    if status_emoji:
-                        today_data = get_todays_tasks()
-                        if today_data and task_num <= len(today_data['tasks']):
-                            task = today_data['tasks'][task_num - 1]
-                            updates = [{
-                                'task_num': task_num,
-                                'task': task,
-                                'status': status,
-                                'note': ''
-                            }]
-                            
-                            if save_status_updates(updates):
-                                confirmation = f"Updated status for Task {task_num} to {status_emoji}"
-                                send_message(confirmation)
-                                return jsonify({
-                                    'status': 'success',
-                                    'message': 'Status update saved'
-                                }), 200
-            
+                        app.logger.warning(f"Dropped status callback for message {status.get('id')}")
+        
+        if dropped:
+            # Let WhatsApp redeliver the batch once we have capacity again;
+            # messages already queued will be skipped as duplicates
+            for message_id in dropped:
+                if message_id:
+                    STATE.forget_message(message_id)
             return jsonify({
                 'status': 'error',
-                'message': 'Invalid button response'
-            }), 400
+                'message': 'Server busy, please retry'
+            }), 503
+        
+        if not queued and not duplicates:
+            return jsonify({'status': 'success', 'message': 'No message in webhook'}), 200
         
-        app.logger.warning("Invalid message format received")
         return jsonify({
-            'status': 'error',
-            'message': 'Invalid message format'
-        }), 400
+            'status': 'success',
+            'message': f"Queued {queued} event(s), skipped {duplicates} duplicate(s)"
+        }), 200
     
     except Exception as e:
         app.logger.error(f"Webhook error: {str(e)}")
@@ -614,11 +732,209 @@ def webhook():
             'message': str(e)
         }), 500
 
+def user_for_message(message):
+    """Look up the registered user who sent a message, registering them if enabled."""
+    wa_id = message.get('from')
+    if not wa_id:
+        return None
+    user = USERS.get(wa_id)
+    if user is None and AUTO_REGISTER_USERS:
+        user = USERS.add(new_user(wa_id, SHEET_ID))
+        app.logger.info(f"Registered new user {wa_id}")
+    return user
+
+def process_message(message):
+    """Run the handler for one incoming WhatsApp message, on behalf of its sender."""
+    message_type = message.get('type')
+    
+    user = user_for_message(message)
+    if user is None:
+        app.logger.warning(f"Ignoring message from unregistered sender {message.get('from')}")
+        return False
+    
+    if message_type == 'text':
+        handled = handle_text_message(message, user)
+    elif message_type == 'voice':
+        handled = handle_voice_checkin(message, user)
+        if not handled:
+            app.logger.error("Failed to process voice check-in")
+    elif message_type == 'interactive' and message.get('interactive', {}).get('type') == 'button_reply':
+        handled = handle_button_reply(message, user)
+        if not handled:
+            app.logger.warning("Invalid button response")
+    else:
+        handled = False
+        app.logger.warning(f"Unsupported message type received: {message_type}")
+    
+    return handled
+
+def handle_status_callback(status):
+    """Log a delivery status callback (sent, delivered, read or failed)."""
+    status_name = status.get('status')
+    if status_name == 'failed':
+        app.logger.warning(f"Message {status.get('id')} to {status.get('recipient_id')} failed: {status.get('errors')}")
+    else:
+        app.logger.info(f"Message {status.get('id')} status: {status_name}")
+    return True
+
+def handle_text_message(message, user):
+    """Handle a text message: morning check-in reply, status update or weekly plan."""
+    message_text = message.get('text', {}).get('body', '')
+    app.logger.info(f"Received text message: {message_text}")
+    
+    # Work out what kind of message this is in one pass
+    parsed = parse_message(message_text)
+    
+    # Check if this is a morning check-in response
+    if is_morning_checkin_response(message, parsed):
+        app.logger.info("Detected morning check-in response")
+        # parse_message already counted every lexicon category of the reply
+        energy_level = detect_energy_level(parsed.counts)
+        app.logger.info(f"Detected energy level: {energy_level}")
+        
+        # Save the energy level for later use
+        save_energy_level(energy_level, user)
+        
+        today_data = get_todays_tasks(user)
+        if today_data and today_data['tasks']:
+            response = get_energy_response(energy_level, today_data['tasks'])
+            if send_message(response, user.wa_id):
+                app.logger.info("Sent energy-based response successfully")
+                return True
+            else:
+                app.logger.error("Failed to send energy-based response")
+        else:
+            app.logger.info("No tasks found for energy-based response")
+    
+    # Handle status updates
+    if isinstance(parsed, StatusUpdate):
+        if save_status_updates(parsed.items, user):
+            app.logger.info("Status updates saved successfully")
+            confirmation = "Thanks for the update! I've saved your progress. Keep up the great work! 💪"
+            if send_message(confirmation, user.wa_id):
+                app.logger.info("Status confirmation sent")
+            return True
+    
+    # Handle weekly planning
+    if isinstance(parsed, WeeklyPlan) and save_tasks_to_sheets(parsed.tasks, user):
+        app.logger.info("Tasks saved successfully")
+        confirmation_message = "Great job planning your week!✅  I'll remind you about these each morning."
+        if send_message(confirmation_message, user.wa_id):
+            app.logger.info("Confirmation message sent successfully")
+        return True
+    
+    app.logger.warning("Invalid message format received")
+    return False
+
+def handle_button_reply(message, user):
+    """Handle a task status button reply."""
+    button_reply = message['interactive']['button_reply']
+    button_id = button_reply.get('id', '')
+    
+    if button_id.startswith('task_'):
+        parts = button_id.split('_')
+        if len(parts) == 3:
+            task_num = int(parts[1])
+            status = parts[2]
+            
+            status_emoji = {
+                'complete': '✅',
+                'progress': '🟡',
+                'incomplete': '❌'
+            }.get(status)
+            
+            if status_emoji:
+                today_data = get_todays_tasks(user)
+                if today_data and task_num <= len(today_data['tasks']):
+                    task = today_data['tasks'][task_num - 1]
+                    updates = [StatusItem(task_num, task, status, '')]
+                    
+                    if save_status_updates(updates, user):
+                        confirmation = f"Updated status for Task {task_num} to {status_emoji}"
+                        send_message(confirmation, user.wa_id)
+                        return True
+    
+    return False
+
+@app.route('/health/deps')
+def health_dependencies():
+    """Latency percentiles and circuit breaker state of the Sheets, Graph and transcription APIs."""
+    dependencies = {
+        dependency.name: dependency.stats() for dependency in (SHEETS_HEALTH, GRAPH_HEALTH, TRANSCRIPTION_HEALTH)
+    }
+    degraded = [name for name, stats in dependencies.items() if stats['state'] != 'closed']
+    return jsonify({
+        'status': 'degraded' if degraded else 'healthy',
+        'degraded': degraded,
+        'dependencies': dependencies,
+        'timestamp': datetime.now(timezone.utc).isoformat()
+    })
+
+@app.route('/debug/work-queue')
+def debug_work_queue():
+    """Debug endpoint to check webhook work queue depth, drops and latency."""
+    return jsonify(WEBHOOK_QUEUE.stats())
+
+@app.route('/debug/sheets-client')
+def debug_sheets_client():
+    """Debug endpoint to confirm the Sheets client is being reused."""
+    return jsonify(SHEETS_CLIENT.stats())
+
+@app.route('/debug/sheets-journal')
+def debug_sheets_journal():
+    """Debug endpoint to check journaled Sheets writes waiting to be flushed."""
+    return jsonify(SHEETS_JOURNAL.stats())
+
+@app.route('/debug/plan-cache')
+def debug_plan_cache():
+    """Debug endpoint to check weekly plan cache usage, per plan sheet."""
+    return jsonify({
+        f"{spreadsheet_id}/{plan_sheet}": cache.stats()
+        for (spreadsheet_id, plan_sheet), cache in list(PLAN_CACHES.items())
+    })
+
+@app.route('/debug/outbound')
+def debug_outbound():
+    """Debug endpoint to check outbound message backlog, retries and throttling."""
+    return jsonify(OUTBOUND_QUEUE.stats())
+
+@app.route('/debug/users')
+def debug_users():
+    """Debug endpoint to check the user registry size and cache hits."""
+    return jsonify(USERS.stats())
+
+@app.route('/debug/scheduler')
+def debug_scheduler():
+    """Debug endpoint to check who the scheduled fan-outs reach and their latest runs."""
+    if SCHEDULER is None:
+        return jsonify({'running': False, 'message': 'The scheduler is not running in this worker'})
+    return jsonify(SCHEDULER.stats())
+
+@app.route('/debug/transcription')
+def debug_transcription():
+    """Debug endpoint to check in-flight and queued voice transcriptions."""
+    return jsonify(VOICE_LOOP.stats())
+
+@app.route('/debug/voice-pipeline')
+def debug_voice_pipeline():
+    """Debug endpoint to check per-stage latency and backlog of the voice pipeline."""
+    return jsonify(VOICE_PIPELINE.stats())
+
+@app.route('/debug/transcript-cache')
+def debug_transcript_cache():
+    """Debug endpoint to check voice transcription cache hits and misses."""
+    return jsonify(TRANSCRIPT_CACHE.stats())
+
 @app.route('/debug/date')
 def debug_date():
-    """Debug endpoint to check date handling."""
+    """Debug endpoint to check date handling, optionally for one user (?wa_id=...)."""
     now = datetime.now(timezone.utc)
+    user = USERS.get(request.args['wa_id']) if 'wa_id' in request.args else default_user()
     return jsonify({
+        'user': user.wa_id if user else None,
+        'user_timezone': user.timezone if user else None,
+        'user_now': user_now(user).isoformat() if user else None,
+        'user_date': user_today(user) if user else None,
         'utc_now': now.isoformat(),
         'utc_date': now.strftime('%Y-%m-%d'),
         'server_now': datetime.now().isoformat(),
@@ -627,37 +943,18 @@ def debug_date():
         'weekday_name': ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'][now.weekday()]
     })
 
-def get_todays_tasks():
-    """Get tasks for today from Google Sheets."""
+def get_todays_tasks(user=None):
+    """Get the user's tasks for today from their plan sheet."""
     try:
-        service = get_google_sheets_service()
-        
-        # Get all sheet data
-        range_name = f"{SHEET_NAME}!A:H"  # Get all rows
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=range_name
-        ).execute()
-        
-        values = result.get('values', [])
-        if not values:
-            app.logger.warning('No data found in sheet')
-            return None
-
-        # Use UTC time
-        today = datetime.now(timezone.utc).strftime('%Y-%m-%d')
+        user = user or default_user()
+        # Use the user's local date, the same one their plan was saved with
+        today = user_today(user)
         app.logger.info(f"Looking for tasks for date: {today}")
         
-        # Log all rows for debugging
-        app.logger.info("Available dates in sheet:")
-        for row in values[1:]:  # Skip header
-            if len(row) >= 2:
-                app.logger.info(f"Date in sheet: {row[1]}")
-        
-        # Find all rows for today and get the most recent one
-        today_rows = [row for row in values[1:] if len(row) >= 2 and row[1] == today]
-        if today_rows:
-            row = today_rows[-1]  # Get the last (most recent) entry for today
+        # Find the most recent row for today from the cached plan
+        found = plan_cache_for(user).row_for_date(today)
+        if found:
+            _, row = found
             day = row[0]  # Day name
             
             # Get all tasks (columns 3, 5, and 7 are task columns)
@@ -683,50 +980,18 @@ def get_todays_tasks():
         app.logger.error(f"Error getting today's tasks: {str(e)}")
         return None
 
-def detect_energy_level(message_text):
-    """Analyze message text to determine energy level."""
-    text = message_text.lower()
-    
-    # High energy indicators
-    high_energy = {
-        'pumped', 'excited', 'ready', 'motivated', 'energized', 'focused', 
-        "let's go", 'feeling great', 'on top of things', 'productive', 
-        'inspired', 'crushing it'
-    }
-    
-    # Neutral energy indicators
-    neutral_energy = {
-        'okay', 'fine', 'alright', 'meh', 'not bad', 'decent', 
-        'hanging in there', 'could be better', 'managing', 'doing my best'
-    }
-    
-    # Low energy indicators
-    low_energy = {
-        'tired', 'exhausted', 'drained', 'burnt out', 'overwhelmed', 
-        'stressed', 'anxious', 'struggling', "can't focus", 'not feeling it',
-        'heavy', 'unmotivated', 'foggy', 'no energy'
-    }
-    
-    # Distress signals
-    distress = {
-        'hopeless', 'defeated', 'stuck', 'numb', "can't do anything",
-        "what's the point", 'done with everything', 'just want to sleep',
-        'empty'
-    }
-    
-    # Count matches in each category
-    words = set(text.split())
-    high_matches = len(words.intersection(high_energy))
-    neutral_matches = len(words.intersection(neutral_energy))
-    low_matches = len(words.intersection(low_energy))
-    distress_matches = len(words.intersection(distress))
+def detect_energy_level(counts):
+    """Work out the energy level of a check-in reply from its LEXICON.counts()."""
+    high = counts['checkin_energy:high']
+    neutral = counts['checkin_energy:neutral']
+    low = counts['checkin_energy:low']
     
     # Determine energy level
-    if distress_matches > 0:
+    if counts['checkin_energy:distress'] > 0:
         return 'distress'
-    elif high_matches > low_matches and high_matches > neutral_matches:
+    elif high > low and high > neutral:
         return 'high'
-    elif low_matches > 0:
+    elif low > 0:
         return 'low'
     else:
         return 'neutral'
@@ -766,20 +1031,35 @@ Your tasks will be here when you're ready. Want to talk about what's on your min
     
     return response
 
-def send_morning_checkin():
+def send_morning_checkin(user=None):
     """Send morning energy check-in message."""
+    user = user or default_user()
     message = """Good morning! 🌅
 
 How are you feeling today? 
 
 Just reply naturally - are you feeling energized, okay, tired, or something else? I'll adjust today's plan based on your energy levels."""
     
-    return send_message(message)
+    return send_message(message, user.wa_id if user else None)
 
-def send_daily_reminder():
-    """Send daily reminder based on tasks from Google Sheets."""
+def run_morning_checkin(user=None):
+    """Send the morning check-in and remember when it went out (cron route and scheduler)."""
+    user = user or default_user()
+    if user is None or not send_morning_checkin(user):
+        return False
+    # Store the message ID in cache to track the response
+    message_id = str(int(time.time()))  # Simple timestamp-based ID
+    STATE.put('checkin', f"{user.wa_id}:{message_id}", time.time(), ttl=CHECKIN_CACHE_TTL)
+    return True
+
+def send_daily_reminder(user=None):
+    """Send daily reminder based on the user's tasks from Google Sheets."""
     try:
         app.logger.info("Starting send_daily_reminder function")
+        user = user or default_user()
+        if user is None:
+            app.logger.error("No user to send the daily reminder to")
+            return False
         
         # Log WhatsApp credentials status
         app.logger.info("Checking WhatsApp credentials:")
@@ -789,7 +1069,7 @@ def send_daily_reminder():
         
         # Get today's tasks
         app.logger.info("Fetching today's tasks...")
-        today_data = get_todays_tasks()
+        today_data = get_todays_tasks(user)
         
         if not today_data:
             app.logger.info("No tasks scheduled for today")
@@ -812,7 +1092,7 @@ def send_daily_reminder():
             
             # Send the message
             app.logger.info("Attempting to send message via WhatsApp...")
-            if send_message(message):
+            if send_message(message, user.wa_id):
                 app.logger.info("Daily reminder sent successfully")
                 return True
             else:
@@ -875,11 +1155,7 @@ def cron_daily_reminder():
         app.logger.info("Proceeding with morning check-in")
         
         # First send the morning check-in
-        if send_morning_checkin():
-            # Store the message ID in cache to track the response
-            message_id = str(int(time.time()))  # Simple timestamp-based ID
-            CHECKIN_CACHE[message_id] = time.time()
-            
+        if run_morning_checkin():
             return jsonify({
                 'status': 'success',
                 'message': 'Morning check-in sent successfully'
@@ -897,51 +1173,58 @@ def cron_daily_reminder():
             'message': str(e)
         }), 500
 
-def send_message(message_text):
-    """Send a message using the WhatsApp API."""
+def outbound_send_timeout():
+    """Seconds a caller waits for delivery: none while the Graph API breaker is open.
+    
+    The message stays queued either way and goes out once the API is back.
+    """
+    return OUTBOUND_SEND_TIMEOUT if GRAPH_HEALTH.available() else 0
+
+def send_message(message_text, recipient=None):
+    """Send a message using the WhatsApp API.
+    
+    `recipient` is a WhatsApp ID; it defaults to RECIPIENT_PHONE_NUMBER.
+    """
     try:
         app.logger.info("Starting send_message function")
+        recipient = recipient or RECIPIENT_PHONE_NUMBER
         
-        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, RECIPIENT_PHONE_NUMBER]):
+        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, recipient]):
             app.logger.error("Missing WhatsApp configuration:")
             app.logger.error(f"WHATSAPP_TOKEN: {'*' * 8 if WHATSAPP_TOKEN else 'MISSING'}")
             app.logger.error(f"PHONE_NUMBER_ID: {PHONE_NUMBER_ID if PHONE_NUMBER_ID else 'MISSING'}")
-            app.logger.error(f"RECIPIENT_PHONE_NUMBER: {RECIPIENT_PHONE_NUMBER if RECIPIENT_PHONE_NUMBER else 'MISSING'}")
+            app.logger.error(f"Recipient: {recipient if recipient else 'MISSING'}")
             return False
 
-        url = f"https://graph.facebook.com/v17.0/{PHONE_NUMBER_ID}/messages"
+        url = GRAPH_CLIENT.messages_url
         app.logger.info(f"Sending to WhatsApp API URL: {url}")
         
-        headers = {
-            "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
         data = {
             "messaging_product": "whatsapp",
-            "to": RECIPIENT_PHONE_NUMBER,
+            "to": recipient,
             "type": "text",
             "text": {"body": message_text}
         }
         
         app.logger.info("Sending request to WhatsApp API with data:")
-        app.logger.info(f"To: {RECIPIENT_PHONE_NUMBER}")
+        app.logger.info(f"To: {recipient}")
         app.logger.info(f"Message length: {len(message_text)} characters")
         
-        response = requests.post(url, headers=headers, json=data)
+        # Queued behind earlier messages to this recipient, rate limited and retried
+        result = OUTBOUND_QUEUE.send(data, timeout=outbound_send_timeout())
         
-        app.logger.info(f"WhatsApp API Response Status: {response.status_code}")
-        app.logger.info(f"WhatsApp API Response: {response.text}")
+        app.logger.info(f"WhatsApp API Response Status: {result.status_code} after {result.attempts} attempt(s)")
+        app.logger.info(f"WhatsApp API Response: {result.response_text}")
         
-        if response.status_code == 200:
+        if result.ok:
             app.logger.info("WhatsApp message sent successfully")
             return True
         else:
-            app.logger.error(f"Failed to send WhatsApp message. Status: {response.status_code}")
-            app.logger.error(f"Error Response: {response.text}")
+            app.logger.error(f"Failed to send WhatsApp message: {result.error}")
+            app.logger.error(f"Error Response: {result.response_text}")
             app.logger.error("Request details:")
             app.logger.error(f"URL: {url}")
-            app.logger.error(f"Headers: Authorization: Bearer [REDACTED], Content-Type: {headers['Content-Type']}")
+            app.logger.error("Headers: Authorization: Bearer [REDACTED], Content-Type: application/json")
             app.logger.error(f"Data: {json.dumps(data)}")
             return False
             
@@ -950,9 +1233,10 @@ def send_message(message_text):
         app.logger.exception("Full traceback:")
         return False
 
-def send_sunday_planning_message():
+def send_sunday_planning_message(user=None):
     """Send the Sunday planning message requesting tasks for the week."""
     try:
+        user = user or default_user()
         message = """🌟 Weekly Planning Time! 
 
 Let's plan your tasks for the upcoming week. Please reply with your tasks in this format:
@@ -963,7 +1247,7 @@ Wednesday: Task 1, Task 2, Task 3
 Thursday: Task 1, Task 2, Task 3
 Friday: Task 1, Task 2, Task 3"""
 
-        if send_message(message):
+        if send_message(message, user.wa_id if user else None):
             app.logger.info("Sunday planning message sent successfully")
             return True
         else:
@@ -1053,56 +1337,76 @@ def cron_sunday_planning():
             'message': str(e)
         }), 500
 
-def send_interactive_message(header_text, body_text, buttons):
-    """Send an interactive message with buttons using the WhatsApp API."""
+def interactive_payload(header_text, body_text, buttons, recipient):
+    """Build the /messages payload for an interactive message with reply buttons."""
+    return {
+        "messaging_product": "whatsapp",
+        "to": recipient,
+        "type": "interactive",
+        "interactive": {
+            "type": "button",
+            "header": {
+                "type": "text",
+                "text": header_text
+            },
+            "body": {
+                "text": body_text
+            },
+            "action": {
+                "buttons": buttons
+            }
+        }
+    }
+
+def send_message_batch(payloads):
+    """Send several /messages payloads at once; return a DeliveryResult per payload, in order.
+    
+    Messages to different recipients go out concurrently over the shared
+    Graph connection pool; messages to the same recipient are sent back to
+    back in the order given. One failed message does not stop the others.
+    """
+    if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID]):
+        app.logger.error("Missing WhatsApp configuration")
+        return [DeliveryResult(False, 0, 0, '', 'WhatsApp configuration missing') for _ in payloads]
+    
+    results = OUTBOUND_QUEUE.send_batch(payloads, timeout=outbound_send_timeout())
+    for payload, result in zip(payloads, results):
+        if not result.ok:
+            app.logger.error(f"Failed to send {payload.get('type')} message to {payload.get('to')} "
+                             f"after {result.attempts} attempt(s): {result.error}")
+    return results
+
+def send_interactive_message(header_text, body_text, buttons, recipient=None):
+    """Send an interactive message with buttons using the WhatsApp API.
+    
+    `recipient` is a WhatsApp ID; it defaults to RECIPIENT_PHONE_NUMBER.
+    """
     try:
         app.logger.info("Attempting to send WhatsApp interactive message")
+        recipient = recipient or RECIPIENT_PHONE_NUMBER
         
-        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, RECIPIENT_PHONE_NUMBER]):
+        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, recipient]):
             app.logger.error("Missing WhatsApp configuration")
             app.logger.error(f"WHATSAPP_TOKEN set: {bool(WHATSAPP_TOKEN)}")
             app.logger.error(f"PHONE_NUMBER_ID set: {bool(PHONE_NUMBER_ID)}")
-            app.logger.error(f"RECIPIENT_PHONE_NUMBER set: {bool(RECIPIENT_PHONE_NUMBER)}")
+            app.logger.error(f"Recipient set: {bool(recipient)}")
             return False
 
-        url = f"https://graph.facebook.com/v17.0/{PHONE_NUMBER_ID}/messages"
-        
-        headers = {
-            "Authorization": f"Bearer {WHATSAPP_TOKEN}",
-            "Content-Type": "application/json"
-        }
-        
-        data = {
-            "messaging_product": "whatsapp",
-            "to": RECIPIENT_PHONE_NUMBER,
-            "type": "interactive",
-            "interactive": {
-                "type": "button",
-                "header": {
-                    "type": "text",
-                    "text": header_text
-                },
-                "body": {
-                    "text": body_text
-                },
-                "action": {
-                    "buttons": buttons
-                }
-            }
-        }
+        data = interactive_payload(header_text, body_text, buttons, recipient)
         
         app.logger.info("Sending request to WhatsApp API")
         app.logger.debug(f"Request data: {json.dumps(data)}")
         
-        response = requests.post(url, headers=headers, json=data)
+        # Queued behind earlier messages to this recipient, rate limited and retried
+        result = OUTBOUND_QUEUE.send(data, timeout=outbound_send_timeout())
         
-        if response.status_code == 200:
+        if result.ok:
             app.logger.info("WhatsApp interactive message sent successfully")
-            app.logger.debug(f"WhatsApp API response: {response.text}")
+            app.logger.debug(f"WhatsApp API response: {result.response_text}")
             return True
         else:
-            app.logger.error(f"Failed to send WhatsApp message. Status: {response.status_code}")
-            app.logger.error(f"Response: {response.text}")
+            app.logger.error(f"Failed to send WhatsApp message after {result.attempts} attempt(s): {result.error}")
+            app.logger.error(f"Response: {result.response_text}")
             return False
             
     except Exception as e:
@@ -1110,15 +1414,17 @@ def send_interactive_message(header_text, body_text, buttons):
         app.logger.exception("Full traceback:")
         return False
 
-def save_energy_level(energy_level):
+def save_energy_level(energy_level, user=None):
     """Save the user's energy level for the day."""
-    today = datetime.now().strftime('%Y-%m-%d')
-    DAILY_ENERGY_LEVELS[today] = energy_level
+    user = user or default_user()
+    today = user_today(user)
+    STATE.put('energy_level', f"{user.wa_id}:{today}", energy_level, ttl=ENERGY_LEVEL_TTL)
 
-def get_todays_energy_level():
+def get_todays_energy_level(user=None):
     """Get the user's energy level for today."""
-    today = datetime.now().strftime('%Y-%m-%d')
-    return DAILY_ENERGY_LEVELS.get(today, 'neutral')  # Default to neutral if not set
+    user = user or default_user()
+    today = user_today(user)
+    return STATE.get('energy_level', f"{user.wa_id}:{today}", 'neutral')  # Default to neutral if not set
 
 @app.route('/send-status-request', methods=['GET', 'POST'])
 def trigger_status_request():
@@ -1150,19 +1456,46 @@ def trigger_status_request():
             'message': str(e)
         }), 500
 
-def send_status_request():
+def task_status_buttons(task_index):
+    """Done / In Progress / Stuck reply buttons for one task, as handled by handle_button_reply."""
+    return [
+        {
+            "type": "reply",
+            "reply": {
+                "id": f"task_{task_index}_complete",
+                "title": "✅ Done"
+            }
+        },
+        {
+            "type": "reply",
+            "reply": {
+                "id": f"task_{task_index}_progress",
+                "title": "🟡 In Progress"
+            }
+        },
+        {
+            "type": "reply",
+            "reply": {
+                "id": f"task_{task_index}_incomplete",
+                "title": "❌ Stuck"
+            }
+        }
+    ]
+
+def send_status_request(user=None):
     """Send end-of-day status request for tasks, adapted to user's energy level."""
     try:
         app.logger.info("Starting send_status_request function")
+        user = user or default_user()
         
         # Check WhatsApp credentials first
-        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, RECIPIENT_PHONE_NUMBER]):
+        if not all([WHATSAPP_TOKEN, PHONE_NUMBER_ID, user]):
             app.logger.error("Missing WhatsApp credentials")
             return False
 
         # Get today's tasks and energy level
-        today_data = get_todays_tasks()
-        energy_level = get_todays_energy_level()
+        today_data = get_todays_tasks(user)
+        energy_level = get_todays_energy_level(user)
         app.logger.info(f"User's energy level today: {energy_level}")
         
         if not today_data:
@@ -1184,7 +1517,7 @@ Remember:
 • Your wellbeing comes first
 • It's okay to take breaks
 • We can look at tasks when you're ready"""
-            return send_message(message)
+            return send_message(message, user.wa_id)
 
         elif energy_level == 'low':
             # Randomly select one task for low energy days
@@ -1195,34 +1528,11 @@ Remember:
             header_text = "Gentle Check-in 💛"
             body_text = f"How's it going with this one task we focused on?\n\n{task}"
             
-            buttons = [
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": f"task_{task_index}_complete",
-                        "title": "✅ Done"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": f"task_{task_index}_progress",
-                        "title": "🟡 In Progress"
-                    }
-                },
-                {
-                    "type": "reply",
-                    "reply": {
-                        "id": f"task_{task_index}_incomplete",
-                        "title": "❌ Stuck"
-                    }
-                }
-            ]
-            
-            return send_interactive_message(header_text, body_text, buttons)
+            return send_interactive_message(header_text, body_text, task_status_buttons(task_index), user.wa_id)
 
         else:  # high or neutral energy
-            # Send one message per task with appropriate tone
+            # One message per task with appropriate tone, all sent as one batch
+            payloads = []
             for i, task in enumerate(tasks, 1):
                 if energy_level == 'high':
                     header_text = f"Task {i} Progress 🌟"
@@ -1230,35 +1540,13 @@ Remember:
                 else:  # neutral
                     header_text = f"Task {i} Check-in"
                     body_text = f"Time for a quick check-in! How's it going with:\n\n{task}"
-                
-                buttons = [
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": f"task_{i}_complete",
-                            "title": "✅ Done"
-                        }
-                    },
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": f"task_{i}_progress",
-                            "title": "🟡 In Progress"
-                        }
-                    },
-                    {
-                        "type": "reply",
-                        "reply": {
-                            "id": f"task_{i}_incomplete",
-                            "title": "❌ Stuck"
-                        }
-                    }
-                ]
-                
-                if not send_interactive_message(header_text, body_text, buttons):
-                    app.logger.error(f"Failed to send status request for task {i}")
-                    return False
-                
+                payloads.append(interactive_payload(header_text, body_text, task_status_buttons(i), user.wa_id))
+            
+            results = send_message_batch(payloads)
+            failed = [i for i, result in enumerate(results, 1) if not result.ok]
+            if failed:
+                app.logger.error(f"Failed to send status request for task(s) {failed} of {len(tasks)}")
+                return False
             app.logger.info("All task status requests sent successfully")
             return True
 
@@ -1267,268 +1555,182 @@ Remember:
         app.logger.exception("Full traceback:")
         return False
 
-def initialize_mood_tracker_sheet(service):
-    """Initialize the mood tracker sheet with headers if it doesn't exist."""
-    try:
-        # Check if the sheet exists
-        sheet_metadata = service.spreadsheets().get(spreadsheetId=SHEET_ID).execute()
-        sheets = sheet_metadata.get('sheets', '')
-        sheet_exists = any(sheet.get("properties", {}).get("title") == MOOD_SHEET_NAME for sheet in sheets)
-        
-        if not sheet_exists:
-            # Create new sheet
-            body = {
-                'requests': [{
-                    'addSheet': {
-                        'properties': {
-                            'title': MOOD_SHEET_NAME
-                        }
-                    }
-                }]
-            }
-            service.spreadsheets().batchUpdate(
-                spreadsheetId=SHEET_ID,
-                body=body
-            ).execute()
-            app.logger.info(f"Created new sheet: {MOOD_SHEET_NAME}")
-        
-        # Check/Set headers
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=f"{MOOD_SHEET_NAME}!A1:J1"
-        ).execute()
-        
-        values = result.get('values', [])
-        
-        if not values or values[0] != MOOD_HEADERS:
-            body = {
-                'values': [MOOD_HEADERS]
-            }
-            service.spreadsheets().values().update(
-                spreadsheetId=SHEET_ID,
-                range=f"{MOOD_SHEET_NAME}!A1:J1",
-                valueInputOption='RAW',
-                body=body
-            ).execute()
-            app.logger.info("Mood tracker sheet headers initialized successfully")
-            
-    except Exception as e:
-        app.logger.error(f"Error initializing mood tracker sheet: {str(e)}")
-        raise
+class VoiceNoteTooLarge(Exception):
+    """Raised when a voice note is bigger than VOICE_NOTE_MAX_BYTES."""
 
 def download_voice_note(media_id):
-    """Download voice note from WhatsApp servers."""
+    """Stream a voice note from WhatsApp servers into a spooled temporary file.
+    
+    Small notes stay in memory, larger ones spill to disk, so memory per note
+    is bounded by VOICE_NOTE_SPOOL_BYTES. Returns (audio_file, sha256 hex digest);
+    the caller must close the file.
+    """
     try:
         # Get media URL
-        url = f"https://graph.facebook.com/v17.0/{media_id}"
-        headers = {"Authorization": f"Bearer {WHATSAPP_TOKEN}"}
-        
-        response = requests.get(url, headers=headers)
+        response = GRAPH_CLIENT.get(GRAPH_CLIENT.media_url(media_id))
         if response.status_code != 200:
             raise Exception(f"Failed to get media URL: {response.text}")
         
-        media_url = response.json().get('url')
+        media = response.json()
+        media_url = media.get('url')
         if not media_url:
             raise Exception("Media URL not found in response")
-        
-        # Download media
-        response = requests.get(media_url, headers=headers)
-        if response.status_code != 200:
-            raise Exception("Failed to download media")
-        
-        return response.content
+        if int(media.get('file_size') or 0) > VOICE_NOTE_MAX_BYTES:
+            raise VoiceNoteTooLarge(f"Voice note is {media['file_size']} bytes, limit is {VOICE_NOTE_MAX_BYTES}")
+        
+        # Download media in chunks, hashing the content as it arrives
+        audio_file = tempfile.SpooledTemporaryFile(max_size=VOICE_NOTE_SPOOL_BYTES)
+        content_hash = hashlib.sha256()
+        try:
+            with GRAPH_CLIENT.get(media_url, stream=True) as response:
+                if response.status_code != 200:
+                    raise Exception("Failed to download media")
+                if int(response.headers.get('Content-Length') or 0) > VOICE_NOTE_MAX_BYTES:
+                    raise VoiceNoteTooLarge(f"Voice note is {response.headers['Content-Length']} bytes, limit is {VOICE_NOTE_MAX_BYTES}")
+                
+                size = 0
+                for chunk in response.iter_content(chunk_size=VOICE_NOTE_CHUNK_BYTES):
+                    size += len(chunk)
+                    if size > VOICE_NOTE_MAX_BYTES:
+                        raise VoiceNoteTooLarge(f"Voice note exceeded {VOICE_NOTE_MAX_BYTES} bytes while downloading")
+                    audio_file.write(chunk)
+                    content_hash.update(chunk)
+            
+            audio_file.seek(0)
+            return audio_file, content_hash.hexdigest()
+        except Exception:
+            audio_file.close()
+            raise
         
     except Exception as e:
         app.logger.error(f"Error downloading voice note: {str(e)}")
         raise
 
 async def transcribe_voice_note(audio_data):
-    """Transcribe voice note using Deepgram."""
+    """Transcribe voice note with the configured transcription engine.
+    
+    `audio_data` may be bytes or a readable file object.
+    """
     try:
-        # Configure transcription options
-        options = {
-            "punctuate": True,
-            "model": "general",
-            "language": "en",
-            "smart_format": True
-        }
-        
-        # Send the audio to Deepgram
-        response = await deepgram.transcription.prerecorded(
-            {"buffer": audio_data, "mimetype": "audio/ogg"},
-            options
-        )
-        
-        # Extract the transcript
-        transcript = response["results"]["channels"][0]["alternatives"][0]["transcript"]
-        
-        return transcript
+        return await TRANSCRIBER.transcribe(audio_data)
         
     except Exception as e:
-        app.logger.error(f"Error transcribing voice note: {str(e)}")
+        app.logger.error(f"Error transcribing voice note with {TRANSCRIBER.name}: {str(e)}")
         raise
 
-def analyze_mood_from_text(text):
-    """Analyze mood and emotions from transcribed text."""
+def mood_row(transcription, analysis, recorded_at):
+    """Build a Mood Tracker row (columns A-J) for one check-in."""
+    return [
+        recorded_at.strftime('%Y-%m-%d'),
+        recorded_at.strftime('%H:%M:%S'),
+        transcription,
+        analysis.get('mood_score', ''),
+        analysis.get('primary_emotion', ''),
+        analysis.get('secondary_emotions', ''),
+        analysis.get('key_topics', ''),
+        analysis.get('energy_level', ''),
+        analysis.get('action_items', ''),
+        analysis.get('follow_up_needed', '')
+    ]
+
+def save_mood_rows(user, rows):
+    """Journal several rows for a user's Mood Tracker, appended by the next Sheets flush."""
+    SHEETS_JOURNAL.append_rows(user.spreadsheet_id, user.mood_sheet, rows, user.wa_id)
+
+def save_mood_data(transcription, analysis, user=None, recorded_at=None):
+    """Save mood tracking data to the user's Mood Tracker.
+    
+    `recorded_at` is when the check-in was made; it defaults to now in the user's timezone.
+    """
     try:
-        # Simple rule-based sentiment analysis
-        # You can make this more sophisticated or integrate with a sentiment analysis service
-        positive_words = {'happy', 'good', 'great', 'awesome', 'excellent', 'excited', 'joy', 'wonderful', 'fantastic'}
-        negative_words = {'sad', 'bad', 'terrible', 'awful', 'worried', 'stressed', 'angry', 'frustrated', 'tired'}
-        energy_words = {
-            'high': {'energetic', 'active', 'motivated', 'excited', 'pumped'},
-            'low': {'tired', 'exhausted', 'drained', 'sleepy', 'lazy'}
-        }
-        
-        words = set(text.lower().split())
-        
-        # Calculate mood score
-        positive_count = len(words.intersection(positive_words))
-        negative_count = len(words.intersection(negative_words))
-        total_sentiment_words = positive_count + negative_count
-        
-        if total_sentiment_words > 0:
-            mood_score = round((positive_count / total_sentiment_words) * 10)
-        else:
-            mood_score = 5  # Neutral score if no sentiment words found
-        
-        # Determine energy level
-        high_energy_count = len(words.intersection(energy_words['high']))
-        low_energy_count = len(words.intersection(energy_words['low']))
-        
-        if high_energy_count > low_energy_count:
-            energy_level = 'High'
-        elif low_energy_count > high_energy_count:
-            energy_level = 'Low'
-        else:
-            energy_level = 'Medium'
-        
-        # Extract potential action items (sentences with action verbs)
-        action_verbs = {'need', 'want', 'going', 'plan', 'will', 'must', 'should'}
-        sentences = text.split('.')
-        action_items = []
-        for sentence in sentences:
-            words = sentence.lower().split()
-            if any(verb in words for verb in action_verbs):
-                action_items.append(sentence.strip())
-        
-        return {
-            'mood_score': mood_score,
-            'primary_emotion': 'Positive' if mood_score > 5 else 'Negative' if mood_score < 5 else 'Neutral',
-            'secondary_emotions': 'Varied',
-            'key_topics': extract_key_topics(text),
-            'energy_level': energy_level,
-            'action_items': '. '.join(action_items) if action_items else '',
-            'follow_up_needed': 'Yes' if action_items else 'No'
-        }
+        user = user or default_user()
+        recorded_at = recorded_at or user_now(user)
+        save_mood_rows(user, [mood_row(transcription, analysis, recorded_at)])
+        app.logger.info("Mood tracking data journaled successfully")
+        return True
         
     except Exception as e:
-        app.logger.error(f"Error analyzing mood: {str(e)}")
-        return {
-            'mood_score': 5,
-            'primary_emotion': 'Neutral',
-            'secondary_emotions': '',
-            'key_topics': '',
-            'energy_level': 'Medium',
-            'action_items': '',
-            'follow_up_needed': 'No'
-        }
+        app.logger.error(f"Error saving mood data: {str(e)}")
+        return False
 
-def extract_key_topics(text):
-    """Extract key topics from text using simple keyword extraction."""
-    # Common topics to look for in check-ins
-    topic_keywords = {
-        'work': {'work', 'project', 'meeting', 'deadline', 'task', 'job', 'client'},
-        'health': {'health', 'exercise', 'workout', 'sleep', 'rest', 'tired', 'energy'},
-        'mood': {'feeling', 'mood', 'emotion', 'stress', 'anxiety', 'happy', 'sad'},
-        'relationships': {'family', 'friend', 'relationship', 'social', 'people', 'team'},
-        'goals': {'goal', 'plan', 'future', 'achieve', 'progress', 'improvement'}
-    }
+def fetch_voice_note(job):
+    """Pipeline stage: find a cached transcript, or download the note for transcription."""
+    media_id = job['media_id']
     
-    words = set(text.lower().split())
-    found_topics = []
+    # Skip the download entirely if we have seen this media ID before
+    cached = TRANSCRIPT_CACHE.get_by_media_id(media_id)
+    if not cached:
+        audio_file, content_hash = download_voice_note(media_id)
+        # Same audio under a new media ID (forwarded or redelivered note)
+        cached = TRANSCRIPT_CACHE.get_by_hash(content_hash)
+        if cached:
+            audio_file.close()
+            TRANSCRIPT_CACHE.link_media(media_id, content_hash)
+        else:
+            TRANSCRIPT_CACHE.record_miss()
+            job['audio_file'] = audio_file
+            job['content_hash'] = content_hash
+            return job
     
-    for topic, keywords in topic_keywords.items():
-        if words.intersection(keywords):
-            found_topics.append(topic)
+    app.logger.info(f"Using cached transcription for voice note {media_id}")
+    job['content_hash'] = cached['content_hash']
+    job['transcription'] = cached['transcript']
+    if cached['analysis'] is not None:
+        job['analysis'] = cached['analysis']
+    return job
+
+def transcribe_voice_job(job):
+    """Pipeline stage: transcribe a downloaded note on the shared event loop.
     
-    return ', '.join(found_topics) if found_topics else 'General check-in'
+    While the transcription breaker is open the job is dropped from the
+    pipeline and resubmitted (downloading the note again) once it recovers.
+    """
+    if 'transcription' in job:
+        return job
+    # VOICE_LOOP.run returns or raises only once the coroutine has stopped
+    # using the file, even on timeout, so it is safe to close it here
+    with job.pop('audio_file') as audio_file:
+        try:
+            job['transcription'] = TRANSCRIPTION_HEALTH.call(
+                VOICE_LOOP.run, transcribe_voice_note, audio_file, timeout=TRANSCRIPTION_TIMEOUT
+            )
+        except Exception as e:
+            if not TRANSCRIPTION_HEALTH.outage(e):
+                raise
+            app.logger.warning(f"Transcription unavailable, queueing voice note {job['media_id']} for later: {str(e)}")
+            resubmit_voice_job({'media_id': job['media_id'], 'user': job['user'], 'received_at': job['received_at']})
+            return None
+    return job
 
-def save_mood_data(transcription, analysis):
-    """Save mood tracking data to Google Sheets."""
-    try:
-        service = get_google_sheets_service()
-        
-        # Initialize sheet if needed
-        initialize_mood_tracker_sheet(service)
-        
-        # Prepare row data
-        now = datetime.now()
-        row = [
-            now.strftime('%Y-%m-%d'),
-            now.strftime('%H:%M:%S'),
-            transcription,
-            analysis.get('mood_score', ''),
-            analysis.get('primary_emotion', ''),
-            analysis.get('secondary_emotions', ''),
-            analysis.get('key_topics', ''),
-            analysis.get('energy_level', ''),
-            analysis.get('action_items', ''),
-            analysis.get('follow_up_needed', '')
-        ]
-        
-        # Get next available row
-        result = service.spreadsheets().values().get(
-            spreadsheetId=SHEET_ID,
-            range=f"{MOOD_SHEET_NAME}!A:J"
-        ).execute()
-        
-        values = result.get('values', [])
-        next_row = len(values) + 1
-        
-        # Update sheet
-        body = {
-            'values': [row]
-        }
-        service.spreadsheets().values().update(
-            spreadsheetId=SHEET_ID,
-            range=f"{MOOD_SHEET_NAME}!A{next_row}:J{next_row}",
-            valueInputOption='RAW',
-            body=body
-        ).execute()
-        
-        app.logger.info("Mood tracking data saved successfully")
-        return True
-        
-    except Exception as e:
-        app.logger.error(f"Error saving mood data: {str(e)}")
-        return False
+def analyze_voice_job(job):
+    """Pipeline stage: score the transcript in the analysis process pool and cache it.
+    
+    A cached analysis is reused only if it was computed with the current lexicon.
+    """
+    if 'analysis' in job:
+        return job
+    job['analysis'] = MOOD_ANALYSIS_POOL.analyze(job['transcription'])
+    TRANSCRIPT_CACHE.put(job['content_hash'], job['media_id'], job['transcription'], job['analysis'])
+    return job
+
+def persist_voice_jobs(jobs):
+    """Pipeline stage: journal a batch of check-ins with one entry per Mood Tracker sheet."""
+    by_sheet = {}
+    for job in jobs:
+        user = job['user']
+        by_sheet.setdefault((user.spreadsheet_id, user.mood_sheet), (user, []))[1].append(job)
+    
+    for user, sheet_jobs in by_sheet.values():
+        save_mood_rows(
+            user, [mood_row(job['transcription'], job['analysis'], job['received_at']) for job in sheet_jobs]
+        )
+        app.logger.info(f"Journaled {len(sheet_jobs)} mood check-in(s) for {user.mood_sheet}")
+    return jobs
 
-def handle_voice_checkin(message):
-    """Handle voice note check-in."""
-    try:
-        # Get voice note media ID
-        media = message.get('voice', {})
-        media_id = media.get('id')
-        
-        if not media_id:
-            app.logger.error("No media ID found in voice message")
-            return False
-        
-        # Download voice note
-        audio_data = download_voice_note(media_id)
-        
-        # Transcribe voice note
-        import asyncio
-        transcription = asyncio.run(transcribe_voice_note(audio_data))
-        
-        # Analyze mood
-        analysis = analyze_mood_from_text(transcription)
-        
-        # Save to sheet
-        if save_mood_data(transcription, analysis):
-            # Send confirmation with mood insights
-            confirmation = f"""Thanks for checking in! 🎯
+def notify_voice_job(job):
+    """Pipeline stage: send the check-in confirmation with mood insights."""
+    analysis = job['analysis']
+    confirmation = f"""Thanks for checking in! 🎯
 
 I heard you and here's what I gathered:
 • Mood: {analysis['mood_score']}/10
@@ -1540,18 +1742,62 @@ I heard you and here's what I gathered:
 {f"I'll make sure to follow up with you on this." if analysis.get('follow_up_needed') == 'Yes' else ''}
 
 Keep taking care of yourself! 🌟"""
-            
-            send_message(confirmation)
-            return True
-            
-        return False
-        
-    except Exception as e:
-        app.logger.error(f"Error handling voice check-in: {str(e)}")
+    
+    send_message(confirmation, job['user'].wa_id)
+    return None
+
+def resubmit_voice_job(job):
+    """Queue a note held back by a transcription outage, to go through the pipeline again once it recovers."""
+    TRANSCRIPTION_HEALTH.defer(submit_deferred_voice_job, job, description=f"voice note {job['media_id']}")
+
+def submit_deferred_voice_job(job):
+    # Waits for room like a new note; a full pipeline keeps the note deferred
+    if not VOICE_PIPELINE.submit(job, timeout=VOICE_SUBMIT_TIMEOUT):
+        resubmit_voice_job(job)
+
+def voice_job_failed(job, error):
+    """Release a failed job's audio file."""
+    audio_file = job.pop('audio_file', None)
+    if audio_file is not None:
+        audio_file.close()
+    app.logger.error(f"Error handling voice check-in {job.get('media_id')}: {str(error)}")
+
+VOICE_PIPELINE = (
+    Pipeline('voice', on_error=voice_job_failed)
+    .add_stage('fetch', fetch_voice_note, workers=VOICE_FETCH_WORKERS, max_size=VOICE_PIPELINE_QUEUE_SIZE)
+    .add_stage('transcribe', transcribe_voice_job, workers=TRANSCRIPTION_CONCURRENCY, max_size=VOICE_PIPELINE_QUEUE_SIZE)
+    .add_stage('analyze', analyze_voice_job, workers=max(1, VOICE_ANALYSIS_PROCESSES), max_size=VOICE_PIPELINE_QUEUE_SIZE)
+    .add_stage('persist', persist_voice_jobs, workers=1, max_size=VOICE_PIPELINE_QUEUE_SIZE,
+               batch_size=VOICE_PERSIST_BATCH, batch_wait=VOICE_PERSIST_WAIT)
+    .add_stage('notify', notify_voice_job, workers=VOICE_NOTIFY_WORKERS, max_size=VOICE_PIPELINE_QUEUE_SIZE)
+)
+
+def handle_voice_checkin(message, user):
+    """Handle a user's voice note check-in by queueing it on the voice pipeline."""
+    # Get voice note media ID
+    media = message.get('voice', {})
+    media_id = media.get('id')
+    
+    if not media_id:
+        app.logger.error("No media ID found in voice message")
         return False
+    
+    # The webhook has already been acknowledged, so WhatsApp will not redeliver
+    # the note: wait for room rather than drop it, which also holds this
+    # sender's webhook worker and pushes back on the webhook queue
+    if VOICE_PIPELINE.submit({'media_id': media_id, 'user': user, 'received_at': user_now(user)},
+                             timeout=VOICE_SUBMIT_TIMEOUT):
+        return True
+    app.logger.error(f"Voice pipeline still full after {VOICE_SUBMIT_TIMEOUT} s, asking {user.wa_id} to resend {media_id}")
+    send_message("Sorry, I couldn't process your voice note right now. Please send it again in a few minutes. 🙏",
+                 user.wa_id)
+    return False
 
-def is_morning_checkin_response(message):
-    """Check if this message is a response to morning check-in."""
+def is_morning_checkin_response(message, parsed=None):
+    """Check if this message is a response to morning check-in.
+    
+    `parsed` is the message's parse_message() result, if already known.
+    """
     try:
         # Get the timestamp of the message
         timestamp = int(message.get('timestamp', 0))
@@ -1563,15 +1809,11 @@ def is_morning_checkin_response(message):
             
         # Check if we received any messages in the last 5 minutes after sending a check-in
         if current_time - timestamp <= MORNING_CHECKIN_WINDOW:
-            # Get the message text
-            message_text = message.get('text', {}).get('body', '').lower()
-            
-            # Check if this looks like a response to "how are you feeling?"
-            feeling_indicators = {'feeling', 'feel', 'am', "i'm", 'im', 'doing', 'okay', 'good', 'great', 'tired', 'exhausted', 'fine'}
-            words = set(message_text.split())
+            if parsed is None:
+                parsed = parse_message(message.get('text', {}).get('body', ''))
             
-            # If there's any overlap between the words and feeling indicators, consider it a check-in response
-            return bool(words.intersection(feeling_indicators))
+            # Free text using a feeling indicator (not a plan or status update) is a check-in response
+            return isinstance(parsed, CheckinReply)
             
         return False
         
@@ -1579,7 +1821,30 @@ def is_morning_checkin_response(message):
         app.logger.error(f"Error checking for morning check-in response: {str(e)}")
         return False
 
+# Recurring messages are sent from the web workers themselves, so they use the
+# same state, energy levels and user registry as the webhook. The run ledger
+# (SCHEDULER_DB_PATH) makes sure each one goes out once across workers.
+RUN_SCHEDULER = os.environ.get('RUN_SCHEDULER', 'true').lower() == 'true'
+SCHEDULER = None
+
+def start_background_services():
+    """Start the serving process's background work.
+    
+    Replays writes left in the Sheets journal by an earlier process and, if
+    RUN_SCHEDULER is on, starts the scheduler. Called by each gunicorn worker
+    (see gunicorn.conf.py) and by `python webhook_handler.py`, never on
+    import, so scripts that import this module send no scheduled messages.
+    """
+    global SCHEDULER
+    SHEETS_JOURNAL.start()
+    if RUN_SCHEDULER:
+        if SCHEDULER is None:
+            SCHEDULER = build_scheduler(sys.modules[__name__])
+        SCHEDULER.start()
+
 if __name__ == '__main__':
+    start_background_services()
+    
     # Get port from environment variable for Railway
     port = int(os.environ.get('PORT', 5000))
     # In production, host should be '0.0.0.0' to accept all incoming connections
@@ -0,0 +1,112 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class WorkQueue:
+    """Bounded queues of jobs run by a fixed pool of daemon worker threads.
+
+    Each worker owns one queue. Jobs submitted with the same `key` always go
+    to the same worker, so they run one at a time in submission order, while
+    jobs with different keys run in parallel. `submit` never blocks: when the
+    target queue is full the job is dropped and counted so the caller can tell
+    the sender to retry. Threads are started lazily (and restarted after a
+    fork) so importing the module is cheap.
+    """
+
+    def __init__(self, name, workers=4, max_size=500):
+        self.name = name
+        self._workers = workers
+        self._max_size = max_size
+        self._lock = threading.Lock()
+        self._queues = []
+        self._threads = []
+        self._next_shard = 0
+        self._pid = None
+        self._stats = {
+            'submitted': 0,
+            'completed': 0,
+            'failed': 0,
+            'dropped': 0,
+            'wait_seconds_total': 0.0,
+            'wait_seconds_max': 0.0,
+            'run_seconds_total': 0.0,
+            'run_seconds_max': 0.0,
+        }
+
+    def submit(self, fn, *args, key=None):
+        """Queue `fn(*args)`; return False if the queue is full.
+
+        Jobs sharing a `key` run sequentially in submission order.
+        """
+        self._ensure_started()
+        with self._lock:
+            if key is None:
+                shard = self._next_shard
+                self._next_shard = (shard + 1) % self._workers
+            else:
+                shard = hash(key) % self._workers
+        try:
+            self._queues[shard].put_nowait((time.monotonic(), fn, args))
+        except queue.Full:
+            with self._lock:
+                self._stats['dropped'] += 1
+            logger.warning("Work queue %s-%d is full, dropping job", self.name, shard)
+            return False
+        with self._lock:
+            self._stats['submitted'] += 1
+        return True
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        finished = stats['completed'] + stats['failed']
+        stats['depth'] = sum(work.qsize() for work in self._queues)
+        stats['max_size'] = self._max_size
+        stats['workers'] = self._workers
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / finished if finished else 0.0
+        stats['run_seconds_avg'] = stats['run_seconds_total'] / finished if finished else 0.0
+        return stats
+
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # Split the overall bound across the per-worker queues
+            shard_size = max(1, self._max_size // self._workers)
+            self._queues = [queue.Queue(maxsize=shard_size) for _ in range(self._workers)]
+            self._threads = [
+                threading.Thread(target=self._run, args=(work,), name=f"{self.name}-{i}", daemon=True)
+                for i, work in enumerate(self._queues)
+            ]
+            for thread in self._threads:
+                thread.start()
+            self._pid = os.getpid()
+            logger.info("Started work queue %s with %d workers", self.name, self._workers)
+
+    def _run(self, work):
+        while True:
+            enqueued_at, fn, args = work.get()
+            started_at = time.monotonic()
+            failed = False
+            try:
+                fn(*args)
+            except Exception:
+                failed = True
+                logger.exception("Job %s failed in work queue %s", getattr(fn, '__name__', fn), self.name)
+            finally:
+                finished_at = time.monotonic()
+                wait, run = started_at - enqueued_at, finished_at - started_at
+                with self._lock:
+                    self._stats['failed' if failed else 'completed'] += 1
+                    self._stats['wait_seconds_total'] += wait
+                    self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], wait)
+                    self._stats['run_seconds_total'] += run
+                    self._stats['run_seconds_max'] = max(self._stats['run_seconds_max'], run)
+                work.task_done()